@@ -0,0 +1,146 @@
+import asyncio
+import traceback
+from typing import Any, List, Optional, Set, Tuple
+
+from pysui.sui.sui_txn import AsyncTransaction
+from pysui.sui.sui_types.scalars import ObjectID, SuiString
+
+from nexus_events.lanes import GAS_BUDGET, SubmissionLane, SubmissionLanes
+
+# (cluster execution ID, sanitized completion, future for the result)
+_Item = Tuple[str, str, asyncio.Future]
+
+
+class CompletionBatcher:
+    """
+    Submits completions for several cluster executions in one programmable
+    transaction block.
+
+    Completions that become ready within `window` seconds of each other are
+    collected, up to `max_batch` of them, and submitted together through one
+    of the submission lanes.
+    A PTB either succeeds or fails as a whole, so when a batch fails it's split
+    in halves which are retried separately, until the bad completion is
+    isolated.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        package_id: str,
+        lanes: SubmissionLanes,
+        window: float = 0.2,
+        max_batch: int = 8,
+    ):
+        if max_batch < 1:
+            raise ValueError("max_batch must be at least 1")
+
+        self.client = client
+        self.package_id = package_id
+        self.lanes = lanes
+        self.window = window
+        self.max_batch = max_batch
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._collector: Optional[asyncio.Task] = None
+        self._batches: Set[asyncio.Task] = set()
+
+    async def start(self):
+        self._collector = asyncio.create_task(self._collect())
+
+    async def stop(self):
+        if self._collector is not None:
+            self._collector.cancel()
+            await asyncio.gather(self._collector, return_exceptions=True)
+        await asyncio.gather(*list(self._batches), return_exceptions=True)
+
+    async def submit(self, cluster_execution_id: str, completion_safe: str) -> Any:
+        """Queues the completion and waits until its batch has been executed."""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((cluster_execution_id, completion_safe, future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        held_back: List[_Item] = []
+
+        while True:
+            batch: List[_Item] = []
+            executions: Set[str] = set()
+            # completions held back from the previous batch go first
+            for item in held_back or [await self._queue.get()]:
+                if item[0] in executions or len(batch) >= self.max_batch:
+                    continue
+                executions.add(item[0])
+                batch.append(item)
+            held_back = [item for item in held_back if item not in batch]
+            deadline = loop.time() + self.window
+
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                # an execution can only take one completion per transaction
+                if item[0] in executions:
+                    held_back.append(item)
+                    continue
+                executions.add(item[0])
+                batch.append(item)
+
+            task = asyncio.create_task(self._submit(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _submit(self, batch: List[_Item]):
+        try:
+            async with self.lanes.lane() as lane:
+                result = await self._execute(batch, lane)
+        except Exception as e:
+            print(f"Error submitting batch of {len(batch)} completions: {e}")
+            traceback.print_exc()
+            result = None
+
+        if result is not None:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_result({"func": result})
+            return
+
+        if len(batch) == 1:
+            _, _, future = batch[0]
+            if not future.done():
+                future.set_result(None)
+            return
+
+        middle = len(batch) // 2
+        print(f"Batch of {len(batch)} completions failed, retrying in halves")
+        await asyncio.gather(self._submit(batch[:middle]), self._submit(batch[middle:]))
+
+    async def _execute(self, batch: List[_Item], lane: SubmissionLane) -> Any:
+        txn = AsyncTransaction(client=self.client)
+        for cluster_execution_id, completion_safe, _ in batch:
+            await txn.move_call(
+                target=f"{self.package_id}::cluster::submit_completion_as_model_owner",
+                arguments=[
+                    ObjectID(cluster_execution_id),
+                    ObjectID(lane.owner_cap),
+                    SuiString(completion_safe),
+                ],
+            )
+
+        print(f"Submitting {len(batch)} completions ...")
+        result = await txn.execute(gas_budget=GAS_BUDGET, use_gas_object=lane.gas_coin)
+        if not result.is_ok():
+            print(f"Completion batch transaction failed: {result.result_string}")
+            return None
+
+        effects = result.result_data.effects
+        if effects.status.status != "success":
+            print(f"Completion batch transaction aborted: {effects.status}")
+            return None
+
+        print(f"{len(batch)} completions created in tx '{effects.transaction_digest}'")
+        return result.result_data
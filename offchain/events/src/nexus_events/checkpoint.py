@@ -0,0 +1,88 @@
+import asyncio
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from pysui.sui.sui_types.collections import EventID
+
+
+class CursorCheckpoint:
+    """
+    Durable record of the last event the listener fully processed.
+
+    The checkpoint is a small JSON file that is rewritten atomically: the new
+    content goes to a temporary file in the same directory which then replaces
+    the old one, so a crash never leaves a half written checkpoint behind.
+
+    A checkpoint is only valid for the package it was written for, a newly
+    published package starts from scratch.
+
+    On the event loop use `save_soon`, which writes in a worker thread and
+    skips cursors that were overtaken by a newer one before they were written.
+    """
+
+    def __init__(self, path: Path, package_id: str):
+        self.path = Path(path)
+        self.package_id = package_id
+        self._latest: Optional[EventID] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    def load(self) -> Optional[EventID]:
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Ignoring unreadable checkpoint {self.path}: {e}")
+            return None
+
+        if data.get("package_id") != self.package_id:
+            print(f"Ignoring checkpoint {self.path} written for another package")
+            return None
+
+        return EventID(data["event_seq"], data["tx_digest"])
+
+    def save(self, cursor: EventID):
+        data = {
+            "package_id": self.package_id,
+            "event_seq": cursor.map["eventSeq"],
+            "tx_digest": cursor.map["txDigest"],
+        }
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def save_soon(self, cursor: EventID):
+        self._latest = cursor
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.ensure_future(self._write())
+
+    async def flush(self):
+        """Waits until the latest cursor passed to `save_soon` is written."""
+        if self._writer is not None:
+            await asyncio.shield(self._writer)
+
+    async def _write(self):
+        while self._latest is not None:
+            cursor, self._latest = self._latest, None
+            try:
+                await asyncio.to_thread(self.save, cursor)
+            except Exception as e:
+                print(f"Cannot write checkpoint {self.path}: {e}")
@@ -0,0 +1,145 @@
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Sequence
+
+
+class CompletionCache:
+    """
+    Completions keyed on `(model_name, prompt_hash, max_tokens, temperature)`,
+    and for streamed completions on what could have cut them short, see `key`.
+
+    Lookups go to an in-memory LRU first and then to an SQLite file on disk.
+    The file is kept under `max_disk_bytes` by evicting the least recently used
+    completions.
+
+    Only requests with temperature 0 are deterministic, so unless
+    `any_temperature` is set the cache doesn't apply to any other request.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path],
+        memory_entries: int = 1024,
+        max_disk_bytes: int = 256 * 1024 * 1024,
+        any_temperature: bool = False,
+    ):
+        self.memory_entries = memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.any_temperature = any_temperature
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+
+        self._db = None
+        self._disk_bytes = 0
+        if path is not None and max_disk_bytes > 0:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                "key TEXT PRIMARY KEY, completion TEXT NOT NULL, "
+                "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS completions_last_used "
+                "ON completions (last_used)"
+            )
+            self._db.commit()
+            (self._disk_bytes,) = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM completions"
+            ).fetchone()
+
+    @staticmethod
+    def key(
+        model_name: str,
+        prompt_hash: str,
+        max_tokens: int,
+        temperature: float,
+        stop: Sequence[str] = (),
+        max_chars: Optional[int] = None,
+    ) -> str:
+        """
+        `stop` and `max_chars` are the stop sequences and character limit the
+        completion was generated with, if any, since they may have cut it short.
+        """
+        key = f"{model_name}|{prompt_hash}|{int(max_tokens)}|{float(temperature):.2f}"
+        if stop or max_chars:
+            key += "|" + json.dumps([sorted(stop), max_chars])
+        return key
+
+    def applies_to(self, temperature: float) -> bool:
+        return self.any_temperature or temperature == 0
+
+    def get(self, key: str) -> Optional[str]:
+        completion = self._memory.get(key)
+        if completion is not None:
+            self._memory.move_to_end(key)
+        elif self._db is not None:
+            row = self._db.execute(
+                "SELECT completion FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                completion = row[0]
+                self._db.execute(
+                    "UPDATE completions SET last_used = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+                self._db.commit()
+                self._remember(key, completion)
+
+        if completion is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return completion
+
+    def put(self, key: str, completion: str):
+        self._remember(key, completion)
+        if self._db is None:
+            return
+
+        size = len(key) + len(completion.encode())
+        if size > self.max_disk_bytes:
+            return
+
+        row = self._db.execute(
+            "SELECT size FROM completions WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None:
+            self._disk_bytes -= row[0]
+        self._db.execute(
+            "INSERT OR REPLACE INTO completions (key, completion, size, last_used) "
+            "VALUES (?, ?, ?, ?)",
+            (key, completion, size, time.time()),
+        )
+        self._disk_bytes += size
+        self._evict()
+        self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _remember(self, key: str, completion: str):
+        self._memory[key] = completion
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        while self._disk_bytes > self.max_disk_bytes:
+            oldest = self._db.execute(
+                "SELECT key, size FROM completions ORDER BY last_used LIMIT 64"
+            ).fetchall()
+            if not oldest:
+                self._disk_bytes = 0
+                return
+            for key, size in oldest:
+                self._db.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self._disk_bytes -= size
+                if self._disk_bytes <= self.max_disk_bytes:
+                    return
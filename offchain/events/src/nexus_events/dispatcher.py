@@ -0,0 +1,173 @@
+import asyncio
+import traceback
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from pysui.sui.sui_types.collections import EventID
+
+
+def event_key(event: Any) -> Tuple[str, str]:
+    """Uniquely identifies an event by its transaction digest and sequence."""
+    return (event.event_id["txDigest"], str(event.event_id["eventSeq"]))
+
+
+def event_cursor(event: Any) -> EventID:
+    """Cursor pointing at the given event, suitable for `get_events`."""
+    return EventID(event.event_id["eventSeq"], event.event_id["txDigest"])
+
+
+class EventDispatcher:
+    """
+    Runs event handlers concurrently on the current event loop.
+
+    At most `max_inflight` handlers run at once, and at most
+    `max_inflight_per_model` of them for any single model.
+    An event waits for its model's slot before taking one of the shared
+    slots, so events piling up for a busy model don't hold up other models.
+    Up to `max_waiting` events, by default `max_inflight`, may wait for their
+    model's slot.
+    `dispatch` blocks while all slots are taken, which throttles whoever is
+    feeding events in.
+    It also awaits `throttle`, if given, before taking a slot, which lets
+    a backed up consumer pause ingestion.
+
+    An event is only ever dispatched once, even if it is delivered again, e.g.
+    both through a push subscription and a backfilling query.
+
+    Events are tracked in the order they were dispatched.
+    The committed cursor only moves past an event once that event and every
+    event dispatched before it have finished, so it is always safe to resume
+    from it.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable[Any]],
+        max_inflight: int,
+        max_inflight_per_model: Optional[int] = None,
+        model_of: Optional[Callable[[Any], str]] = None,
+        on_commit: Optional[Callable[[EventID], Any]] = None,
+        remember: int = 10_000,
+        throttle: Optional[Callable[[], Awaitable[Any]]] = None,
+        max_waiting: Optional[int] = None,
+    ):
+        if max_inflight < 1:
+            raise ValueError("max_inflight must be at least 1")
+        if max_inflight_per_model is not None and max_inflight_per_model < 1:
+            raise ValueError("max_inflight_per_model must be at least 1")
+
+        if max_waiting is None:
+            max_waiting = max_inflight
+        if max_inflight_per_model is None:
+            # nothing waits for a model
+            max_waiting = 0
+
+        self._handler = handler
+        self._slots = asyncio.Semaphore(max_inflight)
+        # dispatched events that haven't finished, running or waiting
+        self._admitted = asyncio.Semaphore(max_inflight + max_waiting)
+        self._max_inflight_per_model = max_inflight_per_model
+        self._model_slots: Dict[str, asyncio.Semaphore] = {}
+        self._model_of = model_of
+        self._on_commit = on_commit
+        self._throttle = throttle
+
+        # event key -> (cursor, finished), in dispatch order
+        self._pending: "OrderedDict[Tuple[str, str], list]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+        # keys of the most recently finished events, for deduplication
+        self._finished_keys: Set[Tuple[str, str]] = set()
+        self._finished_order: deque = deque()
+        self._remember = remember
+        self.committed_cursor: Optional[EventID] = None
+
+    @property
+    def inflight(self) -> int:
+        return len(self._tasks)
+
+    def is_known(self, event: Any) -> bool:
+        key = event_key(event)
+        return key in self._pending or key in self._finished_keys
+
+    async def dispatch(self, event: Any) -> bool:
+        """
+        Schedules the handler for the event, waiting for a free slot first.
+
+        Returns False if the event has already been dispatched.
+        """
+        if self.is_known(event):
+            return False
+
+        if self._throttle is not None:
+            await self._throttle()
+        await self._admitted.acquire()
+        key = event_key(event)
+        if key in self._pending or key in self._finished_keys:
+            # dispatched by someone else while we were waiting for a slot
+            self._admitted.release()
+            return False
+
+        self._pending[key] = [event_cursor(event), False]
+        task = asyncio.create_task(self._run(key, event))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def drain(self):
+        """Waits until every dispatched handler has finished."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def _run(self, key: Tuple[str, str], event: Any):
+        try:
+            model_slots = self._model_slots_for(event)
+            if model_slots is None:
+                async with self._slots:
+                    await self._handler(event)
+            else:
+                # the model's slot first, waiting for it mustn't take a shared one
+                async with model_slots, self._slots:
+                    await self._handler(event)
+        except asyncio.CancelledError:
+            # never finished, the event must be handled again after a restart
+            self._admitted.release()
+            raise
+        except Exception as e:
+            print(f"Error handling event {key}: {e}")
+            traceback.print_exc()
+        self._admitted.release()
+        self._finish(key)
+
+    def _model_slots_for(self, event: Any) -> Optional[asyncio.Semaphore]:
+        if self._max_inflight_per_model is None or self._model_of is None:
+            return None
+
+        try:
+            model = self._model_of(event)
+        except Exception:
+            model = ""
+
+        if model not in self._model_slots:
+            self._model_slots[model] = asyncio.Semaphore(self._max_inflight_per_model)
+        return self._model_slots[model]
+
+    def _finish(self, key: Tuple[str, str]):
+        self._pending[key][1] = True
+
+        self._finished_keys.add(key)
+        self._finished_order.append(key)
+        if len(self._finished_order) > self._remember:
+            self._finished_keys.discard(self._finished_order.popleft())
+
+        committed = None
+        while self._pending:
+            oldest_key, (cursor, finished) = next(iter(self._pending.items()))
+            if not finished:
+                break
+            self._pending.pop(oldest_key)
+            committed = cursor
+
+        if committed is not None:
+            self.committed_cursor = committed
+            if self._on_commit is not None:
+                self._on_commit(committed)
@@ -0,0 +1,282 @@
+import asyncio
+import traceback
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+from pysui.sui.sui_txn import AsyncTransaction
+from pysui.sui.sui_types.scalars import ObjectID
+
+# Equal to 1 SUI, the budget every completion submission is executed with.
+GAS_BUDGET = 1000000000
+
+
+@dataclass
+class SubmissionLane:
+    """
+    The owned objects a single submission transaction needs.
+
+    `gas_coin` is None when the transaction may pick any gas coin.
+    """
+
+    owner_cap: str
+    gas_coin: Optional[str] = None
+    needs_top_up: bool = field(default=False, compare=False)
+
+
+class SubmissionLanes:
+    """
+    Lets several completions be submitted in parallel without fighting over
+    owned objects.
+
+    Every owned object can only be used by one in-flight transaction at a
+    time, otherwise Sui rejects the transactions for equivocation.
+    This includes both the gas coin and the `ModelOwnerCap`, even though the
+    latter is only borrowed immutably.
+    Each lane therefore has its own gas coin split from the account's largest
+    coin (the reserve) and, with `clone_owner_caps`, its own owner cap created
+    with `model::clone_owner_cap`. By default caps are cloned whenever there
+    is more than one lane.
+    Lanes that share an owner cap take turns, so without clones submissions
+    still run one at a time.
+
+    In the background, lane coins that are running low are topped up from the
+    reserve.
+
+    With a single lane nothing is prepared, submissions simply run one after
+    another with the original owner cap.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        package_id: str,
+        model_owner_cap_id: str,
+        lanes: int = 1,
+        clone_owner_caps: Optional[bool] = None,
+        lane_balance: int = 2 * GAS_BUDGET,
+        replenish_interval: float = 60.0,
+    ):
+        if lanes < 1:
+            raise ValueError("There must be at least one submission lane")
+
+        self.client = client
+        self.package_id = package_id
+        self.model_owner_cap_id = model_owner_cap_id
+        self.lane_count = lanes
+        if clone_owner_caps is None:
+            clone_owner_caps = lanes > 1
+        self.clone_owner_caps = clone_owner_caps
+        self.lane_balance = lane_balance
+        self.replenish_interval = replenish_interval
+
+        self.lanes: List[SubmissionLane] = []
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._cap_locks: Dict[str, asyncio.Lock] = {}
+        self._reserve_lock = asyncio.Lock()
+        self._reserve_coin: Optional[str] = None
+        self._replenisher: Optional[asyncio.Task] = None
+        self._top_ups: Set[asyncio.Task] = set()
+
+    async def start(self):
+        if self.lane_count == 1:
+            self.lanes = [SubmissionLane(owner_cap=self.model_owner_cap_id)]
+        else:
+            if not self.clone_owner_caps:
+                print(
+                    f"Warning: the {self.lane_count} submission lanes share the "
+                    "model owner cap, so they submit one at a time"
+                )
+            self.lanes = await self._prepare()
+            self._replenisher = asyncio.create_task(self._replenish())
+
+        for lane in self.lanes:
+            self._cap_locks.setdefault(lane.owner_cap, asyncio.Lock())
+            self._idle.put_nowait(lane)
+        print(f"Submitting completions through {len(self.lanes)} lane(s)")
+
+    async def stop(self):
+        if self._replenisher is not None:
+            self._replenisher.cancel()
+            await asyncio.gather(self._replenisher, return_exceptions=True)
+
+    @asynccontextmanager
+    async def lane(self) -> AsyncIterator[SubmissionLane]:
+        """Waits for an idle lane and holds it for one submission."""
+        lane = await self._idle.get()
+        try:
+            async with self._cap_locks[lane.owner_cap]:
+                yield lane
+        finally:
+            if lane.needs_top_up:
+                task = asyncio.create_task(self._top_up_and_release(lane))
+                self._top_ups.add(task)
+                task.add_done_callback(self._top_ups.discard)
+            else:
+                self._idle.put_nowait(lane)
+
+    # === Preparation ===
+
+    async def _prepare(self) -> List[SubmissionLane]:
+        coins = await self._prepare_gas_coins()
+        caps = [self.model_owner_cap_id]
+        if self.clone_owner_caps:
+            caps = await self._prepare_owner_caps(len(coins))
+
+        return [
+            SubmissionLane(owner_cap=caps[i % len(caps)], gas_coin=coin)
+            for i, coin in enumerate(coins)
+        ]
+
+    async def _gas_coins(self) -> List[Any]:
+        result = await self.client.get_gas(fetch_all=True)
+        if result.is_err():
+            raise Exception(f"Cannot read gas coins: {result.result_string}")
+        return sorted(
+            result.result_data.data, key=lambda c: int(c.balance), reverse=True
+        )
+
+    async def _prepare_gas_coins(self) -> List[str]:
+        coins = await self._gas_coins()
+        if not coins:
+            raise Exception("The account has no gas coins")
+
+        self._reserve_coin = coins[0].coin_object_id
+        lane_coins = [
+            c.coin_object_id for c in coins[1:] if int(c.balance) >= self.lane_balance
+        ][: self.lane_count]
+
+        missing = self.lane_count - len(lane_coins)
+        # keep enough in the reserve to pay for the split itself
+        affordable = (int(coins[0].balance) - GAS_BUDGET) // self.lane_balance
+        to_split = max(0, min(missing, affordable))
+        if to_split < missing:
+            print(
+                f"Reserve coin can only fund {len(lane_coins) + to_split} "
+                f"of {self.lane_count} submission lanes"
+            )
+
+        if to_split:
+            txn = AsyncTransaction(client=self.client)
+            parts = await txn.split_coin(
+                coin=txn.gas, amounts=[self.lane_balance] * to_split
+            )
+            await txn.transfer_objects(
+                transfers=parts if isinstance(parts, list) else [parts],
+                recipient=self.client.config.active_address,
+            )
+            result = await txn.execute(
+                gas_budget=GAS_BUDGET, use_gas_object=self._reserve_coin
+            )
+            if not result.is_ok():
+                raise Exception(f"Cannot split gas coins: {result.result_string}")
+
+            taken = set(lane_coins) | {self._reserve_coin}
+            lane_coins += [
+                c.coin_object_id
+                for c in await self._gas_coins()
+                if c.coin_object_id not in taken and int(c.balance) >= self.lane_balance
+            ][:to_split]
+
+        if not lane_coins:
+            raise Exception("Not enough gas to fund any submission lane")
+        return lane_coins
+
+    async def _owned_owner_caps(self, model_id: str) -> List[str]:
+        result = await self.client.get_objects(fetch_all=True)
+        if result.is_err():
+            raise Exception(f"Cannot read owned objects: {result.result_string}")
+
+        caps = []
+        for obj in result.result_data.data:
+            if not str(obj.object_type).endswith("::model::ModelOwnerCap"):
+                continue
+            fields = getattr(obj.content, "fields", None) or {}
+            if fields.get("model") == model_id:
+                caps.append(obj.object_id)
+        return caps
+
+    async def _prepare_owner_caps(self, count: int) -> List[str]:
+        result = await self.client.get_object(ObjectID(self.model_owner_cap_id))
+        if result.is_err():
+            raise Exception(f"Cannot read owner cap: {result.result_string}")
+        model_id = result.result_data.content.fields["model"]
+
+        caps = [self.model_owner_cap_id] + [
+            cap
+            for cap in await self._owned_owner_caps(model_id)
+            if cap != self.model_owner_cap_id
+        ]
+        missing = count - len(caps)
+        if missing > 0:
+            print(f"Cloning {missing} model owner cap(s)")
+            txn = AsyncTransaction(client=self.client)
+            clones = [
+                await txn.move_call(
+                    target=f"{self.package_id}::model::clone_owner_cap",
+                    arguments=[ObjectID(self.model_owner_cap_id)],
+                )
+                for _ in range(missing)
+            ]
+            await txn.transfer_objects(
+                transfers=clones, recipient=self.client.config.active_address
+            )
+            result = await txn.execute(
+                gas_budget=GAS_BUDGET, use_gas_object=self._reserve_coin
+            )
+            if not result.is_ok():
+                raise Exception(f"Cannot clone owner caps: {result.result_string}")
+
+            caps = [self.model_owner_cap_id] + [
+                cap
+                for cap in await self._owned_owner_caps(model_id)
+                if cap != self.model_owner_cap_id
+            ]
+
+        return caps[:count]
+
+    # === Replenishing ===
+
+    async def _replenish(self):
+        """Periodically flags lanes whose gas coin is running low."""
+        while True:
+            await asyncio.sleep(self.replenish_interval)
+            try:
+                balances = {
+                    c.coin_object_id: int(c.balance) for c in await self._gas_coins()
+                }
+                for lane in self.lanes:
+                    if balances.get(lane.gas_coin, 0) < self.lane_balance // 2:
+                        lane.needs_top_up = True
+            except Exception as e:
+                print(f"Error checking submission lane balances: {e}")
+
+    async def _top_up_and_release(self, lane: SubmissionLane):
+        try:
+            async with self._reserve_lock:
+                await self._top_up(lane)
+            lane.needs_top_up = False
+        except Exception as e:
+            print(f"Error topping up gas coin {lane.gas_coin}: {e}")
+            traceback.print_exc()
+        finally:
+            self._idle.put_nowait(lane)
+
+    async def _top_up(self, lane: SubmissionLane):
+        balance = 0
+        for coin in await self._gas_coins():
+            if coin.coin_object_id == lane.gas_coin:
+                balance = int(coin.balance)
+        amount = self.lane_balance - balance
+        if amount <= 0:
+            return
+
+        txn = AsyncTransaction(client=self.client)
+        part = await txn.split_coin(coin=txn.gas, amounts=[amount])
+        await txn.merge_coins(merge_to=ObjectID(lane.gas_coin), merge_from=[part])
+        result = await txn.execute(
+            gas_budget=GAS_BUDGET, use_gas_object=self._reserve_coin
+        )
+        if not result.is_ok():
+            raise Exception(result.result_string)
+        print(f"Topped up gas coin {lane.gas_coin} by {amount} MIST")
@@ -1,10 +1,17 @@
+import aiohttp
+import json
 import requests
 import os
+import time
+from typing import Callable, Optional, Sequence
 from dotenv import load_dotenv
 
 load_dotenv()
 
 LLM_ASSISTANT_URL = os.getenv("LLM_ASSISTANT_URL", "http://localhost:8080/predict")
+LLM_ASSISTANT_STREAM_URL = os.getenv(
+    "LLM_ASSISTANT_STREAM_URL", LLM_ASSISTANT_URL.rstrip("/") + "/stream"
+)
 
 
 class OffChain:
@@ -35,6 +42,165 @@ class OffChain:
             print(msg)
             raise Exception(status_code=500, detail=msg)
 
+    async def aprocess(
+        self,
+        prompt: str,
+        model_name: str,
+        max_tokens: int,
+        temperature: float,
+        session: aiohttp.ClientSession = None,
+    ) -> str:
+        """
+        Like `process`, but doesn't block the event loop.
+
+        Pass a long lived `session` to reuse its connections.
+        Cancelling the coroutine aborts the request.
+        """
+        if session is None:
+            async with aiohttp.ClientSession() as session:
+                return await self.aprocess(
+                    prompt, model_name, max_tokens, temperature, session=session
+                )
+
+        url = LLM_ASSISTANT_URL
+        headers = {"Content-Type": "application/json"}
+        prompt_data = {
+            "prompt": prompt,
+            "model": model_name,
+            "max_tokens": int(max_tokens),
+            "temperature": temperature,
+        }
+
+        # generations can take arbitrarily long, don't time out
+        timeout = aiohttp.ClientTimeout(total=None)
+        async with session.post(
+            url, headers=headers, json=prompt_data, timeout=timeout
+        ) as response:
+            if response.status >= 400:
+                msg = f"Error occurred while calling the API: {response.status}"
+                msg += f"\nResponse content: {await response.text()}"
+                print(msg)
+                raise Exception(msg)
+            result = await response.json()
+            return result["completion"]
+
+    async def astream(
+        self,
+        prompt: str,
+        model_name: str,
+        max_tokens: int,
+        temperature: float,
+        session: aiohttp.ClientSession = None,
+        sanitize: Optional[Callable[[str], str]] = None,
+        stop: Sequence[str] = (),
+        max_chars: Optional[int] = None,
+    ) -> str:
+        """
+        Like `aprocess`, but reads the completion from the streaming endpoint
+        as it's generated.
+
+        Every piece of the completion goes through `sanitize` as it arrives.
+        Generation stops early once the completion contains one of the `stop`
+        sequences, which is cut off, or reaches `max_chars` characters.
+
+        Returns the completion in the same format as `aprocess`.
+        """
+        if session is None:
+            async with aiohttp.ClientSession() as session:
+                return await self.astream(
+                    prompt,
+                    model_name,
+                    max_tokens,
+                    temperature,
+                    session=session,
+                    sanitize=sanitize,
+                    stop=stop,
+                    max_chars=max_chars,
+                )
+
+        url = LLM_ASSISTANT_STREAM_URL
+        headers = {"Content-Type": "application/json"}
+        prompt_data = {
+            "prompt": prompt,
+            "model": model_name,
+            "max_tokens": int(max_tokens),
+            "temperature": temperature,
+        }
+        stop = [s for s in stop if s]
+        longest_stop = max((len(s) for s in stop), default=0)
+
+        started = time.monotonic()
+        first_token = None
+        chunk_count = 0
+        server_stats = {}
+        text = ""
+        stopped_early = False
+
+        # generations can take arbitrarily long, don't time out
+        timeout = aiohttp.ClientTimeout(total=None)
+        async with session.post(
+            url, headers=headers, json=prompt_data, timeout=timeout
+        ) as response:
+            if response.status >= 400:
+                msg = f"Error occurred while calling the API: {response.status}"
+                msg += f"\nResponse content: {await response.text()}"
+                print(msg)
+                raise Exception(msg)
+
+            # leaving the block early closes the connection, which stops
+            # the generation
+            async for line in response.content:
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise Exception(f"Generation failed: {chunk['error']}")
+                if chunk.get("done"):
+                    server_stats = chunk
+                    break
+
+                content = chunk.get("content") or ""
+                if sanitize is not None:
+                    content = sanitize(content)
+                if not content:
+                    continue
+                chunk_count += 1
+                if first_token is None:
+                    first_token = time.monotonic()
+
+                # a stop sequence may span several chunks
+                search_from = max(0, len(text) - longest_stop + 1)
+                text += content
+                stop_at = [
+                    i for i in (text.find(s, search_from) for s in stop) if i >= 0
+                ]
+                if stop_at:
+                    text = text[: min(stop_at)]
+                    stopped_early = True
+                    break
+                if max_chars is not None and len(text) >= max_chars:
+                    text = text[:max_chars]
+                    stopped_early = True
+                    break
+
+        now = time.monotonic()
+        first_token = first_token or now
+        seconds = now - first_token
+        print(
+            f"Completion streamed: {chunk_count} chunks, "
+            f"time to first token {first_token - started:.2f}s, "
+            f"{chunk_count / seconds if seconds > 0 else 0.0:.1f} tokens/s"
+            + (" (stopped early)" if stopped_early else "")
+        )
+        if server_stats:
+            print(
+                f"Generation on the server: "
+                f"time to first token {server_stats.get('time_to_first_token', 0):.2f}s, "
+                f"{server_stats.get('tokens_per_second', 0):.1f} tokens/s"
+            )
+
+        return json.dumps({"message": {"role": "assistant", "content": text}})
+
 
 def main():
 
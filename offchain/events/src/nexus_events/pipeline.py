@@ -0,0 +1,190 @@
+import asyncio
+import traceback
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+# (item, when it was queued, future for the pipeline's result)
+_Entry = Tuple[Any, float, asyncio.Future]
+
+
+class Stage:
+    """
+    One step of a `Pipeline`: a bounded queue drained by `workers` workers.
+
+    `work` takes the item handed over by the previous stage and returns the
+    item for the next one, or None if there's nothing left to do for it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        work: Callable[[Any], Awaitable[Any]],
+        workers: int = 1,
+        queue_size: int = 16,
+    ):
+        if workers < 1:
+            raise ValueError(f"Stage {name} needs at least one worker")
+        if queue_size < 1:
+            raise ValueError(f"Stage {name} needs a queue size of at least 1")
+
+        self.name = name
+        self.work = work
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._room = asyncio.Event()
+
+        self.busy = 0
+        self.processed = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    async def wait_for_room(self):
+        """Waits until the queue can take another item without blocking."""
+        while self.queue.full():
+            self._room.clear()
+            await self._room.wait()
+
+    def stats(self) -> Dict[str, Any]:
+        finished = self.processed + self.failed
+        return {
+            "depth": self.depth,
+            "queue_size": self.queue.maxsize,
+            "busy": self.busy,
+            "workers": self.workers,
+            "processed": self.processed,
+            "failed": self.failed,
+            "avg_wait": self.total_wait / finished if finished else 0.0,
+            "avg_latency": self.total_latency / finished if finished else 0.0,
+            "max_latency": self.max_latency,
+        }
+
+    async def _get(self) -> _Entry:
+        entry = await self.queue.get()
+        self._room.set()
+        return entry
+
+
+class Pipeline:
+    """
+    Runs items through a sequence of stages, each with its own workers.
+
+    Stages work on different items at the same time, e.g. while one request
+    is being generated the next one's tool is called and the previous one's
+    completion is submitted.
+    A worker that finished an item waits until the next stage's queue has
+    room for it, so a slow stage eventually holds back every stage before it
+    instead of letting its queue grow without bound.
+
+    Every stage counts the items it processed and failed, and how long they
+    waited in its queue and took to process.
+    """
+
+    def __init__(self, stages: List[Stage], report_interval: float = 0):
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage")
+
+        self.stages = stages
+        self.report_interval = report_interval
+        self._workers: Set[asyncio.Task] = set()
+
+    def stage(self, name: str) -> Stage:
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        raise KeyError(name)
+
+    async def start(self):
+        for i, stage in enumerate(self.stages):
+            next_stage = self.stages[i + 1] if i + 1 < len(self.stages) else None
+            for _ in range(stage.workers):
+                self._spawn(self._work(stage, next_stage))
+        if self.report_interval > 0:
+            self._spawn(self._report())
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*list(self._workers), return_exceptions=True)
+
+        # nobody is going to pick up what's still queued
+        for stage in self.stages:
+            while not stage.queue.empty():
+                _, _, future = stage.queue.get_nowait()
+                future.cancel()
+
+    async def run(self, item: Any) -> Any:
+        """
+        Queues the item at the first stage and waits until it went through
+        the whole pipeline.
+
+        Returns the last stage's result, or None if a stage dropped the item.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        await self.stages[0].queue.put((item, loop.time(), future))
+        return await future
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def _spawn(self, coro: Awaitable):
+        task = asyncio.create_task(coro)
+        self._workers.add(task)
+        task.add_done_callback(self._workers.discard)
+
+    async def _work(self, stage: Stage, next_stage: Optional[Stage]):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            item, queued_at, future = await stage._get()
+            started_at = loop.time()
+            stage.total_wait += started_at - queued_at
+            stage.busy += 1
+            try:
+                if future.done():
+                    # whoever was waiting for it gave up
+                    continue
+                result = await stage.work(item)
+                stage.processed += 1
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                stage.failed += 1
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            finally:
+                stage.busy -= 1
+                latency = loop.time() - started_at
+                stage.total_latency += latency
+                stage.max_latency = max(stage.max_latency, latency)
+
+            if next_stage is None or result is None:
+                if not future.done():
+                    future.set_result(result)
+                continue
+
+            # blocks while the next stage is backed up
+            await next_stage.queue.put((result, loop.time(), future))
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            try:
+                for name, s in self.stats().items():
+                    print(
+                        f"Stage {name}: queued {s['depth']}/{s['queue_size']}, "
+                        f"busy {s['busy']}/{s['workers']}, "
+                        f"processed {s['processed']}, failed {s['failed']}, "
+                        f"avg wait {s['avg_wait']:.2f}s, "
+                        f"avg latency {s['avg_latency']:.2f}s, "
+                        f"max latency {s['max_latency']:.2f}s"
+                    )
+            except Exception:
+                traceback.print_exc()
@@ -0,0 +1,265 @@
+import asyncio
+import json
+import math
+import re
+from importlib.util import find_spec
+from typing import Any, Callable, Dict, List, Optional
+
+from pysui.sui.sui_types.scalars import ObjectID
+
+# A conservative guess for models without a tokenizer, most average 3.5 to 4
+CHARS_PER_TOKEN = 3.0
+# Tokens the model's chat template wraps the prompt in
+TEMPLATE_TOKENS = 32
+
+TRUNCATION_MARKER = " [...] "
+
+_SEGMENTS = re.compile(r"\n+|(?<=[.!?])\s+")
+_BOILERPLATE = re.compile(
+    r"^(https?://\S+|"
+    r".*\b(cookies?|privacy policy|terms of (use|service)|all rights reserved|"
+    r"subscribe|newsletter|sign (in|up)|log ?in|skip to (main )?content|"
+    r"share (this|on)|advertisement|javascript)\b.*)$",
+    re.IGNORECASE,
+)
+# Short segments matching the above are boilerplate, longer ones may be content
+_BOILERPLATE_MAX_CHARS = 200
+
+Counter = Callable[[str], int]
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+class ContextLengths:
+    """
+    The `max_context_length` of models, as registered with their onchain
+    `Model` object.
+
+    Every model is read once, concurrent reads of the same model share one
+    request. If a model can't be read `default` is used until the next try.
+    """
+
+    def __init__(self, client: Any, default: Optional[int] = None):
+        self.client = client
+        self.default = default
+        self._lengths: Dict[str, int] = {}
+        self._reads: Dict[str, asyncio.Task] = {}
+
+    async def get(self, model_id: Optional[str]) -> Optional[int]:
+        if not model_id:
+            return self.default
+        if model_id in self._lengths:
+            return self._lengths[model_id]
+
+        read = self._reads.get(model_id)
+        if read is None:
+            read = asyncio.ensure_future(self._read(model_id))
+            self._reads[model_id] = read
+        try:
+            length = await asyncio.shield(read)
+        except Exception as e:
+            print(f"Cannot read the context length of model {model_id}: {e}")
+            return self.default
+        finally:
+            if read.done():
+                self._reads.pop(model_id, None)
+
+        if length > 0:
+            self._lengths[model_id] = length
+            return length
+        return self.default
+
+    async def _read(self, model_id: str) -> int:
+        result = await self.client.get_object(ObjectID(model_id))
+        if result.is_err():
+            raise Exception(result.result_string)
+        info = result.result_data.content.fields["info"]
+        # nested structs may or may not come wrapped in their type
+        info = info.get("fields", info)
+        return int(info["max_context_length"])
+
+
+class PromptAssembler:
+    """
+    Puts a tool's result in front of the prompt as context, without
+    overflowing the model's context window.
+
+    The prompt and the completion's `max_tokens` must fit into the model's
+    `max_context_length`, see `ContextLengths`, the context gets whatever
+    room is left. If it doesn't fit it's trimmed step by step until it does:
+    repeated lines and sentences are dropped, then boilerplate like cookie
+    notices or bare links, and finally the middle is cut out, keeping the
+    head and the tail.
+
+    Tokens are counted with the tokenizer of the model if one is configured
+    in `tokenizers`, a model name to a Hugging Face tokenizer name or a
+    `tokenizer.json` path (requires the `tokenizers` extra), otherwise
+    they're estimated from the length of the text, which is printed once.
+    Tokenizers are loaded once per model.
+    """
+
+    def __init__(
+        self,
+        context_lengths: Optional[ContextLengths] = None,
+        tokenizers: Optional[Dict[str, str]] = None,
+    ):
+        self.context_lengths = context_lengths
+        self.tokenizers = tokenizers or {}
+        self._counters: Dict[str, Counter] = {}
+
+        if context_lengths is None:
+            return
+        if self.tokenizers and find_spec("tokenizers") is None:
+            print(
+                "The tokenizers package isn't installed "
+                "(pip install 'nexus_events[tokenizers]'), "
+                "prompt token counts are estimated"
+            )
+            self.tokenizers = {}
+        elif not self.tokenizers:
+            print("No tokenizers configured, prompt token counts are estimated")
+
+    async def assemble(
+        self,
+        prompt: str,
+        tool_name: str,
+        tool_result: str,
+        model_name: str,
+        model_id: Optional[str],
+        max_tokens: int,
+    ) -> str:
+        max_context_length = None
+        if self.context_lengths is not None:
+            max_context_length = await self.context_lengths.get(model_id)
+        if not max_context_length:
+            return _with_context(prompt, tool_name, tool_result)
+
+        count = await self.counter(model_name)
+        budget = (
+            max_context_length
+            - max_tokens
+            - TEMPLATE_TOKENS
+            - count(_with_context(prompt, tool_name, ""))
+        )
+        context = fit_context(tool_result, budget, count)
+        if context != tool_result:
+            print(
+                f"Trimmed the context from {tool_name} to fit {model_name}'s "
+                f"context length of {max_context_length} tokens"
+            )
+        if not context:
+            return prompt
+        return _with_context(prompt, tool_name, context)
+
+    async def counter(self, model_name: str) -> Counter:
+        if model_name not in self._counters:
+            # loading may download the tokenizer, don't block the loop on it
+            self._counters[model_name] = await asyncio.to_thread(
+                self._load_counter, model_name
+            )
+        return self._counters[model_name]
+
+    def _load_counter(self, model_name: str) -> Counter:
+        name = self.tokenizers.get(model_name)
+        if not name:
+            return estimate_tokens
+        try:
+            from tokenizers import Tokenizer
+
+            if name.endswith(".json"):
+                tokenizer = Tokenizer.from_file(name)
+            else:
+                tokenizer = Tokenizer.from_pretrained(name)
+        except Exception as e:
+            print(f"Cannot load tokenizer {name} for {model_name}, estimating: {e}")
+            return estimate_tokens
+        return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def fit_context(context: str, budget: int, count: Counter) -> str:
+    """Trims the context to at most `budget` tokens, see `PromptAssembler`."""
+    if budget <= 0:
+        return ""
+    if count(context) <= budget:
+        return context
+
+    segments = _deduplicate(_segments(context))
+    context = "\n".join(segments)
+    if count(context) <= budget:
+        return context
+
+    context = "\n".join(
+        segment
+        for segment in segments
+        if len(segment) > _BOILERPLATE_MAX_CHARS or not _BOILERPLATE.match(segment)
+    )
+    if count(context) <= budget:
+        return context
+
+    return _truncate(context, budget, count)
+
+
+def _with_context(prompt: str, tool_name: str, context: str) -> str:
+    return "context from" + tool_name + ": " + context + ". " + prompt
+
+
+def _segments(context: str) -> List[str]:
+    # JSON results, e.g. from tavily_search, are mostly syntax and keys
+    try:
+        values = _strings(json.loads(context))
+    except ValueError:
+        values = [context]
+    return [
+        " ".join(segment.split())
+        for value in values
+        for segment in _SEGMENTS.split(value)
+        if segment.strip()
+    ]
+
+
+def _strings(value: Any) -> List[str]:
+    if isinstance(value, dict):
+        return [s for v in value.values() for s in _strings(v)]
+    if isinstance(value, list):
+        return [s for v in value for s in _strings(v)]
+    if value is None or isinstance(value, bool):
+        return []
+    return [str(value)]
+
+
+def _deduplicate(segments: List[str]) -> List[str]:
+    seen = set()
+    unique = []
+    for segment in segments:
+        key = segment.casefold()
+        if key not in seen:
+            seen.add(key)
+            unique.append(segment)
+    return unique
+
+
+def _truncate(context: str, budget: int, count: Counter) -> str:
+    """Keeps as much of the head, and half as much of the tail, as fits."""
+    budget -= count(TRUNCATION_MARKER)
+    if budget <= 0:
+        return ""
+
+    def fits(chars: int) -> bool:
+        tail = chars // 2
+        kept = context[:chars] + (context[-tail:] if tail else "")
+        return count(kept) <= budget
+
+    # the most characters of the head that fit, by bisection
+    low, high = 0, len(context) * 2 // 3
+    while low < high:
+        middle = (low + high + 1) // 2
+        if fits(middle):
+            low = middle
+        else:
+            high = middle - 1
+    if low == 0:
+        return ""
+    tail = low // 2
+    return context[:low] + TRUNCATION_MARKER + (context[-tail:] if tail else "")
@@ -0,0 +1,151 @@
+import asyncio
+from typing import Any, Awaitable, Dict, List, Optional, Set, Tuple
+
+from pysui.sui.sui_types.scalars import ObjectID
+
+# See `talus::consts`
+STATUS_SUCCESS = "SUCCESS"
+
+
+class StaleRequest(Exception):
+    """The requested task was completed by someone else in the meantime."""
+
+
+class ExecutionStatusChecker:
+    """
+    Tells whether a RequestForCompletionEvent still needs a completion.
+
+    Every transaction that touches a `ClusterExecution` after it's created
+    submits a completion for its current task, which moves the execution to
+    the next task (emitting a new event) or finishes it.
+    Therefore, as long as the transaction that emitted the event is still the
+    last one that modified the execution, the requested task is still running.
+    Once another transaction modified it, the task was completed by someone
+    else and submitting our completion would either abort or, worse, complete
+    the wrong task.
+
+    Concurrent checks are batched into a single multi-get object read.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        recheck_interval: float = 10.0,
+        batch_window: float = 0.05,
+        max_batch: int = 50,
+    ):
+        self.client = client
+        self.recheck_interval = recheck_interval
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._queued: List[Tuple[str, asyncio.Future]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flushing: Set[asyncio.Task] = set()
+
+    async def is_stale(self, cluster_execution_id: str, tx_digest: str) -> bool:
+        """
+        Returns True if the execution has moved on since `tx_digest`.
+
+        If the execution can't be read the event is assumed to be current, we'd
+        rather waste an inference than drop a request.
+        """
+        execution = await self._read(cluster_execution_id)
+        if execution is None:
+            return False
+        if isinstance(execution, Exception):
+            print(f"Cannot read execution {cluster_execution_id}: {execution}")
+            return False
+
+        fields = getattr(execution, "content", None)
+        fields = getattr(fields, "fields", None) or {}
+        status = fields.get("status")
+        current_task = fields.get("current_task")
+
+        if status == STATUS_SUCCESS:
+            print(f"Execution {cluster_execution_id} already finished")
+            return True
+        previous_tx = getattr(execution, "previous_transaction", None)
+        if previous_tx and previous_tx != tx_digest:
+            print(
+                f"Execution {cluster_execution_id} moved on to task {current_task} "
+                f"in tx '{previous_tx}'"
+            )
+            return True
+        return False
+
+    async def run_while_current(
+        self, work: Awaitable, cluster_execution_id: str, tx_digest: str
+    ) -> Any:
+        """
+        Awaits `work`, checking every `recheck_interval` seconds whether the
+        execution moved on in the meantime.
+        If it did, `work` is cancelled and `StaleRequest` is raised.
+        """
+        task = asyncio.ensure_future(work)
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=self.recheck_interval)
+                if done:
+                    return task.result()
+                if await self.is_stale(cluster_execution_id, tx_digest):
+                    raise StaleRequest(
+                        f"Execution {cluster_execution_id} was taken over"
+                    )
+        finally:
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+    async def _read(self, cluster_execution_id: str) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._queued.append((cluster_execution_id, future))
+
+        if len(self._queued) >= self.max_batch:
+            self._flush_now()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+        return await future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.batch_window)
+        self._flush_task = None
+        await self._flush(self._take_batch())
+
+    def _flush_now(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        task = asyncio.create_task(self._flush(self._take_batch()))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    def _take_batch(self) -> List[Tuple[str, asyncio.Future]]:
+        batch, self._queued = self._queued, []
+        return batch
+
+    async def _flush(self, batch: List[Tuple[str, asyncio.Future]]):
+        if not batch:
+            return
+
+        ids = list({execution_id for execution_id, _ in batch})
+        try:
+            result = await self.client.get_objects_for([ObjectID(i) for i in ids])
+            if result.is_err():
+                raise Exception(result.result_string)
+            objects: Dict[str, Any] = {}
+            for obj in result.result_data:
+                object_id = getattr(obj, "object_id", None)
+                if object_id is not None:
+                    objects[_normalize(object_id)] = obj
+            for execution_id, future in batch:
+                if not future.done():
+                    future.set_result(objects.get(_normalize(execution_id)))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(e)
+
+
+def _normalize(object_id: str) -> str:
+    return object_id.lower().removeprefix("0x").lstrip("0")
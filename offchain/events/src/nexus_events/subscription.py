@@ -0,0 +1,91 @@
+import asyncio
+import json
+from typing import Optional
+
+import websockets
+from pysui.sui.sui_txresults.complex_tx import Event
+from pysui.sui.sui_types.event_filter import MoveEventTypeQuery
+
+
+class SubscriptionClosed(Exception):
+    """The websocket feed stopped delivering events."""
+
+
+class EventSubscription:
+    """
+    Push feed of move events over the Sui JSON-RPC websocket.
+
+    Entering the context manager only returns once the node has confirmed the
+    subscription, so anything emitted afterwards is guaranteed to be delivered
+    through `next_event`.
+    Received events are buffered right away, which lets the caller backfill
+    with cursor based queries without the socket stalling in the meantime.
+    """
+
+    def __init__(self, ws_url: str, event_filter: MoveEventTypeQuery):
+        self.ws_url = ws_url
+        self.event_filter = event_filter
+        self._websock = None
+        self._reader: Optional[asyncio.Task] = None
+        self._buffer: asyncio.Queue = asyncio.Queue()
+
+    async def __aenter__(self) -> "EventSubscription":
+        self._websock = await websockets.connect(
+            self.ws_url, extra_headers={"Content-Type": "application/json"}
+        )
+        try:
+            await self._websock.send(
+                json.dumps(
+                    {
+                        "jsonrpc": "2.0",
+                        "id": 1,
+                        "method": "suix_subscribeEvent",
+                        "params": [self.event_filter.filter],
+                    }
+                )
+            )
+            response = json.loads(await self._websock.recv())
+            if "error" in response:
+                raise SubscriptionClosed(f"Subscription rejected: {response['error']}")
+        except BaseException:
+            await self._websock.close()
+            raise
+
+        self._reader = asyncio.create_task(self._read())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self._reader is not None:
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+        await self._websock.close()
+
+    async def next_event(self) -> Event:
+        """Waits for the next pushed event, raising once the feed is closed."""
+        item = await self._buffer.get()
+        if isinstance(item, BaseException):
+            raise SubscriptionClosed(str(item)) from item
+        return item
+
+    async def _read(self):
+        try:
+            async for message in self._websock:
+                payload = json.loads(message)
+                params = payload.get("params")
+                if not params or "result" not in params:
+                    continue
+                self._buffer.put_nowait(Event.from_dict(params["result"]))
+            self._buffer.put_nowait(SubscriptionClosed("Websocket closed"))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._buffer.put_nowait(e)
+
+
+# Errors after which the listener should fall back to cursor based polling.
+FALLBACK_ERRORS = (
+    SubscriptionClosed,
+    websockets.WebSocketException,
+    OSError,
+    asyncio.TimeoutError,
+)
@@ -1,26 +1,37 @@
 import asyncio
 from pysui import SuiConfig
-from pysui.sui.sui_clients.sync_client import SuiClient
+from pysui.sui.sui_clients.async_client import SuiClient
 import aiohttp
 import ast
 import argparse
-import time
 from pysui.sui.sui_types.collections import EventID
 from pysui.sui.sui_types.event_filter import MoveEventTypeQuery
-from typing import Any
+from dataclasses import dataclass
+from typing import Any, List, Optional
 import sys
 import os
 import signal
 
 root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.insert(0, root_dir)
-from nexus_tools.server.tools.tools import TOOLS, TOOL_ARGS_MAPPING
-from pysui.sui.sui_clients.sync_client import SuiClient as SyncClient
-from pysui.sui.sui_txn import SyncTransaction
+from nexus_tools.server.tools.schema import TOOL_ARGS_MAPPING
+from pysui.sui.sui_builders.get_builders import QueryEvents
+from pysui.sui.sui_txn import AsyncTransaction
 from pysui.sui.sui_types.scalars import ObjectID, SuiString, SuiBoolean
 from pysui.sui.sui_txresults.complex_tx import SubscribedEvent
 from nexus_events.offchain import OffChain
+from nexus_events.dispatcher import EventDispatcher, event_cursor, event_key
+from nexus_events.checkpoint import CursorCheckpoint
+from nexus_events.completion_cache import CompletionCache
+from nexus_events.lanes import GAS_BUDGET, SubmissionLanes
+from nexus_events.batcher import CompletionBatcher
+from nexus_events.pipeline import Pipeline, Stage
+from nexus_events.prompt_budget import ContextLengths, PromptAssembler
+from nexus_events.staleness import ExecutionStatusChecker, StaleRequest
+from nexus_events.subscription import EventSubscription, FALLBACK_ERRORS
+from nexus_events.work_queue import STATE_DEAD, STATE_RETRY, WorkQueue
 import json
+import hashlib
 import unicodedata
 import unidecode
 import re
@@ -31,43 +42,55 @@ node_type = os.environ.get("NODE_TYPE", "TALUS_NODE")
 
 off_chain = OffChain()
 
+# How long to wait before polling again after an empty page
+POLL_INTERVAL_SECONDS = 3
+# How long to keep polling after the websocket dropped before resubscribing
+RESUBSCRIBE_INTERVAL_SECONDS = 30
+# How often to look for failed submissions that are due for a retry
+RETRY_POLL_INTERVAL_SECONDS = 5
 
-async def call_use_tool(name, args, url):
-    """calls /tool/use endpoint with tool name and args, called by event handler"""
+
+async def call_use_tool(name, args, url, session: aiohttp.ClientSession = None):
+    """
+    calls /tool/use endpoint with tool name and args, called by event handler
+
+    Pass a long lived `session` to reuse its connections.
+    """
     print(f"Calling /tool/use with name: {name}, args: {args}, url: {url}")
 
     try:
-        if name not in TOOLS:
-            print(f"Tool '{name}' not found in TOOLS dictionary")
-            print(f"Available tools: {list(TOOLS.keys())}")
-            return None
-
         ToolArgsClass = TOOL_ARGS_MAPPING.get(name, None)
         if ToolArgsClass is None:
-            print(f"No ToolArgs class found for tool: {name}")
+            print(f"Tool '{name}' not found in TOOL_ARGS_MAPPING")
+            print(f"Available tools: {list(TOOL_ARGS_MAPPING.keys())}")
             return None
 
         tool_args = ToolArgsClass(**dict(zip(ToolArgsClass.__fields__.keys(), args)))
 
         payload = {"tool_name": name, "args": tool_args.dict()}
 
-        headers = {"Content-Type": "application/json"}
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload, headers=headers) as response:
-                if response.status == 400 or response.status == 422:
-                    error_detail = await response.text()
-                    print(f"Error {response.status}: {error_detail}")
-                    return None
-                response.raise_for_status()
-                result = await response.json()
-                return result
+        if session is None:
+            async with aiohttp.ClientSession() as session:
+                return await post_tool_use(session, url, payload)
+        return await post_tool_use(session, url, payload)
 
     except Exception as e:
         print(f"Error in call_use_tool: {e}")
         return None
 
 
+async def post_tool_use(session: aiohttp.ClientSession, url: str, payload: dict):
+    headers = {"Content-Type": "application/json"}
+    async with session.post(url, json=payload, headers=headers) as response:
+        if response.status == 400 or response.status == 422:
+            error_detail = await response.text()
+            print(f"Error {response.status}: {error_detail}")
+            return None
+        response.raise_for_status()
+        result = await response.json()
+        return result
+
+
 def sanitize_text(text):
     text = unidecode.unidecode(text)
     text = unicodedata.normalize("NFKD", text)
@@ -79,64 +102,414 @@ def sanitize_text(text):
     return text
 
 
+@dataclass
+class CompletionJob:
+    """A RequestForCompletionEvent on its way through the handler's steps."""
+
+    key: str
+    tx_digest: str
+    cluster_execution_id: str
+    model_name: str
+    prompt: str
+    prompt_hash: str
+    max_tokens: int
+    temperature: float
+    tool: Optional[dict] = None
+    model_id: Optional[str] = None
+    tool_result: Optional[str] = None
+    cache_key: Optional[str] = None
+    completion: Optional[str] = None
+
+    def request(self) -> dict:
+        """What's needed to recreate the job from the work queue."""
+        return {
+            "tx_digest": self.tx_digest,
+            "cluster_execution_id": self.cluster_execution_id,
+            "model_name": self.model_name,
+            "prompt": self.prompt,
+            "prompt_hash": self.prompt_hash,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "tool": self.tool,
+            "model_id": self.model_id,
+        }
+
+
+class PromptEventHandler:
+    """
+    Answers RequestForCompletionEvents.
+
+    Handling an event takes four steps, which the listener runs as separate
+    pipeline stages:
+    - `decode` reads the request out of the event
+    - `use_tool` calls the request's tool, if any, and looks up the cache
+    - `infer` generates the completion
+    - `submit` submits the completion onchain
+
+    Every step returns what the next one needs, or None if the request is
+    done with, e.g. because it went stale.
+
+    With a work queue, the tool result and completion of every request are
+    recorded as soon as they're known. Failed generations are retried with
+    the recorded tool result, and failed submissions with the recorded
+    completion, see `retry_submissions`.
+
+    With `stream`, completions are read as they're generated, sanitized on
+    the fly and cut short at any of the `stop_sequences` or after
+    `max_completion_chars` characters.
+
+    Tool results are trimmed to fit the model's context window by the
+    `prompt_assembler`, by default one reading the context lengths of models
+    from their onchain objects.
+    """
+
+    def __init__(
+        self,
+        client: SuiClient,
+        package_id: str,
+        model_owner_cap_id: str,
+        tool_url: str,
+        status_checker: ExecutionStatusChecker = None,
+        completion_cache: CompletionCache = None,
+        lanes: SubmissionLanes = None,
+        batcher: CompletionBatcher = None,
+        http_session: aiohttp.ClientSession = None,
+        work_queue: WorkQueue = None,
+        stream: bool = False,
+        stop_sequences: List[str] = (),
+        max_completion_chars: int = None,
+        prompt_assembler: PromptAssembler = None,
+    ):
+        self.client = client
+        self.package_id = package_id
+        self.model_owner_cap_id = model_owner_cap_id
+        self.tool_url = tool_url
+        self.status_checker = status_checker
+        self.completion_cache = completion_cache
+        self.lanes = lanes
+        self.batcher = batcher
+        self.http_session = http_session
+        self.work_queue = work_queue
+        self.stream = stream
+        self.stop_sequences = stop_sequences
+        self.max_completion_chars = max_completion_chars
+        self.prompt_assembler = prompt_assembler or PromptAssembler(
+            ContextLengths(client)
+        )
+
+    async def _done(self, job: CompletionJob):
+        if self.work_queue is not None:
+            await asyncio.to_thread(self.work_queue.done, job.key)
+
+    async def __call__(self, event: SubscribedEvent) -> Any:
+        """Runs all steps one after another."""
+        job = await self.decode(event)
+        for step in (self.use_tool, self.infer, self.submit):
+            if job is None:
+                return None
+            job = await step(job)
+        return job
+
+    async def decode(self, event: SubscribedEvent) -> Optional[CompletionJob]:
+        tx_digest = event.event_id["txDigest"]
+        try:
+            parsed_json = ast.literal_eval(event.parsed_json)
+            job = CompletionJob(
+                key=":".join(event_key(event)),
+                tx_digest=tx_digest,
+                cluster_execution_id=parsed_json["cluster_execution"],
+                model_name=parsed_json["model_name"],
+                prompt=parsed_json["prompt_contents"],
+                prompt_hash=prompt_hash_hex(parsed_json["prompt_hash"]),
+                max_tokens=parsed_json["max_tokens"],
+                temperature=parsed_json["temperature"] / 100,
+                tool=parsed_json["tool"],
+                model_id=parsed_json.get("model"),
+            )
+        except Exception as e:
+            print(f"Error extracting prompt info: {e}")
+            return None
+
+        if job.temperature < 0.0 or job.temperature > 2.0:
+            print(
+                f"Invalid temperature value {job.temperature}. Setting to default value of 1.0"
+            )
+            job.temperature = 1
+
+        if self.status_checker is not None and await self.status_checker.is_stale(
+            job.cluster_execution_id, tx_digest
+        ):
+            print(f"Skipping stale request in tx '{tx_digest}'")
+            await self._done(job)
+            return None
+
+        if self.work_queue is not None:
+            known = await asyncio.to_thread(
+                self.work_queue.accept, job.key, job.request()
+            )
+            if known is not None and known["state"] == STATE_RETRY:
+                print(f"Request in tx '{tx_digest}' is already waiting for a retry")
+                return None
+            if known is not None and known["state"] == STATE_DEAD:
+                print(f"Request in tx '{tx_digest}' is in the dead letters, skipping")
+                return None
+            if known is not None:
+                job.tool_result = known["tool_result"]
+                job.completion = known["completion"]
+        return job
+
+    async def use_tool(self, job: CompletionJob) -> Optional[CompletionJob]:
+        if job.tool:
+            tool_name = job.tool["fields"]["name"]
+            tool_args = job.tool["fields"]["args"]
+            if job.tool_result is None:
+                print(f"Calling tool '{tool_name}' with args: {tool_args}")
+
+                tool_result = await call_use_tool(
+                    tool_name, tool_args, self.tool_url, session=self.http_session
+                )
+                tool_result = tool_result["result"] if tool_result else None
+                print(f"tool_result: {tool_result}")
+
+                if not tool_result:
+                    print(f"Error calling tool: {tool_name}")
+                    await self._done(job)
+                    return None
+
+                job.tool_result = str(tool_result)
+                if self.work_queue is not None:
+                    await asyncio.to_thread(
+                        self.work_queue.record_tool_result, job.key, job.tool_result
+                    )
+
+            job.prompt = await self.prompt_assembler.assemble(
+                job.prompt,
+                tool_name,
+                job.tool_result,
+                job.model_name,
+                job.model_id,
+                job.max_tokens,
+            )
+            # the onchain hash only covers the prompt without the context
+            job.prompt_hash = hashlib.sha3_256(job.prompt.encode()).hexdigest()
+
+        cache = self.completion_cache
+        if (
+            job.completion is None
+            and cache is not None
+            and cache.applies_to(job.temperature)
+        ):
+            job.cache_key = CompletionCache.key(
+                job.model_name,
+                job.prompt_hash,
+                job.max_tokens,
+                job.temperature,
+                # only streamed completions are cut short
+                stop=self.stop_sequences if self.stream else (),
+                max_chars=self.max_completion_chars if self.stream else None,
+            )
+            job.completion = cache.get(job.cache_key)
+        return job
+
+    async def infer(self, job: CompletionJob) -> Optional[CompletionJob]:
+        if job.completion is not None:
+            print("Using cached completion")
+        else:
+            print("Waiting for completion...")
+            if self.stream:
+                inference = off_chain.astream(
+                    job.prompt,
+                    job.model_name,
+                    job.max_tokens,
+                    job.temperature,
+                    session=self.http_session,
+                    sanitize=sanitize_text,
+                    stop=self.stop_sequences,
+                    max_chars=self.max_completion_chars,
+                )
+            else:
+                inference = off_chain.aprocess(
+                    job.prompt,
+                    job.model_name,
+                    job.max_tokens,
+                    job.temperature,
+                    session=self.http_session,
+                )
+            try:
+                if self.status_checker is None:
+                    job.completion = await inference
+                else:
+                    job.completion = await self.status_checker.run_while_current(
+                        inference, job.cluster_execution_id, job.tx_digest
+                    )
+            except StaleRequest as e:
+                print(f"Abandoning completion: {e}")
+                await self._done(job)
+                return None
+            except Exception as e:
+                if self.work_queue is None:
+                    raise
+                # e.g. the inference server timed out, the request isn't lost
+                print(f"Error generating the completion for {job.key}: {e}")
+                if await asyncio.to_thread(self.work_queue.failed, job.key, str(e)):
+                    print(f"Giving up on generating the completion for {job.key}")
+                else:
+                    print(f"Will retry generating the completion for {job.key}")
+                return None
+
+            if job.cache_key is not None:
+                self.completion_cache.put(job.cache_key, job.completion)
+
+        if self.work_queue is not None:
+            await asyncio.to_thread(
+                self.work_queue.record_completion, job.key, job.completion
+            )
+        return job
+
+    async def submit(self, job: CompletionJob) -> Any:
+        """
+        Submits the completion, and with a work queue records the outcome.
+        """
+        try:
+            result = await self._submit(job)
+            error = "Submission transaction failed"
+        except Exception as e:
+            print(f"Error in create_completion: {e}")
+            print(f"Error type: {type(e)}")
+            print(f"Traceback: {traceback.format_exc()}")
+            result, error = None, str(e)
+
+        if self.work_queue is not None:
+            if result is not None:
+                await asyncio.to_thread(self.work_queue.done, job.key)
+            elif await asyncio.to_thread(self.work_queue.failed, job.key, error):
+                print(f"Giving up on submitting the completion for {job.key}")
+            else:
+                print(f"Will retry submitting the completion for {job.key}")
+        return result
+
+    async def _submit(self, job: CompletionJob) -> Any:
+        completion_json = json.loads(job.completion)
+        completion = completion_json["message"]["content"]
+        completion_safe = sanitize_text(completion)
+
+        if self.batcher is not None:
+            return await self.batcher.submit(job.cluster_execution_id, completion_safe)
+
+        if self.lanes is None:
+            return await submit_completion(
+                self.client,
+                self.package_id,
+                self.model_owner_cap_id,
+                job.cluster_execution_id,
+                completion_safe,
+            )
+
+        async with self.lanes.lane() as lane:
+            return await submit_completion(
+                self.client,
+                self.package_id,
+                lane.owner_cap,
+                job.cluster_execution_id,
+                completion_safe,
+                gas_coin=lane.gas_coin,
+            )
+
+
 async def prompt_event_handler(
     client: SuiClient,
     package_id: str,
     model_owner_cap_id: str,
     event: SubscribedEvent,
     tool_url: str,
+    status_checker: ExecutionStatusChecker = None,
+    completion_cache: CompletionCache = None,
+    lanes: SubmissionLanes = None,
+    batcher: CompletionBatcher = None,
+    http_session: aiohttp.ClientSession = None,
+    work_queue: WorkQueue = None,
 ) -> Any:
     """Handler captures the move event type for each received."""
-    try:
-        parsed_json = ast.literal_eval(event.parsed_json)
+    handler = PromptEventHandler(
+        client,
+        package_id,
+        model_owner_cap_id,
+        tool_url,
+        status_checker=status_checker,
+        completion_cache=completion_cache,
+        lanes=lanes,
+        batcher=batcher,
+        http_session=http_session,
+        work_queue=work_queue,
+    )
+    return await handler(event)
 
-        model_name = parsed_json["model_name"]
-        prompt = parsed_json["prompt_contents"]
-        max_tokens = parsed_json["max_tokens"]
-        temperature = parsed_json["temperature"] / 100
-        cluster_execution_id = parsed_json["cluster_execution"]
 
-        completion = ""
-        if temperature < 0.0 or temperature > 2.0:
-            print(
-                f"Invalid temperature value {temperature}. Setting to default value of 1.0"
-            )
-            temperature = 1
+async def retry_submissions(
+    handler: PromptEventHandler,
+    work_queue: WorkQueue,
+    status_checker: ExecutionStatusChecker = None,
+):
+    """
+    Submits the recorded completions of requests that are due for a retry,
+    and generates them first if that's what failed.
+    """
+    while True:
+        await asyncio.sleep(RETRY_POLL_INTERVAL_SECONDS)
+        try:
+            for row in await asyncio.to_thread(work_queue.due):
+                job = CompletionJob(key=row["key"], **row["request"])
+                job.tool_result = row["tool_result"]
+                job.completion = row["completion"]
+                if status_checker is not None and await status_checker.is_stale(
+                    job.cluster_execution_id, job.tx_digest
+                ):
+                    print(f"Dropping retry of stale request {job.key}")
+                    await asyncio.to_thread(work_queue.done, job.key)
+                    continue
 
-        if parsed_json["tool"]:
-            tool_name = parsed_json["tool"]["fields"]["name"]
-            tool_args = parsed_json["tool"]["fields"]["args"]
-            print(f"Calling tool '{tool_name}' with args: {tool_args}")
+                if job.completion is None:
+                    print(f"Retrying generation of the completion for {job.key}")
+                    job = await handler.use_tool(job)
+                    if job is not None:
+                        job = await handler.infer(job)
+                    if job is None:
+                        continue
 
-            tool_result = await call_use_tool(tool_name, tool_args, tool_url)
-            tool_result = tool_result["result"]
-            print(f"tool_result: {tool_result}")
+                print(f"Retrying submission of the completion for {job.key}")
+                await handler.submit(job)
+        except Exception as e:
+            print(f"Error retrying submissions: {e}")
+            traceback.print_exc()
 
-            if tool_result:
-                prompt = (
-                    "context from" + tool_name + ": " + str(tool_result) + ". " + prompt
-                )
-            else:
-                print(f"Error calling tool: {tool_name}")
-                return None
 
-    except Exception as e:
-        print(f"Error extracting prompt info: {e}")
+def prompt_hash_hex(prompt_hash: Any) -> str:
+    """The event's `prompt_hash` is a `vector<u8>`, i.e. a list of byte values."""
+    if isinstance(prompt_hash, (list, tuple)):
+        return bytes(prompt_hash).hex()
+    return str(prompt_hash)
 
-    print("Waiting for completion...")
-    completion = off_chain.process(prompt, model_name, max_tokens, temperature)
 
+async def submit_completion(
+    client: SuiClient,
+    package_id: str,
+    model_owner_cap_id: str,
+    cluster_execution_id: str,
+    completion_safe: str,
+    gas_coin: str = None,
+) -> Any:
+    """
+    Submits the completion for the cluster execution's current task.
+
+    Pays with `gas_coin` if given, otherwise with any of the account's coins.
+    """
     try:
         # Create the configuration
-        txn = SyncTransaction(client=client)
-
-        completion_json = json.loads(completion)
-        completion = completion_json["message"]["content"]
-        completion_safe = sanitize_text(completion)
+        txn = AsyncTransaction(client=client)
 
         try:
             print("Submitting completion ...")
-            result = txn.move_call(
+            result = await txn.move_call(
                 target=f"{package_id}::cluster::submit_completion_as_model_owner",
                 arguments=[
                     ObjectID(cluster_execution_id),
@@ -152,7 +525,7 @@ async def prompt_event_handler(
             traceback.print_exc()
             return
 
-        result = txn.execute(gas_budget=1000000000)
+        result = await txn.execute(gas_budget=GAS_BUDGET, use_gas_object=gas_coin)
         if result.is_ok():
             print(
                 f"Completion created in tx '{result.result_data.effects.transaction_digest}'"
@@ -168,6 +541,11 @@ async def prompt_event_handler(
         return None
 
 
+def event_model_name(event: SubscribedEvent) -> str:
+    """Reads the model name out of a RequestForCompletionEvent."""
+    return ast.literal_eval(event.parsed_json)["model_name"]
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Listen for ToolUsed events on the Sui network"
@@ -194,6 +572,209 @@ def main():
         default="http://0.0.0.0:8080/tool/use",
         help="URL to call /tool/use endpoint",
     )
+    parser.add_argument(
+        "--ingest",
+        choices=["subscribe", "poll"],
+        default=os.getenv("INGEST_MODE", "subscribe"),
+        help="Receive events pushed over the websocket, or only poll the RPC",
+    )
+    parser.add_argument(
+        "--max-inflight",
+        type=int,
+        default=int(os.getenv("MAX_INFLIGHT", "64")),
+        help="Maximum number of events in the pipeline, queued or being worked on",
+    )
+    parser.add_argument(
+        "--max-inflight-per-model",
+        type=int,
+        default=(
+            int(os.getenv("MAX_INFLIGHT_PER_MODEL"))
+            if os.getenv("MAX_INFLIGHT_PER_MODEL")
+            else None
+        ),
+        help="Maximum number of events handled concurrently for a single model",
+    )
+    parser.add_argument(
+        "--decode-workers",
+        type=int,
+        default=int(os.getenv("DECODE_WORKERS", "4")),
+        help="Number of events decoded and checked for staleness concurrently",
+    )
+    parser.add_argument(
+        "--tool-workers",
+        type=int,
+        default=int(os.getenv("TOOL_WORKERS", "4")),
+        help="Number of tools called concurrently",
+    )
+    parser.add_argument(
+        "--inference-workers",
+        type=int,
+        default=int(os.getenv("INFERENCE_WORKERS", "4")),
+        help="Number of completions generated concurrently",
+    )
+    parser.add_argument(
+        "--submit-workers",
+        type=int,
+        default=int(os.getenv("SUBMIT_WORKERS", "4")),
+        help="Number of completions submitted concurrently",
+    )
+    parser.add_argument(
+        "--stage-queue-size",
+        type=int,
+        default=int(os.getenv("STAGE_QUEUE_SIZE", "16")),
+        help="How many events may wait in front of every pipeline stage",
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=float(os.getenv("STATS_INTERVAL", "60")),
+        help="How often (in seconds) to print pipeline stage statistics, 0 never does",
+    )
+    parser.add_argument(
+        "--stale-recheck-interval",
+        type=float,
+        default=float(os.getenv("STALE_RECHECK_INTERVAL", "10")),
+        help="How often (in seconds) to check whether a request being generated was completed by someone else",
+    )
+    parser.add_argument(
+        "--completion-cache-file",
+        default=os.getenv(
+            "COMPLETION_CACHE_FILE",
+            os.path.join(os.getenv("SHARED_DIR", "."), "completion_cache.sqlite"),
+        ),
+        help="SQLite file backing the completion cache",
+    )
+    parser.add_argument(
+        "--completion-cache-max-mb",
+        type=int,
+        default=int(os.getenv("COMPLETION_CACHE_MAX_MB", "256")),
+        help="Size limit of the completion cache file, 0 keeps the cache in memory only",
+    )
+    parser.add_argument(
+        "--completion-cache-any-temperature",
+        action="store_true",
+        help="Also reuse completions of requests with a non-zero temperature",
+    )
+    parser.add_argument(
+        "--no-completion-cache",
+        action="store_true",
+        help="Always run inference, even for repeated deterministic requests",
+    )
+    parser.add_argument(
+        "--stream-completions",
+        action="store_true",
+        default=os.getenv("STREAM_COMPLETIONS", "").lower() in ("1", "true"),
+        help="Read completions from the tool server's streaming endpoint as they're generated",
+    )
+    parser.add_argument(
+        "--stop-sequence",
+        action="append",
+        default=[s for s in os.getenv("STOP_SEQUENCES", "").split(",") if s],
+        help="Stop a streamed completion once it contains this text, can be repeated",
+    )
+    parser.add_argument(
+        "--max-completion-chars",
+        type=int,
+        default=(
+            int(os.getenv("MAX_COMPLETION_CHARS"))
+            if os.getenv("MAX_COMPLETION_CHARS")
+            else None
+        ),
+        help="Stop a streamed completion once it's this many characters long",
+    )
+    parser.add_argument(
+        "--default-context-length",
+        type=int,
+        default=(
+            int(os.getenv("DEFAULT_CONTEXT_LENGTH"))
+            if os.getenv("DEFAULT_CONTEXT_LENGTH")
+            else None
+        ),
+        help="Context length of models whose onchain max_context_length can't be read, "
+        "by default their tool context isn't trimmed",
+    )
+    parser.add_argument(
+        "--tokenizers",
+        default=os.getenv("TOKENIZERS", "{}"),
+        help="JSON object mapping model names to the Hugging Face tokenizer (name or tokenizer.json path) "
+        "used to count their prompt tokens, others are estimated",
+    )
+    parser.add_argument(
+        "--submission-lanes",
+        type=int,
+        default=int(os.getenv("SUBMISSION_LANES", "1")),
+        help="How many completions may be submitted in parallel, each lane gets its own gas coin",
+    )
+    parser.add_argument(
+        "--clone-owner-caps",
+        action="store_true",
+        default=(
+            os.getenv("CLONE_OWNER_CAPS").lower() in ("1", "true")
+            if os.getenv("CLONE_OWNER_CAPS")
+            else None
+        ),
+        help="Give every submission lane its own clone of the model owner cap, "
+        "the default with more than one lane",
+    )
+    parser.add_argument(
+        "--no-clone-owner-caps",
+        action="store_false",
+        dest="clone_owner_caps",
+        help="Let all submission lanes share the model owner cap, they take turns",
+    )
+    parser.add_argument(
+        "--batch-window-ms",
+        type=int,
+        default=int(os.getenv("BATCH_WINDOW_MS", "0")),
+        help="Submit completions that finish within this many milliseconds of each other in one transaction, "
+        "0 submits every completion on its own",
+    )
+    parser.add_argument(
+        "--max-batch-size",
+        type=int,
+        default=int(os.getenv("MAX_BATCH_SIZE", "8")),
+        help="Maximum number of completions submitted in one transaction",
+    )
+    parser.add_argument(
+        "--work-queue-file",
+        default=os.getenv(
+            "WORK_QUEUE_FILE",
+            os.path.join(os.getenv("SHARED_DIR", "."), "work_queue.sqlite"),
+        ),
+        help="SQLite file recording requests until their completion is submitted",
+    )
+    parser.add_argument(
+        "--max-submit-attempts",
+        type=int,
+        default=int(os.getenv("MAX_SUBMIT_ATTEMPTS", "5")),
+        help="How often generating and submitting a completion is attempted before it's moved to the dead letters",
+    )
+    parser.add_argument(
+        "--submit-retry-delay",
+        type=float,
+        default=float(os.getenv("SUBMIT_RETRY_DELAY", "5")),
+        help="Seconds to wait before the first retry of a failed submission, doubled for every further retry",
+    )
+    parser.add_argument(
+        "--no-work-queue",
+        action="store_true",
+        help="Don't record requests, completions of failed submissions are lost",
+    )
+    parser.add_argument(
+        "--start-from",
+        choices=["checkpoint", "latest", "genesis"],
+        default=os.getenv("START_FROM", "checkpoint"),
+        help="Resume after the last processed event (from genesis if there is no checkpoint), "
+        "skip everything emitted so far, or reprocess all events",
+    )
+    parser.add_argument(
+        "--checkpoint-file",
+        default=os.getenv(
+            "CHECKPOINT_FILE",
+            os.path.join(os.getenv("SHARED_DIR", "."), "event_checkpoint.json"),
+        ),
+        help="File that records the last processed event",
+    )
 
     args = parser.parse_args()
 
@@ -205,35 +786,323 @@ def main():
         rpc_url=args.rpc, ws_url=args.ws, prv_keys=[args.privkey]
     )
     client = SuiClient(config)
+    checkpoint = CursorCheckpoint(args.checkpoint_file, package_id)
+    completion_cache = None
+    if not args.no_completion_cache:
+        completion_cache = CompletionCache(
+            args.completion_cache_file,
+            max_disk_bytes=args.completion_cache_max_mb * 1024 * 1024,
+            any_temperature=args.completion_cache_any_temperature,
+        )
 
-    next_cursor = None
-    while True:
-        next_cursor = process_next_event_page(
+    work_queue = None
+    if not args.no_work_queue:
+        work_queue = WorkQueue(
+            args.work_queue_file,
+            max_attempts=args.max_submit_attempts,
+            base_delay=args.submit_retry_delay,
+        )
+
+    lanes = SubmissionLanes(
+        client,
+        package_id,
+        model_owner_cap_id,
+        lanes=args.submission_lanes,
+        clone_owner_caps=args.clone_owner_caps,
+    )
+
+    asyncio.run(
+        listen(
             client,
             package_id,
             model_owner_cap_id,
-            cursor=next_cursor,
-            tool_url=tool_url,
+            tool_url,
+            checkpoint=checkpoint,
+            start_from=args.start_from,
+            ws_url=args.ws if args.ingest == "subscribe" else None,
+            max_inflight=args.max_inflight,
+            max_inflight_per_model=args.max_inflight_per_model,
+            stale_recheck_interval=args.stale_recheck_interval,
+            completion_cache=completion_cache,
+            lanes=lanes,
+            batch_window=args.batch_window_ms / 1000,
+            max_batch_size=args.max_batch_size,
+            decode_workers=args.decode_workers,
+            tool_workers=args.tool_workers,
+            inference_workers=args.inference_workers,
+            submit_workers=args.submit_workers,
+            stage_queue_size=args.stage_queue_size,
+            stats_interval=args.stats_interval,
+            work_queue=work_queue,
+            stream=args.stream_completions,
+            stop_sequences=args.stop_sequence,
+            max_completion_chars=args.max_completion_chars,
+            prompt_assembler=PromptAssembler(
+                ContextLengths(client, default=args.default_context_length),
+                tokenizers=json.loads(args.tokenizers),
+            ),
         )
+    )
 
 
-# Fetches the next page of events
+async def listen(
+    client: SuiClient,
+    package_id: str,
+    model_owner_cap_id: str,
+    tool_url: str,
+    checkpoint: CursorCheckpoint,
+    start_from: str = "checkpoint",
+    ws_url: str = None,
+    max_inflight: int = 64,
+    max_inflight_per_model: int = None,
+    stale_recheck_interval: float = 10.0,
+    completion_cache: CompletionCache = None,
+    lanes: SubmissionLanes = None,
+    batch_window: float = 0,
+    max_batch_size: int = 8,
+    decode_workers: int = 4,
+    tool_workers: int = 4,
+    inference_workers: int = 4,
+    submit_workers: int = 4,
+    stage_queue_size: int = 16,
+    stats_interval: float = 60.0,
+    work_queue: WorkQueue = None,
+    stream: bool = False,
+    stop_sequences: List[str] = (),
+    max_completion_chars: int = None,
+    prompt_assembler: PromptAssembler = None,
+):
+    """
+    Receives events and runs them through the handler's pipeline stages.
+
+    With a websocket URL events are pushed to us as they are emitted, otherwise
+    the RPC is polled.
+    Ingestion pauses while the inference stage's queue is full.
+    Every time handling of the oldest outstanding events finishes, the
+    checkpoint is moved past them.
+    """
+
+    status_checker = ExecutionStatusChecker(
+        client, recheck_interval=stale_recheck_interval
+    )
+    # shared by all handlers for tool and inference calls
+    http_session = aiohttp.ClientSession()
+
+    if lanes is None:
+        lanes = SubmissionLanes(client, package_id, model_owner_cap_id)
+
+    batcher = None
+    if batch_window > 0 and max_batch_size > 1:
+        batcher = CompletionBatcher(
+            client,
+            package_id,
+            lanes,
+            window=batch_window,
+            max_batch=max_batch_size,
+        )
+
+    handler = PromptEventHandler(
+        client,
+        package_id,
+        model_owner_cap_id,
+        tool_url,
+        status_checker=status_checker,
+        completion_cache=completion_cache,
+        lanes=lanes,
+        batcher=batcher,
+        http_session=http_session,
+        work_queue=work_queue,
+        stream=stream,
+        stop_sequences=stop_sequences,
+        max_completion_chars=max_completion_chars,
+        prompt_assembler=prompt_assembler,
+    )
+    pipeline = Pipeline(
+        [
+            Stage(
+                "decode",
+                handler.decode,
+                workers=decode_workers,
+                queue_size=stage_queue_size,
+            ),
+            Stage(
+                "tool",
+                handler.use_tool,
+                workers=tool_workers,
+                queue_size=stage_queue_size,
+            ),
+            Stage(
+                "inference",
+                handler.infer,
+                workers=inference_workers,
+                queue_size=stage_queue_size,
+            ),
+            Stage(
+                "submit",
+                handler.submit,
+                workers=submit_workers,
+                queue_size=stage_queue_size,
+            ),
+        ],
+        report_interval=stats_interval,
+    )
+
+    dispatcher = EventDispatcher(
+        pipeline.run,
+        max_inflight=max_inflight,
+        max_inflight_per_model=max_inflight_per_model,
+        model_of=event_model_name,
+        on_commit=checkpoint.save_soon,
+        throttle=pipeline.stage("inference").wait_for_room,
+    )
+
+    retrier = None
+    try:
+        await lanes.start()
+        if batcher is not None:
+            await batcher.start()
+        await pipeline.start()
+        if work_queue is not None:
+            retrier = asyncio.create_task(
+                retry_submissions(handler, work_queue, status_checker)
+            )
+
+        next_cursor = await start_cursor(client, package_id, checkpoint, start_from)
+        if ws_url:
+            await follow_subscription(
+                client, package_id, ws_url, dispatcher, cursor=next_cursor
+            )
+        else:
+            while True:
+                next_cursor, _ = await process_next_event_page(
+                    client,
+                    package_id,
+                    dispatcher,
+                    cursor=next_cursor,
+                )
+    finally:
+        if retrier is not None:
+            retrier.cancel()
+            await asyncio.gather(retrier, return_exceptions=True)
+        await dispatcher.drain()
+        await checkpoint.flush()
+        await pipeline.stop()
+        if batcher is not None:
+            await batcher.stop()
+        await lanes.stop()
+        await http_session.close()
+
+
+async def follow_subscription(
+    client: SuiClient,
+    package_id: str,
+    ws_url: str,
+    dispatcher: EventDispatcher,
+    cursor: EventID,
+):
+    """
+    Dispatches events pushed over the websocket.
+
+    Every time the subscription is (re)established, everything emitted since
+    `cursor` is backfilled with regular queries first.
+    Events pushed in the meantime are buffered by the subscription, and the
+    dispatcher drops the ones the backfill already covered.
+    When the socket drops we poll for a while before subscribing again.
+    """
+    event_filter = MoveEventTypeQuery(prompt_event_type(package_id))
+    loop = asyncio.get_running_loop()
+
+    while True:
+        try:
+            async with EventSubscription(ws_url, event_filter) as subscription:
+                print(f"Subscribed to events on {ws_url}, backfilling...")
+                has_events = True
+                while has_events:
+                    cursor, has_events = await process_next_event_page(
+                        client, package_id, dispatcher, cursor=cursor, idle_wait=0
+                    )
+
+                while True:
+                    event = await subscription.next_event()
+                    print(
+                        f"event_id: {event.event_id}, timestamp_ms: {event.timestamp_ms}"
+                    )
+                    if await dispatcher.dispatch(event):
+                        cursor = event_cursor(event)
+        except FALLBACK_ERRORS as e:
+            print(f"Event subscription unavailable ({e}), falling back to polling")
+
+        resubscribe_at = loop.time() + RESUBSCRIBE_INTERVAL_SECONDS
+        while loop.time() < resubscribe_at:
+            cursor, _ = await process_next_event_page(
+                client, package_id, dispatcher, cursor=cursor
+            )
+
+
+async def start_cursor(
+    client: SuiClient,
+    package_id: str,
+    checkpoint: CursorCheckpoint,
+    start_from: str,
+) -> EventID:
+    """Cursor after which the listener starts processing, None for genesis."""
+    if start_from == "checkpoint":
+        cursor = checkpoint.load()
+        if cursor is None:
+            print("No checkpoint found, starting from genesis")
+        else:
+            print(f"Resuming after checkpointed event {cursor.map}")
+        return cursor
+
+    if start_from == "latest":
+        events_result = await client.execute(
+            QueryEvents(
+                query=MoveEventTypeQuery(prompt_event_type(package_id)),
+                descending_order=SuiBoolean(True),
+                limit=1,
+            )
+        )
+        if events_result.is_err():
+            print(f"Cannot read Sui events: {events_result.result_string}")
+            sys.exit(1)
+
+        events = events_result.result_data.data
+        if not events:
+            return None
+        print(f"Skipping all events up to {events[0].event_id}")
+        return event_cursor(events[0])
+
+    return None
+
+
+def prompt_event_type(package_id: str) -> str:
+    return f"{package_id}::prompt::RequestForCompletionEvent"
+
+
+# Fetches the next page of events and dispatches them to the handlers
 #
 # Returns a tuple:
-# - The first element is the next cursor to use
-# - The second element is a boolean indicating whether the first event should be skipped
-def process_next_event_page(
+# - The first element is the cursor of the last event on the page, from which
+#   the next page should be fetched
+# - The second element is a boolean indicating whether the page had any events,
+#   if it had none we've waited `idle_wait` seconds before returning
+# Handlers may still be running when this returns, `dispatcher.committed_cursor`
+# tracks how far handling has actually finished.
+async def process_next_event_page(
     client: SuiClient,
     package_id: str,
-    model_owner_cap_id: str,
+    dispatcher: EventDispatcher,
     cursor: EventID,
-    tool_url: str,
+    idle_wait: float = POLL_INTERVAL_SECONDS,
 ):
-    prompt_event_type = f"{package_id}::prompt::RequestForCompletionEvent"
-    event_filter = MoveEventTypeQuery(prompt_event_type)
+    event_filter = MoveEventTypeQuery(prompt_event_type(package_id))
 
-    events_result = client.get_events(
-        query=event_filter, descending_order=SuiBoolean(False), cursor=cursor
+    events_result = await client.execute(
+        QueryEvents(
+            query=event_filter,
+            descending_order=SuiBoolean(False),
+            cursor=cursor,
+        )
     )
     if events_result.is_err():
         print(f"Cannot read Sui events: {events_result.result_string}")
@@ -245,28 +1114,26 @@ def process_next_event_page(
         print(f"event_id: {event.event_id}, timestamp_ms: {event.timestamp_ms}")
 
     if not events:
-        print(f"No new events, waiting...")
-        time.sleep(3)
-        return cursor
+        if idle_wait:
+            print(f"No new events, waiting...")
+            await asyncio.sleep(idle_wait)
+        return cursor, False
 
-    print(f"Processing {len(events)} events")
+    print(f"Dispatching {len(events)} events ({dispatcher.inflight} already in flight)")
     for event in events:
-        asyncio.run(
-            prompt_event_handler(
-                client, package_id, model_owner_cap_id, event, tool_url
-            )
-        )
+        # Blocks while all handler slots are taken
+        await dispatcher.dispatch(event)
 
     # Set the cursor to the last event.
     # Also next fetch will skip the first event (the last event of this fetch)
-    # since it will have been already processed.
+    # since it will have been already dispatched.
     # We don't use the "next_cursor" property to simplify the code.
 
     last_event_id = events[-1].event_id
     event_seq = last_event_id["eventSeq"]
     tx_digest = last_event_id["txDigest"]
     next_cursor = EventID(event_seq, tx_digest)
-    return next_cursor
+    return next_cursor, True
 
 
 if __name__ == "__main__":
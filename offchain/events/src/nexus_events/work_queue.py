@@ -0,0 +1,284 @@
+import argparse
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# A request's progress, see `WorkQueue`
+STATE_ACCEPTED = "accepted"
+STATE_GENERATED = "generated"
+STATE_RETRY = "retry"
+STATE_DEAD = "dead"
+
+_COLUMNS = (
+    "key, request, tool_result, completion, state, attempts, next_attempt, "
+    "last_error, updated"
+)
+
+
+def _locked(method):
+    # the connection is shared by the threads calling the queue
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+
+    return locked
+
+
+class WorkQueue:
+    """
+    Durable record of the requests the listener is working on.
+
+    Every accepted request is stored with its tool result and, once generated,
+    its completion, in an SQLite file in WAL mode.
+    A request leaves the queue once its completion was submitted or once it
+    turned out there's nothing to submit, e.g. because it went stale.
+
+    When generating or submitting the completion fails, the request is
+    scheduled for another attempt with exponential backoff.
+    After `max_attempts` failed attempts it's moved to the dead letter table,
+    where it stays until it's requeued, e.g. with
+    `python -m nexus_events.work_queue requeue`.
+    Retries always reuse the stored tool result and completion, if any,
+    instead of getting them again.
+
+    Every call commits to the file, so the listener makes them from worker
+    threads, one at a time.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        max_attempts: int = 5,
+        base_delay: float = 5.0,
+        max_delay: float = 600.0,
+    ):
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        for table in ("jobs", "dead_letters"):
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "key TEXT PRIMARY KEY, request TEXT NOT NULL, tool_result TEXT, "
+                "completion TEXT, state TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL, "
+                "last_error TEXT, updated REAL NOT NULL)"
+            )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_due ON jobs (state, next_attempt)"
+        )
+        self._db.commit()
+
+    @_locked
+    def accept(self, key: str, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Records a newly received request.
+
+        Returns what was recorded before if the request is already known,
+        e.g. because the listener restarted before it was done with it, or
+        because it's in the dead letters.
+        """
+        row = self._get(key)
+        if row is None:
+            row = self._get(key, table="dead_letters")
+        if row is not None:
+            return row
+
+        self._db.execute(
+            "INSERT INTO jobs (key, request, state, updated) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(request), STATE_ACCEPTED, time.time()),
+        )
+        self._db.commit()
+        return None
+
+    @_locked
+    def record_tool_result(self, key: str, tool_result: str):
+        self._update(key, "tool_result = ?", (tool_result,))
+
+    @_locked
+    def record_completion(self, key: str, completion: str):
+        self._update(key, "completion = ?, state = ?", (completion, STATE_GENERATED))
+
+    @_locked
+    def done(self, key: str):
+        """The request needs no more work, it's forgotten."""
+        self._db.execute("DELETE FROM jobs WHERE key = ?", (key,))
+        self._db.commit()
+
+    @_locked
+    def failed(self, key: str, error: str) -> bool:
+        """
+        Records a failed attempt and schedules the next one.
+
+        Returns True if that was the last attempt and the request has been
+        moved to the dead letters.
+        """
+        row = self._get(key)
+        if row is None:
+            return False
+
+        attempts = row["attempts"] + 1
+        now = time.time()
+        if attempts >= self.max_attempts:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO dead_letters ({_COLUMNS}) "
+                f"SELECT {_COLUMNS} FROM jobs WHERE key = ?",
+                (key,),
+            )
+            self._db.execute(
+                "UPDATE dead_letters SET state = ?, attempts = ?, last_error = ?, "
+                "next_attempt = NULL, updated = ? WHERE key = ?",
+                (STATE_DEAD, attempts, error, now, key),
+            )
+            self._db.execute("DELETE FROM jobs WHERE key = ?", (key,))
+            self._db.commit()
+            return True
+
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        self._update(
+            key,
+            "state = ?, attempts = ?, next_attempt = ?, last_error = ?",
+            (STATE_RETRY, attempts, now + delay, error),
+        )
+        return False
+
+    @_locked
+    def due(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Requests whose submission should be attempted again by now."""
+        rows = self._db.execute(
+            f"SELECT {_COLUMNS} FROM jobs WHERE state = ? AND next_attempt <= ? "
+            "ORDER BY next_attempt LIMIT ?",
+            (STATE_RETRY, time.time(), limit),
+        ).fetchall()
+        return [_row(r) for r in rows]
+
+    @_locked
+    def pending(self) -> List[Dict[str, Any]]:
+        rows = self._db.execute(
+            f"SELECT {_COLUMNS} FROM jobs ORDER BY updated"
+        ).fetchall()
+        return [_row(r) for r in rows]
+
+    @_locked
+    def dead_letters(self) -> List[Dict[str, Any]]:
+        rows = self._db.execute(
+            f"SELECT {_COLUMNS} FROM dead_letters ORDER BY updated"
+        ).fetchall()
+        return [_row(r) for r in rows]
+
+    @_locked
+    def requeue(self, key: Optional[str] = None) -> int:
+        """
+        Moves the dead letter with the given key, or all of them, back to the
+        queue to be submitted again right away.
+
+        Returns how many were requeued.
+        """
+        where, params = ("WHERE key = ?", (key,)) if key else ("", ())
+        keys = [
+            r["key"]
+            for r in self._db.execute(
+                f"SELECT key FROM dead_letters {where}", params
+            ).fetchall()
+        ]
+        now = time.time()
+        for k in keys:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO jobs ({_COLUMNS}) "
+                f"SELECT {_COLUMNS} FROM dead_letters WHERE key = ?",
+                (k,),
+            )
+            self._db.execute(
+                "UPDATE jobs SET state = ?, attempts = 0, next_attempt = ?, "
+                "updated = ? WHERE key = ?",
+                (STATE_RETRY, now, now, k),
+            )
+            self._db.execute("DELETE FROM dead_letters WHERE key = ?", (k,))
+        self._db.commit()
+        return len(keys)
+
+    @_locked
+    def close(self):
+        self._db.close()
+
+    def _get(self, key: str, table: str = "jobs") -> Optional[Dict[str, Any]]:
+        row = self._db.execute(
+            f"SELECT {_COLUMNS} FROM {table} WHERE key = ?", (key,)
+        ).fetchone()
+        return _row(row) if row is not None else None
+
+    def _update(self, key: str, assignments: str, params: tuple):
+        self._db.execute(
+            f"UPDATE jobs SET {assignments}, updated = ? WHERE key = ?",
+            params + (time.time(), key),
+        )
+        self._db.commit()
+
+
+def _row(row: sqlite3.Row) -> Dict[str, Any]:
+    data = dict(row)
+    data["request"] = json.loads(data["request"])
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Inspect and requeue the listener's pending and dead letter requests"
+    )
+    parser.add_argument(
+        "--file",
+        default=os.getenv(
+            "WORK_QUEUE_FILE",
+            os.path.join(os.getenv("SHARED_DIR", "."), "work_queue.sqlite"),
+        ),
+        help="SQLite file backing the work queue",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("pending", help="List requests the listener is working on")
+    commands.add_parser("dead", help="List requests that ran out of attempts")
+    requeue = commands.add_parser(
+        "requeue", help="Submit dead letters again, with their stored completion"
+    )
+    requeue.add_argument("key", nargs="?", help="Only requeue this request")
+    args = parser.parse_args()
+
+    queue = WorkQueue(args.file)
+    try:
+        if args.command == "requeue":
+            count = queue.requeue(args.key)
+            print(f"Requeued {count} request(s)")
+            return
+
+        rows = queue.pending() if args.command == "pending" else queue.dead_letters()
+        for row in rows:
+            request = row["request"]
+            print(
+                f"{row['key']}  state={row['state']}  attempts={row['attempts']}  "
+                f"execution={request['cluster_execution_id']}  "
+                f"model={request['model_name']}  "
+                f"completion={'yes' if row['completion'] is not None else 'no'}"
+            )
+            if row["last_error"]:
+                print(f"    last error: {row['last_error']}")
+        print(f"{len(rows)} request(s)")
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
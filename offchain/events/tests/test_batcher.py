@@ -0,0 +1,127 @@
+"""
+tests for submitting several completions in one transaction
+To run, execute "PYTHONPATH=src pytest tests/test_batcher.py" from `events` directory
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import nexus_events.batcher as batcher_module
+from nexus_events.batcher import CompletionBatcher
+from nexus_events.lanes import SubmissionLanes
+
+PACKAGE_ID = "0x" + "1" * 64
+OWNER_CAP = "0x" + "2" * 64
+
+
+def execution(i):
+    return "0x" + f"{i:x}".rjust(64, "a")
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class FakeChain:
+    """Executes transactions unless they submit a completion that is `bad`."""
+
+    def __init__(self, bad=()):
+        self.bad = set(bad)
+        self.transactions = []
+
+    def transaction(self, client):
+        return FakeTransaction(self)
+
+
+class FakeTransaction:
+    def __init__(self, chain):
+        self.chain = chain
+        self.calls = []
+
+    async def move_call(self, target, arguments):
+        execution_id, owner_cap, completion = arguments
+        assert target == f"{PACKAGE_ID}::cluster::submit_completion_as_model_owner"
+        assert owner_cap.value == OWNER_CAP
+        self.calls.append((execution_id.value, completion.value))
+
+    async def execute(self, gas_budget, use_gas_object):
+        completions = [completion for _, completion in self.calls]
+        self.chain.transactions.append(completions)
+        ok = not self.chain.bad & set(completions)
+        effects = SimpleNamespace(
+            status=SimpleNamespace(status="success" if ok else "failure"),
+            transaction_digest=f"tx{len(self.chain.transactions)}",
+        )
+        return SimpleNamespace(
+            is_ok=lambda: True, result_data=SimpleNamespace(effects=effects)
+        )
+
+
+async def submit_all(chain, completions, **kwargs):
+    """Submits (execution, completion) pairs at once, returns their results."""
+    lanes = SubmissionLanes(None, PACKAGE_ID, OWNER_CAP)
+    batcher = CompletionBatcher(None, PACKAGE_ID, lanes, **kwargs)
+    await lanes.start()
+    await batcher.start()
+    try:
+        return await asyncio.gather(*(batcher.submit(*c) for c in completions))
+    finally:
+        await batcher.stop()
+        await lanes.stop()
+
+
+def test_submits_completions_of_one_window_together(monkeypatch):
+    chain = FakeChain()
+    monkeypatch.setattr(batcher_module, "AsyncTransaction", chain.transaction)
+
+    completions = [(execution(i), f"completion {i}") for i in range(3)]
+    results = run(submit_all(chain, completions, window=0.05))
+
+    assert chain.transactions == [["completion 0", "completion 1", "completion 2"]]
+    digests = {r["func"].effects.transaction_digest for r in results}
+    assert digests == {"tx1"}
+
+
+def test_limits_the_size_of_batches(monkeypatch):
+    chain = FakeChain()
+    monkeypatch.setattr(batcher_module, "AsyncTransaction", chain.transaction)
+
+    completions = [(execution(i), str(i)) for i in range(5)]
+    run(submit_all(chain, completions, window=0.05, max_batch=2))
+
+    assert chain.transactions == [["0", "1"], ["2", "3"], ["4"]]
+
+
+def test_submits_one_completion_per_execution_and_transaction(monkeypatch):
+    chain = FakeChain()
+    monkeypatch.setattr(batcher_module, "AsyncTransaction", chain.transaction)
+
+    completions = [
+        (execution(0), "first"),
+        (execution(0), "second"),
+        (execution(1), "other"),
+    ]
+    results = run(submit_all(chain, completions, window=0.05))
+
+    assert chain.transactions == [["first", "other"], ["second"]]
+    assert all(r is not None for r in results)
+
+
+def test_a_bad_completion_only_fails_itself(monkeypatch):
+    chain = FakeChain(bad={"bad"})
+    monkeypatch.setattr(batcher_module, "AsyncTransaction", chain.transaction)
+
+    completions = [(execution(i), c) for i, c in enumerate(["a", "b", "bad", "d"])]
+    results = run(submit_all(chain, completions, window=0.05))
+
+    # split in halves until the bad one is on its own
+    assert chain.transactions == [
+        ["a", "b", "bad", "d"],
+        ["a", "b"],
+        ["bad", "d"],
+        ["bad"],
+        ["d"],
+    ]
+    assert results[2] is None
+    assert [r["func"].effects.transaction_digest for r in results[:2]] == ["tx2"] * 2
+    assert results[3]["func"].effects.transaction_digest == "tx5"
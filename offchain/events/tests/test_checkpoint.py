@@ -0,0 +1,72 @@
+"""
+tests for the event cursor checkpoint
+To run, execute "PYTHONPATH=src pytest tests/test_checkpoint.py" from `events` directory
+"""
+
+import asyncio
+import threading
+import time
+
+from pysui.sui.sui_types.collections import EventID
+
+from nexus_events.checkpoint import CursorCheckpoint
+
+PACKAGE_ID = "0x" + "1" * 64
+
+
+def test_loads_what_was_saved(tmp_path):
+    path = tmp_path / "shared" / "checkpoint.json"
+    checkpoint = CursorCheckpoint(path, PACKAGE_ID)
+    assert checkpoint.load() is None
+
+    checkpoint.save(EventID("3", "tx1"))
+    checkpoint.save(EventID("7", "tx2"))
+
+    # as read by a restarted listener
+    cursor = CursorCheckpoint(path, PACKAGE_ID).load()
+    assert cursor.map == {"eventSeq": "7", "txDigest": "tx2"}
+    # nothing but the checkpoint is left behind
+    assert [p.name for p in path.parent.iterdir()] == ["checkpoint.json"]
+
+
+def test_ignores_checkpoints_of_other_packages(tmp_path):
+    path = tmp_path / "checkpoint.json"
+    CursorCheckpoint(path, PACKAGE_ID).save(EventID("3", "tx1"))
+    assert CursorCheckpoint(path, "0x" + "2" * 64).load() is None
+
+
+def test_ignores_unreadable_checkpoints(tmp_path):
+    path = tmp_path / "checkpoint.json"
+    path.write_text('{"package_id": ')
+    assert CursorCheckpoint(path, PACKAGE_ID).load() is None
+
+
+def test_writes_only_the_latest_cursor_off_the_loop(tmp_path, monkeypatch):
+    checkpoint = CursorCheckpoint(tmp_path / "checkpoint.json", PACKAGE_ID)
+    written = []
+    save = checkpoint.save
+
+    def slow_save(cursor):
+        time.sleep(0.05)
+        written.append((cursor.map["eventSeq"], threading.current_thread()))
+        save(cursor)
+
+    monkeypatch.setattr(checkpoint, "save", slow_save)
+
+    async def scenario():
+        started = time.monotonic()
+        for seq in range(5):
+            checkpoint.save_soon(EventID(str(seq), f"tx{seq}"))
+            await asyncio.sleep(0)
+        # nothing waited for the disk
+        assert time.monotonic() - started < 0.05
+        await checkpoint.flush()
+
+    asyncio.run(scenario())
+    # the first write was under way, the ones in between are skipped
+    assert [seq for seq, _ in written] == ["0", "4"]
+    assert threading.main_thread() not in {thread for _, thread in written}
+    assert CursorCheckpoint(tmp_path / "checkpoint.json", PACKAGE_ID).load().map == {
+        "eventSeq": "4",
+        "txDigest": "tx4",
+    }
@@ -0,0 +1,82 @@
+"""
+tests for the completion cache
+To run, execute "PYTHONPATH=src pytest tests/test_completion_cache.py" from `events` directory
+"""
+
+from nexus_events.completion_cache import CompletionCache
+
+
+def test_only_applies_to_deterministic_requests():
+    assert CompletionCache(None).applies_to(0)
+    assert not CompletionCache(None).applies_to(0.7)
+    assert CompletionCache(None, any_temperature=True).applies_to(0.7)
+
+
+def test_keys_on_model_prompt_and_options():
+    key = CompletionCache.key("llama3.2:1b", "abc", 100, 0)
+    assert key == CompletionCache.key("llama3.2:1b", "abc", 100.0, 0.0)
+    assert key != CompletionCache.key("llama3.2:1b", "abc", 200, 0)
+    assert key != CompletionCache.key("llama3.2:1b", "abc", 100, 0.5)
+    assert key != CompletionCache.key("mistral", "abc", 100, 0)
+
+
+def test_keys_on_what_cut_the_completion_short():
+    key = CompletionCache.key("llama3.2:1b", "abc", 100, 0, stop=["\n\n", "END"])
+    assert key == CompletionCache.key("llama3.2:1b", "abc", 100, 0, ["END", "\n\n"])
+    assert key != CompletionCache.key("llama3.2:1b", "abc", 100, 0)
+    assert key != CompletionCache.key("llama3.2:1b", "abc", 100, 0, stop=["END"])
+    assert CompletionCache.key(
+        "llama3.2:1b", "abc", 100, 0, max_chars=200
+    ) != CompletionCache.key("llama3.2:1b", "abc", 100, 0, max_chars=300)
+
+
+def test_survives_restarts(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    cache = CompletionCache(path)
+    cache.put("a", "first")
+    cache.put("a", "second")
+    assert cache.get("a") == "second"
+    cache.close()
+
+    cache = CompletionCache(path)
+    assert cache.get("a") == "second"
+    assert cache.get("b") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+
+def test_falls_back_to_the_file_for_evicted_entries(tmp_path):
+    cache = CompletionCache(tmp_path / "cache.sqlite", memory_entries=1)
+    cache.put("a", "first")
+    cache.put("b", "second")
+    assert "a" not in cache._memory
+    assert cache.get("a") == "first"
+    assert list(cache._memory) == ["a"]
+    cache.close()
+
+
+def test_evicts_the_least_recently_used_from_the_file(tmp_path):
+    # room for two entries of 1 + 9 bytes
+    cache = CompletionCache(
+        tmp_path / "cache.sqlite", memory_entries=0, max_disk_bytes=25
+    )
+    cache.put("a", "x" * 9)
+    cache.put("b", "x" * 9)
+    assert cache.get("a") is not None
+    cache.put("c", "x" * 9)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    # too big to ever fit
+    cache.put("d", "x" * 100)
+    assert cache.get("d") is None
+    cache.close()
+
+
+def test_keeps_completions_in_memory_only_without_disk_space(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    cache = CompletionCache(path, max_disk_bytes=0)
+    cache.put("a", "first")
+    assert cache.get("a") == "first"
+    assert not path.exists()
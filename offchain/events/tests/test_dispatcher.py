@@ -0,0 +1,150 @@
+"""
+tests for the event dispatcher
+To run, execute "PYTHONPATH=src pytest tests/test_dispatcher.py" from `events` directory
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from nexus_events.dispatcher import EventDispatcher
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def event(seq, model="llama3.2:1b"):
+    return SimpleNamespace(
+        event_id={"txDigest": f"tx{seq}", "eventSeq": str(seq)}, model=model
+    )
+
+
+def test_commits_only_once_every_earlier_event_finished():
+    async def scenario():
+        done = {seq: asyncio.Event() for seq in range(3)}
+        committed = []
+
+        async def handler(e):
+            await done[int(e.event_id["eventSeq"])].wait()
+
+        dispatcher = EventDispatcher(
+            handler, max_inflight=3, on_commit=lambda c: committed.append(c.map)
+        )
+        for seq in range(3):
+            await dispatcher.dispatch(event(seq))
+
+        done[2].set()
+        done[1].set()
+        await asyncio.sleep(0.01)
+        assert committed == []
+        assert dispatcher.committed_cursor is None
+
+        done[0].set()
+        await dispatcher.drain()
+        # the cursor jumps straight to the last of the finished events
+        assert committed == [{"txDigest": "tx2", "eventSeq": "2"}]
+
+    run(scenario())
+
+
+def test_failed_handlers_still_move_the_cursor():
+    async def scenario():
+        async def handler(e):
+            raise RuntimeError("no luck")
+
+        dispatcher = EventDispatcher(handler, max_inflight=1)
+        await dispatcher.dispatch(event(0))
+        await dispatcher.drain()
+        return dispatcher.committed_cursor
+
+    assert run(scenario()).map == {"txDigest": "tx0", "eventSeq": "0"}
+
+
+def test_dispatches_every_event_once():
+    async def scenario():
+        handled = []
+
+        async def handler(e):
+            handled.append(e.event_id["txDigest"])
+            await asyncio.sleep(0.01)
+
+        dispatcher = EventDispatcher(handler, max_inflight=4, remember=2)
+        assert await dispatcher.dispatch(event(0))
+        # delivered again while running, and once it's finished
+        assert not await dispatcher.dispatch(event(0))
+        await dispatcher.drain()
+        assert not await dispatcher.dispatch(event(0))
+
+        # only the most recently finished events are remembered
+        for seq in (1, 2):
+            await dispatcher.dispatch(event(seq))
+            await dispatcher.drain()
+        assert await dispatcher.dispatch(event(0))
+        await dispatcher.drain()
+        return handled
+
+    assert run(scenario()) == ["tx0", "tx1", "tx2", "tx0"]
+
+
+def test_busy_model_doesnt_hold_up_other_models():
+    async def scenario():
+        finished = []
+        release_a = asyncio.Event()
+
+        async def handler(e):
+            if e.model == "a":
+                await release_a.wait()
+            finished.append(e.event_id["txDigest"])
+
+        dispatcher = EventDispatcher(
+            handler,
+            max_inflight=2,
+            max_inflight_per_model=1,
+            model_of=lambda e: e.model,
+        )
+        for seq in range(3):
+            await dispatcher.dispatch(event(seq, "a"))
+        await asyncio.wait_for(dispatcher.dispatch(event(3, "b")), 1)
+        await asyncio.sleep(0.05)
+
+        # a's events are queued behind its only slot, b still got a shared one
+        assert finished == ["tx3"]
+        release_a.set()
+        await dispatcher.drain()
+        assert finished == ["tx3", "tx0", "tx1", "tx2"]
+
+    run(scenario())
+
+
+def test_events_waiting_for_their_model_are_bounded():
+    async def scenario():
+        release = asyncio.Event()
+        running = []
+
+        async def handler(e):
+            running.append(e)
+            await release.wait()
+
+        dispatcher = EventDispatcher(
+            handler,
+            max_inflight=2,
+            max_inflight_per_model=1,
+            model_of=lambda e: e.model,
+            max_waiting=1,
+        )
+        await dispatcher.dispatch(event(0, "a"))
+        await dispatcher.dispatch(event(1, "a"))
+        await dispatcher.dispatch(event(2, "b"))
+
+        # one running per model, one waiting, nothing else is let in
+        blocked = asyncio.ensure_future(dispatcher.dispatch(event(3, "c")))
+        await asyncio.sleep(0.05)
+        assert not blocked.done()
+        assert len(running) == 2
+
+        release.set()
+        assert await asyncio.wait_for(blocked, 1)
+        await dispatcher.drain()
+        assert len(running) == 4
+
+    run(scenario())
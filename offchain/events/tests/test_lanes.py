@@ -0,0 +1,153 @@
+"""
+tests for the submission lanes
+To run, execute "PYTHONPATH=src pytest tests/test_lanes.py" from `events` directory
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import nexus_events.lanes as lanes_module
+from nexus_events.lanes import GAS_BUDGET, SubmissionLane, SubmissionLanes
+
+PACKAGE_ID = "0x" + "1" * 64
+OWNER_CAP = "0x" + "2" * 64
+MODEL_ID = "0x" + "3" * 64
+RESERVE = "0x" + "4" * 64
+
+
+def object_id(kind, i):
+    return "0x" + kind + f"{i}".rjust(63, "0")
+
+
+def ok(data):
+    return SimpleNamespace(is_err=lambda: False, is_ok=lambda: True, result_data=data)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class FakeChain:
+    """An account with gas coins and model owner caps."""
+
+    config = SimpleNamespace(active_address="0x" + "5" * 64)
+
+    def __init__(self, coins, caps=(OWNER_CAP,)):
+        self.coins = dict(coins)
+        self.caps = list(caps)
+        self.transactions = 0
+
+    async def get_gas(self, fetch_all):
+        coins = [
+            SimpleNamespace(coin_object_id=coin, balance=str(balance))
+            for coin, balance in self.coins.items()
+        ]
+        return ok(SimpleNamespace(data=coins))
+
+    async def get_object(self, object_id):
+        return ok(SimpleNamespace(content=SimpleNamespace(fields={"model": MODEL_ID})))
+
+    async def get_objects(self, fetch_all):
+        caps = [
+            SimpleNamespace(
+                object_id=cap,
+                object_type=f"{PACKAGE_ID}::model::ModelOwnerCap",
+                content=SimpleNamespace(fields={"model": MODEL_ID}),
+            )
+            for cap in self.caps
+        ]
+        return ok(SimpleNamespace(data=caps))
+
+    def transaction(self, client):
+        return FakeTransaction(self)
+
+
+class FakeTransaction:
+    gas = "gas"
+
+    def __init__(self, chain):
+        self.chain = chain
+        self.splits = []
+        self.clones = 0
+
+    async def split_coin(self, coin, amounts):
+        self.splits += amounts
+        return [f"part {i}" for i in range(len(amounts))]
+
+    async def move_call(self, target, arguments):
+        assert target == f"{PACKAGE_ID}::model::clone_owner_cap"
+        self.clones += 1
+
+    async def transfer_objects(self, transfers, recipient):
+        pass
+
+    async def execute(self, gas_budget, use_gas_object):
+        chain = self.chain
+        chain.transactions += 1
+        for amount in self.splits:
+            chain.coins[use_gas_object] -= amount
+            chain.coins[object_id("c", len(chain.coins))] = amount
+        for _ in range(self.clones):
+            chain.caps.append(object_id("a", len(chain.caps)))
+        return ok(None)
+
+
+def test_a_single_lane_needs_no_preparation():
+    lanes = SubmissionLanes(None, PACKAGE_ID, OWNER_CAP)
+
+    async def scenario():
+        await lanes.start()
+        async with lanes.lane() as lane:
+            return lane
+
+    assert run(scenario()) == SubmissionLane(owner_cap=OWNER_CAP)
+
+
+def test_gives_every_lane_its_own_coin_and_cap_by_default(monkeypatch):
+    chain = FakeChain({RESERVE: 100 * GAS_BUDGET})
+    monkeypatch.setattr(lanes_module, "AsyncTransaction", chain.transaction)
+    lanes = SubmissionLanes(chain, PACKAGE_ID, OWNER_CAP, lanes=3)
+
+    run(lanes.start())
+
+    assert lanes.clone_owner_caps
+    assert len({lane.gas_coin for lane in lanes.lanes}) == 3
+    assert RESERVE not in {lane.gas_coin for lane in lanes.lanes}
+    assert [lane.owner_cap for lane in lanes.lanes] == chain.caps
+    assert chain.caps[0] == OWNER_CAP and len(chain.caps) == 3
+    # one split, one clone
+    assert chain.transactions == 2
+
+    # clones are reused on later starts
+    lanes = SubmissionLanes(chain, PACKAGE_ID, OWNER_CAP, lanes=3)
+    run(lanes.start())
+    assert chain.transactions == 2
+
+
+def test_lanes_submit_in_parallel_with_their_own_caps(monkeypatch):
+    chain = FakeChain({RESERVE: 100 * GAS_BUDGET})
+    monkeypatch.setattr(lanes_module, "AsyncTransaction", chain.transaction)
+
+    async def scenario(clone_owner_caps):
+        lanes = SubmissionLanes(
+            chain, PACKAGE_ID, OWNER_CAP, lanes=3, clone_owner_caps=clone_owner_caps
+        )
+        await lanes.start()
+        using = []
+        most_using = []
+
+        async def submit():
+            async with lanes.lane() as lane:
+                using.append(lane)
+                most_using.append(len(using))
+                await asyncio.sleep(0.02)
+                using.remove(lane)
+                return lane
+
+        used = await asyncio.gather(*(submit() for _ in range(6)))
+        await lanes.stop()
+        return max(most_using), {lane.owner_cap for lane in used}
+
+    assert run(scenario(True)) == (3, set(chain.caps))
+    # sharing the cap, the lanes take turns
+    assert run(scenario(False)) == (1, {OWNER_CAP})
@@ -0,0 +1,143 @@
+"""
+tests for the pipeline of bounded stages
+To run, execute "PYTHONPATH=src pytest tests/test_pipeline.py" from `events` directory
+"""
+
+import asyncio
+
+import pytest
+
+from nexus_events.pipeline import Pipeline, Stage
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_runs_items_through_every_stage_in_order():
+    seen = {"double": [], "describe": []}
+
+    async def double(item):
+        seen["double"].append(item)
+        # the odd ones are done with
+        return item * 2 if item % 2 == 0 else None
+
+    async def describe(item):
+        seen["describe"].append(item)
+        return f"got {item}"
+
+    async def scenario():
+        pipeline = Pipeline([Stage("double", double), Stage("describe", describe)])
+        await pipeline.start()
+        results = await asyncio.gather(*(pipeline.run(i) for i in range(5)))
+        await pipeline.stop()
+        return results, pipeline.stats()
+
+    results, stats = run(scenario())
+    assert results == ["got 0", None, "got 4", None, "got 8"]
+    assert seen == {"double": [0, 1, 2, 3, 4], "describe": [0, 4, 8]}
+    assert stats["double"]["processed"] == 5
+    assert stats["describe"]["processed"] == 3
+
+
+def test_stages_work_concurrently():
+    running = []
+    most_running = []
+
+    async def slow(item):
+        running.append(item)
+        most_running.append(len(running))
+        await asyncio.sleep(0.02)
+        running.remove(item)
+        return item
+
+    async def scenario():
+        pipeline = Pipeline([Stage("slow", slow, workers=3)])
+        await pipeline.start()
+        await asyncio.gather(*(pipeline.run(i) for i in range(6)))
+        await pipeline.stop()
+
+    run(scenario())
+    assert max(most_running) == 3
+
+
+def test_a_slow_stage_holds_back_the_stages_before_it():
+    release = asyncio.Event()
+    decoded = []
+
+    async def decode(item):
+        decoded.append(item)
+        return item
+
+    async def submit(item):
+        await release.wait()
+        return item
+
+    async def scenario():
+        submit_stage = Stage("submit", submit, queue_size=1)
+        pipeline = Pipeline([Stage("decode", decode, queue_size=1), submit_stage])
+        await pipeline.start()
+        runs = [asyncio.ensure_future(pipeline.run(i)) for i in range(6)]
+        await asyncio.sleep(0.05)
+
+        # one item is submitted, one waits for submit, one waits in decode's
+        # worker for room, and one waits in decode's queue
+        assert decoded == [0, 1, 2]
+        assert submit_stage.depth == 1
+        room = asyncio.ensure_future(submit_stage.wait_for_room())
+        await asyncio.sleep(0.01)
+        assert not room.done()
+
+        release.set()
+        results = await asyncio.gather(*runs)
+        await asyncio.wait_for(room, 1)
+        await pipeline.stop()
+        return results
+
+    assert run(scenario()) == list(range(6))
+    assert decoded == list(range(6))
+
+
+def test_failures_reach_the_caller_and_other_items_go_on():
+    async def check(item):
+        if item == "bad":
+            raise ValueError("can't decode this")
+        return item
+
+    async def scenario():
+        pipeline = Pipeline([Stage("check", check), Stage("echo", asyncio.sleep)])
+        await pipeline.start()
+        with pytest.raises(ValueError, match="can't decode this"):
+            await pipeline.run("bad")
+        result = await pipeline.run(0)
+        await pipeline.stop()
+        return result, pipeline.stats()["check"]
+
+    result, stats = run(scenario())
+    assert result is None
+    assert (stats["processed"], stats["failed"]) == (1, 1)
+
+
+def test_stopping_cancels_queued_items():
+    async def stuck(item):
+        await asyncio.Event().wait()
+
+    async def scenario():
+        pipeline = Pipeline([Stage("stuck", stuck, queue_size=4)])
+        await pipeline.start()
+        runs = [asyncio.ensure_future(pipeline.run(i)) for i in range(3)]
+        await asyncio.sleep(0.01)
+        await pipeline.stop()
+        return await asyncio.gather(*runs, return_exceptions=True)
+
+    results = run(scenario())
+    assert all(isinstance(r, asyncio.CancelledError) for r in results)
+
+
+def test_needs_workers_and_room():
+    with pytest.raises(ValueError):
+        Stage("decode", asyncio.sleep, workers=0)
+    with pytest.raises(ValueError):
+        Stage("decode", asyncio.sleep, queue_size=0)
+    with pytest.raises(ValueError):
+        Pipeline([])
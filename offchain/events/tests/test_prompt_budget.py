@@ -0,0 +1,168 @@
+"""
+tests for fitting tool results into the model's context window
+To run, execute "PYTHONPATH=src pytest tests/test_prompt_budget.py" from `events` directory
+"""
+
+import asyncio
+import json
+import string
+from types import SimpleNamespace
+
+from nexus_events.prompt_budget import (
+    TEMPLATE_TOKENS,
+    TRUNCATION_MARKER,
+    ContextLengths,
+    PromptAssembler,
+    _segments,
+    _truncate,
+    estimate_tokens,
+    fit_context,
+)
+
+MODEL_ID = "0x" + "1" * 64
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class FakeContextLengths:
+    def __init__(self, length):
+        self.length = length
+
+    async def get(self, model_id):
+        return self.length
+
+
+class FakeClient:
+    """Answers `get_object` for a `Model` object with the given context length."""
+
+    def __init__(self, max_context_length):
+        self.max_context_length = max_context_length
+        self.reads = 0
+
+    async def get_object(self, object_id):
+        self.reads += 1
+        await asyncio.sleep(0.01)
+        fields = {"info": {"fields": {"max_context_length": self.max_context_length}}}
+        return SimpleNamespace(
+            is_err=lambda: False,
+            result_data=SimpleNamespace(content=SimpleNamespace(fields=fields)),
+        )
+
+
+def test_keeps_context_that_fits():
+    context = "Sui is a blockchain.\nSui is a blockchain."
+    assert fit_context(context, len(context), len) == context
+
+
+def test_drops_everything_without_a_budget():
+    assert fit_context("Sui is a blockchain.", 0, len) == ""
+    assert fit_context("Sui is a blockchain.", -5, len) == ""
+
+
+def test_drops_repeated_segments_first():
+    context = "Move is safe.\nmove IS  safe.\nSui is fast! Move is safe."
+    # repeats are compared ignoring case and whitespace, the first one stays
+    assert fit_context(context, 30, len) == "Move is safe.\nSui is fast!"
+
+
+def test_drops_boilerplate_then():
+    context = (
+        "Move is a language for smart contracts.\n"
+        "We use cookies to improve your experience.\n"
+        "https://example.com/move\n"
+        "Sui executes Move."
+    )
+    content = "Move is a language for smart contracts.\nSui executes Move."
+    assert fit_context(context, len(content), len) == content
+
+
+def test_keeps_long_segments_that_look_like_boilerplate():
+    segment = "Newsletter " + "x" * 250
+    context = f"{segment}\n{segment}\nCookies."
+    assert fit_context(context, len(segment), len) == segment
+
+
+def test_truncates_the_middle_keeping_twice_as_much_head_as_tail():
+    context = string.ascii_letters + string.digits
+    truncated = _truncate(context, len(TRUNCATION_MARKER) + 30, len)
+    assert truncated == context[:20] + TRUNCATION_MARKER + context[-10:]
+    assert fit_context(context, len(TRUNCATION_MARKER) + 30, len) == truncated
+
+
+def test_truncates_to_nothing_if_only_the_marker_fits():
+    assert _truncate("Sui is a blockchain.", len(TRUNCATION_MARKER), len) == ""
+    assert _truncate("Sui is a blockchain.", len(TRUNCATION_MARKER) + 1, len) == (
+        "S" + TRUNCATION_MARKER
+    )
+
+
+def test_truncation_fits_any_counter():
+    context = " ".join(f"word{i}" for i in range(500))
+    for budget in (10, 57, 200):
+        truncated = _truncate(context, budget, estimate_tokens)
+        assert estimate_tokens(truncated) <= budget
+        assert truncated.startswith("word0 ")
+
+
+def test_flattens_json_into_its_values():
+    context = json.dumps(
+        {
+            "query": "sui",
+            "results": [
+                {"title": "Sui", "content": "Move is fast. It is safe."},
+                {"score": 0.5, "verified": True, "image": None},
+            ],
+        }
+    )
+    assert _segments(context) == ["sui", "Sui", "Move is fast.", "It is safe.", "0.5"]
+    assert _segments("Not JSON.\n\n  Spaced   out ") == ["Not JSON.", "Spaced out"]
+
+
+def test_assembles_the_whole_context_without_a_context_length():
+    assembler = PromptAssembler(FakeContextLengths(None))
+    prompt = run(assembler.assemble("Why?", "search", "x" * 10_000, "m", None, 100))
+    assert prompt == "context fromsearch: " + "x" * 10_000 + ". Why?"
+
+
+def test_assembles_a_prompt_that_fits_the_context_length():
+    context = " ".join(f"Sentence number {i}." for i in range(2000))
+    assembler = PromptAssembler(FakeContextLengths(1000))
+    prompt = run(assembler.assemble("Why?", "search", context, "m", MODEL_ID, 200))
+
+    assert prompt.startswith("context fromsearch: Sentence number 0.\n")
+    assert TRUNCATION_MARKER in prompt
+    assert prompt.endswith("Sentence number 1999.. Why?")
+    assert estimate_tokens(prompt) <= 1000 - 200 - TEMPLATE_TOKENS
+
+
+def test_leaves_out_context_that_has_no_room():
+    assembler = PromptAssembler(FakeContextLengths(100))
+    prompt = run(assembler.assemble("Why?", "search", "Sui.", "m", MODEL_ID, 100))
+    assert prompt == "Why?"
+
+
+def test_reads_every_model_once():
+    client = FakeClient("4096")
+    lengths = ContextLengths(client, default=2048)
+
+    async def scenario():
+        first = await asyncio.gather(*(lengths.get(MODEL_ID) for _ in range(5)))
+        return first + [await lengths.get(MODEL_ID), await lengths.get(None)]
+
+    assert run(scenario()) == [4096] * 6 + [2048]
+    assert client.reads == 1
+
+
+def test_says_once_that_token_counts_are_estimated(capsys, monkeypatch):
+    monkeypatch.setattr("nexus_events.prompt_budget.find_spec", lambda name: None)
+    assembler = PromptAssembler(
+        FakeContextLengths(1000), tokenizers={"m": "meta-llama/Llama-3.2-1B"}
+    )
+    assert "prompt token counts are estimated" in capsys.readouterr().out
+
+    run(assembler.assemble("Why?", "search", "Sui.", "m", MODEL_ID, 100))
+    assert run(assembler.counter("m")) is estimate_tokens
+    # not again for every model
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,124 @@
+"""
+tests for skipping requests whose task was already completed
+To run, execute "PYTHONPATH=src pytest tests/test_staleness.py" from `events` directory
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from nexus_events.staleness import ExecutionStatusChecker, StaleRequest
+
+
+def execution(i):
+    return "0x" + f"{i:x}".rjust(64, "0")
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class FakeClient:
+    """Knows, for every execution, the last transaction that modified it."""
+
+    def __init__(self, executions):
+        self.executions = executions
+        self.reads = []
+
+    async def get_objects_for(self, object_ids):
+        self.reads.append(sorted(i.value for i in object_ids))
+        data = [
+            SimpleNamespace(
+                object_id=object_id,
+                previous_transaction=previous_tx,
+                content=SimpleNamespace(
+                    fields={"status": status, "current_task": "next task"}
+                ),
+            )
+            for object_id, (previous_tx, status) in self.executions.items()
+            if object_id in {i.value for i in object_ids}
+        ]
+        return SimpleNamespace(is_err=lambda: False, result_data=data)
+
+
+def test_batches_concurrent_reads():
+    client = FakeClient(
+        {
+            execution(1): ("tx1", "RUNNING"),
+            execution(2): ("tx3", "RUNNING"),
+            execution(3): ("tx3", "SUCCESS"),
+        }
+    )
+    checker = ExecutionStatusChecker(client, batch_window=0.05)
+
+    async def scenario():
+        return await asyncio.gather(
+            checker.is_stale(execution(1), "tx1"),
+            checker.is_stale(execution(1), "tx1"),
+            # modified since by another transaction
+            checker.is_stale(execution(2), "tx2"),
+            # finished in the very transaction that emitted the request
+            checker.is_stale(execution(3), "tx3"),
+            # not found, rather do the work than drop it
+            checker.is_stale(execution(4), "tx4"),
+        )
+
+    assert run(scenario()) == [False, False, True, True, False]
+    assert client.reads == [sorted(execution(i) for i in range(1, 5))]
+
+
+def test_flushes_full_batches_right_away():
+    client = FakeClient({})
+    checker = ExecutionStatusChecker(client, batch_window=10, max_batch=2)
+
+    async def scenario():
+        await asyncio.wait_for(
+            asyncio.gather(*(checker.is_stale(execution(i), "tx") for i in range(2))),
+            1,
+        )
+
+    run(scenario())
+    assert len(client.reads) == 1
+
+
+def test_cancels_work_once_the_execution_moved_on():
+    client = FakeClient({execution(1): ("tx1", "RUNNING")})
+    checker = ExecutionStatusChecker(client, recheck_interval=0.02, batch_window=0)
+    cancelled = asyncio.Event()
+
+    async def inference():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def scenario():
+        work = asyncio.ensure_future(
+            checker.run_while_current(inference(), execution(1), "tx1")
+        )
+        await asyncio.sleep(0.05)
+        assert not work.done()
+        # someone else submitted the completion
+        client.executions[execution(1)] = ("tx2", "RUNNING")
+        with pytest.raises(StaleRequest):
+            await asyncio.wait_for(work, 1)
+
+    run(scenario())
+    assert cancelled.is_set()
+
+
+def test_passes_through_work_of_current_executions():
+    client = FakeClient({execution(1): ("tx1", "RUNNING")})
+    checker = ExecutionStatusChecker(client, recheck_interval=0.01, batch_window=0)
+
+    async def inference():
+        await asyncio.sleep(0.05)
+        return "completion"
+
+    async def scenario():
+        return await checker.run_while_current(inference(), execution(1), "tx1")
+
+    assert run(scenario()) == "completion"
+    assert len(client.reads) >= 2
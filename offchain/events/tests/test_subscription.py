@@ -0,0 +1,194 @@
+"""
+tests for the websocket event subscription
+To run, execute "PYTHONPATH=src pytest tests/test_subscription.py" from `events` directory
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from pysui.sui.sui_txresults.complex_tx import Event
+from pysui.sui.sui_types.event_filter import MoveEventTypeQuery
+
+import nexus_events.subscription as subscription_module
+from nexus_events.subscription import (
+    FALLBACK_ERRORS,
+    EventSubscription,
+    SubscriptionClosed,
+)
+
+EVENT_TYPE = "0x1::cluster::RequestForCompletionEvent"
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def event(seq):
+    return {
+        "bcs": "",
+        "packageId": "0x1",
+        "parsedJson": {"model_name": "llama3.2:1b"},
+        "sender": "0x2",
+        "transactionModule": "cluster",
+        "type": EVENT_TYPE,
+        "id": {"txDigest": f"tx{seq}", "eventSeq": str(seq)},
+    }
+
+
+def pushed(seq):
+    return json.dumps(
+        {
+            "jsonrpc": "2.0",
+            "method": "suix_subscribeEvent",
+            "params": {"subscription": 7, "result": event(seq)},
+        }
+    )
+
+
+class FakeSocket:
+    """Confirms the subscription, pushes `messages` and then closes."""
+
+    def __init__(self, messages=(), confirmation=None, stay_open=False):
+        self.messages = list(messages)
+        self.confirmation = confirmation or {"jsonrpc": "2.0", "id": 1, "result": 7}
+        self.stay_open = stay_open
+        self.sent = []
+        self.closed = False
+
+    async def send(self, message):
+        self.sent.append(json.loads(message))
+
+    async def recv(self):
+        return json.dumps(self.confirmation)
+
+    async def close(self):
+        self.closed = True
+
+    async def __aiter__(self):
+        for message in self.messages:
+            yield message
+        if self.stay_open:
+            await asyncio.Event().wait()
+
+
+def connecting_to(monkeypatch, *sockets):
+    """Every connection gets the next socket, or raises it if it's an error."""
+    sockets = list(sockets)
+
+    async def connect(url, **kwargs):
+        socket = sockets.pop(0)
+        if isinstance(socket, BaseException):
+            raise socket
+        return socket
+
+    monkeypatch.setattr(subscription_module.websockets, "connect", connect)
+
+
+def test_delivers_pushed_events(monkeypatch):
+    socket = FakeSocket(
+        [pushed(0), json.dumps({"jsonrpc": "2.0", "id": 2, "result": True}), pushed(1)],
+        stay_open=True,
+    )
+    connecting_to(monkeypatch, socket)
+
+    async def scenario():
+        subscription = EventSubscription("ws://node", MoveEventTypeQuery(EVENT_TYPE))
+        async with subscription:
+            return [(await subscription.next_event()).event_id for _ in range(2)]
+
+    assert run(scenario()) == [
+        {"txDigest": "tx0", "eventSeq": "0"},
+        {"txDigest": "tx1", "eventSeq": "1"},
+    ]
+    assert socket.sent[0]["method"] == "suix_subscribeEvent"
+    assert socket.sent[0]["params"] == [{"MoveEventType": EVENT_TYPE}]
+    assert socket.closed
+
+
+def test_raises_a_fallback_error_once_the_socket_closes(monkeypatch):
+    connecting_to(monkeypatch, FakeSocket([pushed(0)]))
+
+    async def scenario():
+        async with EventSubscription(
+            "ws://node", MoveEventTypeQuery(EVENT_TYPE)
+        ) as subscription:
+            await subscription.next_event()
+            with pytest.raises(FALLBACK_ERRORS):
+                await subscription.next_event()
+
+    run(scenario())
+
+
+def test_raises_a_fallback_error_if_the_subscription_is_rejected(monkeypatch):
+    socket = FakeSocket(confirmation={"jsonrpc": "2.0", "id": 1, "error": "no"})
+    connecting_to(monkeypatch, socket)
+
+    async def scenario():
+        async with EventSubscription("ws://node", MoveEventTypeQuery(EVENT_TYPE)):
+            pass
+
+    with pytest.raises(SubscriptionClosed):
+        run(scenario())
+    assert socket.closed
+
+
+class FakeClient:
+    """Answers event queries with the given pages, then with empty ones."""
+
+    def __init__(self, pages):
+        self.pages = list(pages)
+
+    async def execute(self, query):
+        # longer than polling lasts before resubscribing
+        await asyncio.sleep(0.02)
+        page = self.pages.pop(0) if self.pages else []
+        data = SimpleNamespace(data=[Event.from_dict(event(seq)) for seq in page])
+        return SimpleNamespace(is_err=lambda: False, result_data=data)
+
+
+def test_follows_the_subscription_through_reconnects(monkeypatch):
+    # the listener imports the tool schema
+    pytest.importorskip("nexus_tools")
+    import nexus_events.sui_event as sui_event
+    from nexus_events.dispatcher import EventDispatcher
+
+    monkeypatch.setattr(sui_event, "RESUBSCRIBE_INTERVAL_SECONDS", 0.01)
+    connecting_to(
+        monkeypatch,
+        # event 0 was backfilled already
+        FakeSocket([pushed(0), pushed(2)]),
+        ConnectionRefusedError("node is restarting"),
+        FakeSocket([pushed(5)], stay_open=True),
+    )
+    client = FakeClient(
+        [
+            # backfill, until there's nothing left
+            [0, 1],
+            [],
+            # polling while the socket is down, twice
+            [3],
+            [3, 4],
+        ]
+    )
+    handled = []
+
+    async def handler(e):
+        handled.append(int(e.event_id["eventSeq"]))
+
+    async def scenario():
+        dispatcher = EventDispatcher(handler, max_inflight=4)
+        following = asyncio.ensure_future(
+            sui_event.follow_subscription(
+                client, "0x1", "ws://node", dispatcher, cursor=None
+            )
+        )
+        while len(handled) < 6:
+            await asyncio.sleep(0.01)
+        following.cancel()
+        await asyncio.gather(following, return_exceptions=True)
+        await dispatcher.drain()
+
+    run(asyncio.wait_for(scenario(), 5))
+    assert handled == [0, 1, 2, 3, 4, 5]
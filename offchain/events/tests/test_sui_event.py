@@ -0,0 +1,135 @@
+"""
+tests for the listener's event handler
+To run, execute "PYTHONPATH=src:../tools/src pytest tests/test_sui_event.py" from `events` directory
+"""
+
+import asyncio
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("nexus_tools")
+
+import nexus_events.sui_event as sui_event
+from nexus_events.sui_event import CompletionJob, PromptEventHandler
+from nexus_events.work_queue import STATE_DEAD, STATE_RETRY, WorkQueue
+
+REQUEST = {
+    "cluster_execution": "0x1",
+    "model_name": "llama3.2:1b",
+    "prompt_contents": "Why?",
+    "prompt_hash": [1, 2, 3],
+    "max_tokens": 100,
+    "temperature": 0,
+    "tool": None,
+}
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def event(seq=0):
+    return SimpleNamespace(
+        event_id={"txDigest": "tx", "eventSeq": str(seq)}, parsed_json=repr(REQUEST)
+    )
+
+
+def handler_for(queue):
+    return PromptEventHandler(None, "0x2", "0x3", "http://tools", work_queue=queue)
+
+
+def test_retries_failed_generations(tmp_path, monkeypatch):
+    queue = WorkQueue(tmp_path / "queue.sqlite", base_delay=0)
+    handler = handler_for(queue)
+    submitted = []
+    generations = []
+
+    async def aprocess(prompt, *args, **kwargs):
+        generations.append(prompt)
+        if len(generations) == 1:
+            raise asyncio.TimeoutError("inference timed out")
+        return json.dumps({"message": {"content": "Because."}})
+
+    async def submit(job):
+        submitted.append(json.loads(job.completion)["message"]["content"])
+        return {"func": "ok"}
+
+    monkeypatch.setattr(sui_event.off_chain, "aprocess", aprocess)
+    monkeypatch.setattr(sui_event, "RETRY_POLL_INTERVAL_SECONDS", 0.01)
+    monkeypatch.setattr(handler, "_submit", submit)
+
+    async def scenario():
+        assert await handler(event()) is None
+        row = queue.pending()[0]
+        assert (row["state"], row["last_error"]) == (STATE_RETRY, "inference timed out")
+
+        retrying = asyncio.ensure_future(sui_event.retry_submissions(handler, queue))
+        await asyncio.sleep(0.1)
+        retrying.cancel()
+
+    run(scenario())
+    assert generations == ["Why?", "Why?"]
+    assert submitted == ["Because."]
+    assert queue.pending() == []
+    queue.close()
+
+
+def test_raises_failed_generations_without_a_work_queue(monkeypatch):
+    async def aprocess(*args, **kwargs):
+        raise asyncio.TimeoutError("inference timed out")
+
+    monkeypatch.setattr(sui_event.off_chain, "aprocess", aprocess)
+    job = CompletionJob("tx:0", "tx", "0x1", "llama3.2:1b", "Why?", "00", 100, 0.0)
+    with pytest.raises(asyncio.TimeoutError):
+        run(handler_for(None).infer(job))
+
+
+def test_skips_dead_letters(tmp_path):
+    queue = WorkQueue(tmp_path / "queue.sqlite", max_attempts=1)
+    handler = handler_for(queue)
+
+    async def scenario():
+        job = await handler.decode(event())
+        queue.failed(job.key, "no gas")
+        assert queue.dead_letters()[0]["state"] == STATE_DEAD
+        # the event is delivered again, e.g. after a restart from genesis
+        return await handler.decode(event())
+
+    assert run(scenario()) is None
+    assert queue.pending() == []
+    queue.close()
+
+
+def test_records_requests_without_blocking_the_loop(tmp_path):
+    queue = WorkQueue(tmp_path / "queue.sqlite")
+    handler = handler_for(queue)
+
+    async def scenario():
+        # another thread is busy with the file
+        queue._lock.acquire()
+        threading.Timer(0.3, queue._lock.release).start()
+
+        gaps = []
+
+        async def tick():
+            last = time.monotonic()
+            while True:
+                await asyncio.sleep(0.01)
+                now = time.monotonic()
+                gaps.append(now - last)
+                last = now
+
+        ticker = asyncio.ensure_future(tick())
+        job = await handler.decode(event())
+        ticker.cancel()
+        return job, gaps
+
+    job, gaps = run(scenario())
+    assert job.key == "tx:0"
+    assert max(gaps) < 0.2
+    assert [r["key"] for r in queue.pending()] == ["tx:0"]
+    queue.close()
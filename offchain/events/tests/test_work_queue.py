@@ -0,0 +1,137 @@
+"""
+tests for the durable queue of requests being worked on
+To run, execute "PYTHONPATH=src pytest tests/test_work_queue.py" from `events` directory
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from nexus_events.work_queue import (
+    STATE_ACCEPTED,
+    STATE_DEAD,
+    STATE_GENERATED,
+    STATE_RETRY,
+    WorkQueue,
+)
+
+REQUEST = {"cluster_execution_id": "0x1", "model_name": "llama3.2:1b"}
+
+
+def test_remembers_progress_across_restarts(tmp_path):
+    path = tmp_path / "queue.sqlite"
+    queue = WorkQueue(path)
+    assert queue.accept("a", REQUEST) is None
+    queue.record_tool_result("a", "tool says hi")
+    queue.record_completion("a", "hi")
+    queue.close()
+
+    queue = WorkQueue(path)
+    row = queue.accept("a", REQUEST)
+    assert row["request"] == REQUEST
+    assert row["tool_result"] == "tool says hi"
+    assert (row["completion"], row["state"]) == ("hi", STATE_GENERATED)
+
+    queue.accept("b", REQUEST)
+    assert [r["state"] for r in queue.pending()] == [STATE_GENERATED, STATE_ACCEPTED]
+    queue.done("a")
+    assert [r["key"] for r in queue.pending()] == ["b"]
+    queue.close()
+
+
+def test_backs_off_exponentially(tmp_path):
+    queue = WorkQueue(
+        tmp_path / "queue.sqlite", max_attempts=10, base_delay=10, max_delay=30
+    )
+    queue.accept("a", REQUEST)
+
+    delays = []
+    for attempt in range(4):
+        before = time.time()
+        assert not queue.failed("a", f"attempt {attempt} failed")
+        row = queue.pending()[0]
+        delays.append(round(row["next_attempt"] - before))
+    assert delays == [10, 20, 30, 30]
+    assert (row["state"], row["attempts"]) == (STATE_RETRY, 4)
+    assert row["last_error"] == "attempt 3 failed"
+    # none of the attempts is due yet
+    assert queue.due() == []
+    queue.close()
+
+
+def test_retries_are_due_after_their_delay(tmp_path):
+    queue = WorkQueue(tmp_path / "queue.sqlite", base_delay=0)
+    queue.accept("a", REQUEST)
+    queue.accept("b", REQUEST)
+    queue.failed("a", "no gas")
+    assert [r["key"] for r in queue.due()] == ["a"]
+    queue.close()
+
+
+def test_moves_requests_out_of_attempts_to_the_dead_letters(tmp_path):
+    queue = WorkQueue(tmp_path / "queue.sqlite", max_attempts=2, base_delay=0)
+    for key in ("a", "b"):
+        queue.accept(key, REQUEST)
+        queue.record_completion(key, f"completion {key}")
+        assert not queue.failed(key, "timeout")
+        assert queue.failed(key, "still a timeout")
+
+    assert queue.pending() == []
+    dead = queue.dead_letters()
+    assert [r["key"] for r in dead] == ["a", "b"]
+    assert dead[0]["attempts"] == 2
+    assert dead[0]["last_error"] == "still a timeout"
+    assert dead[0]["completion"] == "completion a"
+    assert dead[0]["state"] == STATE_DEAD
+    # a dead letter delivered again isn't accepted as a new request
+    assert queue.accept("a", REQUEST)["state"] == STATE_DEAD
+    assert queue.pending() == []
+    # nothing left to fail
+    assert not queue.failed("a", "again")
+    queue.close()
+
+
+def test_requeues_dead_letters(tmp_path):
+    queue = WorkQueue(tmp_path / "queue.sqlite", max_attempts=1)
+    for key in ("a", "b", "c"):
+        queue.accept(key, REQUEST)
+        queue.record_completion(key, f"completion {key}")
+        queue.failed(key, "timeout")
+
+    assert queue.requeue("b") == 1
+    assert queue.requeue("b") == 0
+    due = queue.due()
+    assert [r["key"] for r in due] == ["b"]
+    # submitted again with the stored completion, and all its attempts
+    assert (due[0]["completion"], due[0]["attempts"]) == ("completion b", 0)
+
+    assert queue.requeue() == 2
+    assert queue.dead_letters() == []
+    assert sorted(r["key"] for r in queue.due()) == ["a", "b", "c"]
+    queue.close()
+
+
+def test_needs_an_attempt(tmp_path):
+    with pytest.raises(ValueError):
+        WorkQueue(tmp_path / "queue.sqlite", max_attempts=0)
+
+
+def test_takes_calls_from_several_threads(tmp_path):
+    queue = WorkQueue(tmp_path / "queue.sqlite")
+
+    async def scenario():
+        await asyncio.gather(
+            *(asyncio.to_thread(queue.accept, str(i), REQUEST) for i in range(50))
+        )
+        await asyncio.gather(
+            *(
+                asyncio.to_thread(queue.record_completion, str(i), "hi")
+                for i in range(50)
+            )
+        )
+
+    asyncio.run(scenario())
+    assert len(queue.pending()) == 50
+    assert {r["state"] for r in queue.pending()} == {STATE_GENERATED}
+    queue.close()
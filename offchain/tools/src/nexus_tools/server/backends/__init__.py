@@ -0,0 +1,50 @@
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from .base import BackendError, InferenceBackend
+
+
+def create_backend(config: Dict[str, Any]) -> InferenceBackend:
+    """
+    Creates a backend from its configuration, e.g.
+
+    - `{"type": "ollama", "host": "http://localhost:11434"}`
+    - `{"type": "openai", "base_url": "http://localhost:8000", "models": ["mistral"]}`
+    - `{"type": "llama_cpp", "models": {"mistral": "/models/mistral.gguf"}}`
+
+    Every backend accepts a list of `models` it's limited to, otherwise it
+    serves whatever models it has.
+    """
+    config = dict(config)
+    kind = config.pop("type", "ollama")
+    models = config.pop("models", None)
+
+    if kind == "ollama":
+        from .ollama import OllamaBackend
+
+        backend = OllamaBackend(**config)
+        backend.models = set(models) if models else None
+        return backend
+    if kind == "openai":
+        from .openai_compatible import OpenAICompatibleBackend
+
+        return OpenAICompatibleBackend(models=models, **config)
+    if kind == "llama_cpp":
+        from .llama_cpp import LlamaCppBackend
+
+        return LlamaCppBackend(models=models, **config)
+
+    raise ValueError(f"Unknown inference backend type {kind}")
+
+
+def load_backends(path: Optional[str] = None) -> Optional[List[InferenceBackend]]:
+    """
+    Creates the backends listed in the JSON file at `path`, by default
+    `INFERENCE_BACKENDS_FILE`, or returns None if none is configured.
+    """
+    path = path or os.getenv("INFERENCE_BACKENDS_FILE")
+    if not path:
+        return None
+    with open(path) as f:
+        return [create_backend(config) for config in json.load(f)]
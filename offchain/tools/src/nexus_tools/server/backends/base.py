@@ -0,0 +1,72 @@
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+
+class BackendError(Exception):
+    """
+    A backend failed to handle a request.
+
+    Like with HTTP, a `status_code` below 500 means the request was at fault,
+    e.g. asked for an unknown model, rather than the backend.
+    """
+
+    def __init__(self, message: str, status_code: int = 500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class InferenceBackend(ABC):
+    """
+    Something that generates completions, e.g. an Ollama server.
+
+    Responses use Ollama's shapes regardless of the backend, so callers don't
+    need to care which backend served them:
+    - `chat` returns `{"model", "message": {"role", "content"}, "done": True}`
+      plus `eval_count` and `eval_duration` (in nanoseconds) if known
+    - `stream` yields the same with a piece of the content and `"done": False`,
+      and a last chunk with `"done": True` and the statistics
+    - `list_models` returns `{"name", "model", ...}` for every model served
+
+    `models` are the models the backend is configured to serve, or None if
+    they're discovered with `list_models`.
+
+    Backends that can generate several prompts in a single request set
+    `supports_batching` and implement `chat_batch`.
+    """
+
+    name: str
+    models: Optional[Set[str]] = None
+    supports_batching: bool = False
+
+    @abstractmethod
+    async def chat(
+        self, model: str, messages: List[Dict[str, Any]], options: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Generates the whole completion."""
+
+    @abstractmethod
+    def stream(
+        self, model: str, messages: List[Dict[str, Any]], options: Dict[str, Any]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Generates the completion piece by piece."""
+
+    async def chat_batch(
+        self, model: str, prompts: List[str], options: Dict[str, Any]
+    ) -> List[Dict[str, Any]]:
+        """Generates the completions of several prompts in one request, in order."""
+        raise NotImplementedError(f"Backend {self.name} doesn't batch requests")
+
+    @abstractmethod
+    async def list_models(self) -> List[Dict[str, Any]]:
+        """The models the backend serves."""
+
+    async def loaded_models(self) -> List[Dict[str, Any]]:
+        """The models the backend currently has in memory."""
+        return []
+
+    @abstractmethod
+    async def embeddings(self, model: str, input: List[str]) -> List[List[float]]:
+        """One embedding vector per input text."""
+
+    async def close(self):
+        pass
@@ -0,0 +1,195 @@
+import asyncio
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from .base import BackendError, InferenceBackend
+
+_DONE = object()
+
+
+class LlamaCppBackend(InferenceBackend):
+    """
+    Serves GGUF models in process with llama.cpp, without any HTTP in between.
+
+    `models` maps the model names it serves to their GGUF files.
+    Each model is loaded once, on its first request, and kept in memory.
+    llama.cpp isn't thread safe, so a model generates one completion at a
+    time, in a worker thread to keep the event loop free.
+
+    Requires the optional `llama-cpp-python` package.
+    """
+
+    def __init__(
+        self,
+        models: Dict[str, str],
+        n_ctx: int = 4096,
+        n_threads: Optional[int] = None,
+        n_gpu_layers: int = 0,
+        name: str = "llama.cpp",
+    ):
+        if not models:
+            raise ValueError("At least one model is required")
+
+        self.name = name
+        self.paths = dict(models)
+        self.models = set(self.paths)
+        self.n_ctx = n_ctx
+        self.n_threads = n_threads
+        self.n_gpu_layers = n_gpu_layers
+        self._llamas: Dict[Tuple[str, bool], Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._loading = threading.Lock()
+
+    async def chat(
+        self, model: str, messages: List[Dict[str, Any]], options: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        def generate():
+            with self._lock(model):
+                started = time.monotonic()
+                result = self._llama(model).create_chat_completion(
+                    messages=messages, **_completion_args(options)
+                )
+                return result, time.monotonic() - started
+
+        result, seconds = await asyncio.to_thread(generate)
+        choice = result["choices"][0]
+        usage = result.get("usage") or {}
+        return {
+            "model": model,
+            "message": {
+                "role": "assistant",
+                "content": choice["message"].get("content") or "",
+            },
+            "done": True,
+            "done_reason": choice.get("finish_reason"),
+            "prompt_eval_count": usage.get("prompt_tokens"),
+            "eval_count": usage.get("completion_tokens"),
+            "eval_duration": int(seconds * 1e9),
+        }
+
+    async def stream(
+        self, model: str, messages: List[Dict[str, Any]], options: Dict[str, Any]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue()
+        stopped = threading.Event()
+
+        def generate():
+            try:
+                with self._lock(model):
+                    for chunk in self._llama(model).create_chat_completion(
+                        messages=messages, stream=True, **_completion_args(options)
+                    ):
+                        if stopped.is_set():
+                            break
+                        loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+            except Exception as e:
+                loop.call_soon_threadsafe(chunks.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(chunks.put_nowait, _DONE)
+
+        worker = loop.run_in_executor(None, generate)
+        first_token = None
+        count = 0
+        finish_reason = None
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is _DONE:
+                    break
+                if isinstance(chunk, Exception):
+                    raise BackendError(str(chunk)) from chunk
+
+                choice = chunk["choices"][0]
+                finish_reason = choice.get("finish_reason") or finish_reason
+                content = choice.get("delta", {}).get("content")
+                if not content:
+                    continue
+                if first_token is None:
+                    first_token = time.monotonic()
+                count += 1
+                yield {
+                    "model": model,
+                    "message": {"role": "assistant", "content": content},
+                    "done": False,
+                }
+        finally:
+            # stops generating if whoever streams gave up
+            stopped.set()
+            await asyncio.wait([worker])
+
+        seconds = time.monotonic() - first_token if first_token else 0
+        yield {
+            "model": model,
+            "message": {"role": "assistant", "content": ""},
+            "done": True,
+            "done_reason": finish_reason,
+            "eval_count": count,
+            "eval_duration": int(seconds * 1e9),
+        }
+
+    async def list_models(self) -> List[Dict[str, Any]]:
+        return [
+            {"name": name, "model": name, "path": path}
+            for name, path in sorted(self.paths.items())
+        ]
+
+    async def loaded_models(self) -> List[Dict[str, Any]]:
+        return [
+            {"name": name, "model": name}
+            for name, embedding in self._llamas
+            if not embedding
+        ]
+
+    async def embeddings(self, model: str, input: List[str]) -> List[List[float]]:
+        def embed():
+            with self._lock(model):
+                return self._llama(model, embedding=True).embed(input)
+
+        return await asyncio.to_thread(embed)
+
+    async def close(self):
+        for llama in self._llamas.values():
+            llama.close()
+        self._llamas.clear()
+
+    def _lock(self, model: str) -> threading.Lock:
+        if model not in self.paths:
+            raise BackendError(f"Model {model} not found", 404)
+        with self._loading:
+            return self._locks.setdefault(model, threading.Lock())
+
+    def _llama(self, model: str, embedding: bool = False):
+        """Loads the model on first use, must be called holding its lock."""
+        key = (model, embedding)
+        if key not in self._llamas:
+            try:
+                from llama_cpp import Llama
+            except ImportError as e:
+                raise ImportError(
+                    "The llama_cpp backend requires llama-cpp-python, "
+                    "install it with `pip install llama-cpp-python`"
+                ) from e
+
+            print(f"Loading {model} from {self.paths[model]}")
+            self._llamas[key] = Llama(
+                model_path=self.paths[model],
+                n_ctx=self.n_ctx,
+                n_threads=self.n_threads,
+                n_gpu_layers=self.n_gpu_layers,
+                embedding=embedding,
+                verbose=False,
+            )
+        return self._llamas[key]
+
+
+def _completion_args(options: Dict[str, Any]) -> Dict[str, Any]:
+    args = {}
+    if options.get("temperature") is not None:
+        args["temperature"] = options["temperature"]
+    if options.get("num_predict") is not None:
+        args["max_tokens"] = options["num_predict"]
+    if options.get("stop"):
+        args["stop"] = options["stop"]
+    return args
@@ -0,0 +1,80 @@
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+from ollama import AsyncClient, ResponseError
+
+from .base import BackendError, InferenceBackend
+
+
+class OllamaBackend(InferenceBackend):
+    """
+    An Ollama server, reached through one long lived async client whose
+    connections are pooled.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        client: Optional[AsyncClient] = None,
+        max_connections: int = 100,
+    ):
+        self.name = host
+        self.host = host
+        self.client = client or AsyncClient(
+            host=host,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+
+    async def chat(
+        self, model: str, messages: List[Dict[str, Any]], options: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        try:
+            response = await self.client.chat(
+                model=model, messages=messages, options=options
+            )
+        except ResponseError as e:
+            raise BackendError(str(e), e.status_code) from e
+        return _as_dict(response)
+
+    async def stream(
+        self, model: str, messages: List[Dict[str, Any]], options: Dict[str, Any]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        try:
+            chunks = await self.client.chat(
+                model=model, messages=messages, options=options, stream=True
+            )
+            async for chunk in chunks:
+                yield _as_dict(chunk)
+        except ResponseError as e:
+            raise BackendError(str(e), e.status_code) from e
+
+    async def list_models(self) -> List[Dict[str, Any]]:
+        return _named(_as_dict(await self.client.list()).get("models") or [])
+
+    async def loaded_models(self) -> List[Dict[str, Any]]:
+        return _named(_as_dict(await self.client.ps()).get("models") or [])
+
+    async def embeddings(self, model: str, input: List[str]) -> List[List[float]]:
+        try:
+            response = await self.client.embed(model=model, input=input)
+        except ResponseError as e:
+            raise BackendError(str(e), e.status_code) from e
+        return _as_dict(response)["embeddings"]
+
+    async def close(self):
+        await self.client._client.aclose()
+
+
+def _as_dict(response: Any) -> Dict[str, Any]:
+    """Older clients return dicts, newer ones pydantic models."""
+    if isinstance(response, dict):
+        return response
+    return response.model_dump(mode="json", exclude_none=True)
+
+
+def _named(models: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Newer Ollama versions only call the model's name `model`."""
+    return [{"name": m.get("name") or m.get("model"), **m} for m in models]
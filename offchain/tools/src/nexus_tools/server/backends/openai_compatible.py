@@ -0,0 +1,189 @@
+import json
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+import httpx
+
+from .base import BackendError, InferenceBackend
+
+
+class OpenAICompatibleBackend(InferenceBackend):
+    """
+    A server speaking the OpenAI API, e.g. vLLM or llama.cpp's server.
+
+    If `models` is not given, the served models are discovered from the
+    server's `/v1/models`.
+
+    With `batch`, concurrent single message prompts can be generated in one
+    request to `/v1/completions`, which vLLM runs as one batch.
+    The completions endpoint doesn't apply the model's chat template, so
+    only enable it for models that answer raw prompts well.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: Optional[str] = None,
+        models: Optional[Set[str]] = None,
+        client: Optional[httpx.AsyncClient] = None,
+        max_connections: int = 100,
+        batch: bool = False,
+    ):
+        self.name = base_url
+        self.models = set(models) if models else None
+        self.supports_batching = batch
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.client = client or httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            headers=headers,
+            timeout=None,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+
+    async def chat(
+        self, model: str, messages: List[Dict[str, Any]], options: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        started = time.monotonic()
+        response = await self._post(
+            "/v1/chat/completions", _chat_body(model, messages, options)
+        )
+        result = response.json()
+        eval_duration = int((time.monotonic() - started) * 1e9)
+
+        choice = result["choices"][0]
+        usage = result.get("usage") or {}
+        return _chunk(
+            model,
+            choice["message"].get("content") or "",
+            done=True,
+            done_reason=choice.get("finish_reason"),
+            prompt_eval_count=usage.get("prompt_tokens"),
+            eval_count=usage.get("completion_tokens"),
+            eval_duration=eval_duration,
+        )
+
+    async def chat_batch(
+        self, model: str, prompts: List[str], options: Dict[str, Any]
+    ) -> List[Dict[str, Any]]:
+        started = time.monotonic()
+        body = {"model": model, "prompt": prompts, **_sampling(options)}
+        response = await self._post("/v1/completions", body)
+        eval_duration = int((time.monotonic() - started) * 1e9)
+
+        choices = sorted(response.json()["choices"], key=lambda c: c["index"])
+        if len(choices) != len(prompts):
+            raise BackendError(
+                f"Got {len(choices)} completions for {len(prompts)} prompts"
+            )
+        return [
+            _chunk(
+                model,
+                choice.get("text") or "",
+                done=True,
+                done_reason=choice.get("finish_reason"),
+                eval_duration=eval_duration,
+            )
+            for choice in choices
+        ]
+
+    async def stream(
+        self, model: str, messages: List[Dict[str, Any]], options: Dict[str, Any]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        body = _chat_body(model, messages, options)
+        body["stream"] = True
+
+        first_token = None
+        count = 0
+        finish_reason = None
+        async with self.client.stream(
+            "POST", "/v1/chat/completions", json=body
+        ) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                raise BackendError(response.text, response.status_code)
+
+            # server sent events, one `data: {...}` line per chunk
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:") :].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or [{}]
+                finish_reason = choices[0].get("finish_reason") or finish_reason
+                content = (choices[0].get("delta") or {}).get("content")
+                if not content:
+                    continue
+                if first_token is None:
+                    first_token = time.monotonic()
+                count += 1
+                yield _chunk(model, content, done=False)
+
+        eval_duration = time.monotonic() - first_token if first_token else 0
+        yield _chunk(
+            model,
+            "",
+            done=True,
+            done_reason=finish_reason,
+            eval_count=count,
+            eval_duration=int(eval_duration * 1e9),
+        )
+
+    async def list_models(self) -> List[Dict[str, Any]]:
+        if self.models is not None:
+            return [{"name": m, "model": m} for m in sorted(self.models)]
+
+        response = await self.client.get("/v1/models")
+        if response.status_code >= 400:
+            raise BackendError(response.text, response.status_code)
+        return [{"name": m["id"], "model": m["id"]} for m in response.json()["data"]]
+
+    async def embeddings(self, model: str, input: List[str]) -> List[List[float]]:
+        response = await self._post("/v1/embeddings", {"model": model, "input": input})
+        data = sorted(response.json()["data"], key=lambda d: d["index"])
+        return [d["embedding"] for d in data]
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def _post(self, path: str, body: Dict[str, Any]) -> httpx.Response:
+        response = await self.client.post(path, json=body)
+        if response.status_code >= 400:
+            raise BackendError(response.text, response.status_code)
+        return response
+
+
+def _chat_body(
+    model: str, messages: List[Dict[str, Any]], options: Dict[str, Any]
+) -> Dict[str, Any]:
+    body = {
+        "model": model,
+        "messages": [{"role": m["role"], "content": m["content"]} for m in messages],
+    }
+    body.update(_sampling(options))
+    return body
+
+
+def _sampling(options: Dict[str, Any]) -> Dict[str, Any]:
+    """Ollama's options as OpenAI request fields."""
+    body = {}
+    if options.get("temperature") is not None:
+        body["temperature"] = options["temperature"]
+    if options.get("num_predict") is not None:
+        body["max_tokens"] = options["num_predict"]
+    if options.get("stop"):
+        body["stop"] = options["stop"]
+    return body
+
+
+def _chunk(model: str, content: str, done: bool, **stats: Any) -> Dict[str, Any]:
+    chunk = {
+        "model": model,
+        "message": {"role": "assistant", "content": content},
+        "done": done,
+    }
+    chunk.update({k: v for k, v in stats.items() if v is not None})
+    return chunk
@@ -0,0 +1,163 @@
+import asyncio
+import heapq
+import math
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Tuple
+
+
+class Overloaded(Exception):
+    """
+    A request was shed because its model's queue is full or too slow.
+
+    `retry_after` is how many seconds the client should wait before retrying.
+    """
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _ModelQueue:
+    def __init__(self):
+        self.active = 0
+        # (priority, arrival order, future resolved once admitted)
+        self.waiting: List[Tuple[float, int, asyncio.Future]] = []
+        self.service_time = None
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+
+class AdmissionController:
+    """
+    Bounds the requests queued per model and sheds the excess early.
+
+    At most `capacity(model)` requests for a model are admitted at once, i.e.
+    as many as its backends generate in parallel, the others wait here.
+    Waiting requests are admitted shortest job first by their `max_tokens`,
+    but every second of waiting counts as `aging` fewer tokens so long
+    generations aren't starved.
+
+    A request is rejected with `Overloaded` right away if `max_queue_depth`
+    requests already wait for its model or the expected wait, based on the
+    model's recent service times, exceeds `max_queue_time`, and later if it
+    still waits after `max_queue_time` seconds.
+    """
+
+    def __init__(
+        self,
+        capacity: Callable[[str], int],
+        max_queue_depth: int = 64,
+        max_queue_time: float = 30.0,
+        aging: float = 100.0,
+    ):
+        if max_queue_depth < 0:
+            raise ValueError("max_queue_depth can't be negative")
+
+        self.capacity = capacity
+        self.max_queue_depth = max_queue_depth
+        self.max_queue_time = max_queue_time
+        self.aging = aging
+        self._queues: Dict[str, _ModelQueue] = {}
+        self._arrivals = 0
+
+    @asynccontextmanager
+    async def admit(self, model: str, max_tokens: int):
+        admitted_at = await self.acquire(model, max_tokens)
+        try:
+            yield
+        finally:
+            self.release(model, admitted_at)
+
+    async def acquire(self, model: str, max_tokens: int) -> float:
+        """
+        Waits until the request may be sent to a backend and returns when it
+        was admitted, to be passed to `release` once it's done.
+        """
+        loop = asyncio.get_running_loop()
+        queue = self._queues.setdefault(model, _ModelQueue())
+        capacity = self.capacity(model)
+        self._admit_waiting(queue, capacity)
+
+        # without any backend for the model there's nothing to wait for,
+        # the request fails on its own
+        if capacity <= 0 or (queue.active < capacity and not queue.waiting):
+            queue.active += 1
+            queue.admitted += 1
+            return loop.time()
+
+        expected_wait = self._expected_wait(queue, capacity)
+        if len(queue.waiting) >= self.max_queue_depth:
+            reason = f"{len(queue.waiting)} requests are queued"
+            self._reject(queue, model, reason, capacity)
+        if expected_wait > self.max_queue_time:
+            reason = f"the expected wait is {expected_wait:.1f}s"
+            self._reject(queue, model, reason, capacity)
+
+        queued_at = loop.time()
+        future = loop.create_future()
+        self._arrivals += 1
+        entry = (max_tokens - self.aging * queued_at, self._arrivals, future)
+        heapq.heappush(queue.waiting, entry)
+        try:
+            await asyncio.wait_for(future, self.max_queue_time)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if entry in queue.waiting:
+                queue.waiting.remove(entry)
+                heapq.heapify(queue.waiting)
+            elif future.done() and not future.cancelled():
+                # admitted just as we gave up, pass the slot on
+                self.release(model, loop.time())
+            if isinstance(e, asyncio.TimeoutError):
+                queue.timed_out += 1
+                reason = f"the request waited {self.max_queue_time:.1f}s"
+                self._reject(queue, model, reason, self.capacity(model))
+            raise
+
+        queue.admitted += 1
+        return loop.time()
+
+    def release(self, model: str, admitted_at: float):
+        queue = self._queues[model]
+        service_time = asyncio.get_running_loop().time() - admitted_at
+        if queue.service_time is None:
+            queue.service_time = service_time
+        else:
+            queue.service_time = 0.8 * queue.service_time + 0.2 * service_time
+
+        queue.active -= 1
+        self._admit_waiting(queue, self.capacity(model))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            model: {
+                "active": queue.active,
+                "queued": len(queue.waiting),
+                "admitted": queue.admitted,
+                "rejected": queue.rejected,
+                "timed_out": queue.timed_out,
+                "avg_service_time": queue.service_time or 0.0,
+            }
+            for model, queue in self._queues.items()
+        }
+
+    def _admit_waiting(self, queue: _ModelQueue, capacity: int):
+        while queue.waiting and queue.active < capacity:
+            _, _, future = heapq.heappop(queue.waiting)
+            queue.active += 1
+            future.set_result(None)
+
+    def _expected_wait(self, queue: _ModelQueue, capacity: int) -> float:
+        if not queue.service_time:
+            return 0.0
+        return (len(queue.waiting) + 1) / capacity * queue.service_time
+
+    def _reject(self, queue: _ModelQueue, model: str, reason: str, capacity: int):
+        queue.rejected += 1
+        expected_wait = self._expected_wait(queue, max(capacity, 1))
+        retry_after = max(1, math.ceil(expected_wait))
+        print(f"Shedding {model} request, {reason}, retry after {retry_after}s")
+        raise Overloaded(
+            f"The server is overloaded with {model} requests, {reason}",
+            retry_after,
+        )
@@ -0,0 +1,114 @@
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterable, List, Tuple
+
+from ..tools.schema import TOOL_DESCRIPTIONS
+
+ChainKey = Tuple[str, float, FrozenSet[str]]
+
+PROMPT_TEMPLATE = "Answer the following question, using the provided tools if necessary. Always use a tool before answering: {input}"
+
+
+def build_tools_chain(model: str, temperature: float, tools: FrozenSet[str]) -> Any:
+    """The `/prompt_tools` chain, a model with the tools bound to it."""
+    # langchain is slow to import, so only import it once it's needed
+    from langchain.prompts import PromptTemplate
+    from langchain_experimental.llms.ollama_functions import OllamaFunctions
+    from langchain.callbacks.manager import CallbackManager
+    from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
+    from langchain_core.runnables import RunnablePassthrough
+
+    llm = OllamaFunctions(
+        model=model,
+        temperature=temperature,
+        callback_manager=CallbackManager([StreamingStdOutCallbackHandler()]),
+        format="json",
+    )
+    # sorted, so the same tools are always described to the model the same way
+    llm_with_tools = llm.bind_tools(
+        [
+            {
+                "name": tool_name,
+                "description": TOOL_DESCRIPTIONS[tool_name],
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "query": {"type": "string"},
+                    },
+                    "required": ["query"],
+                },
+            }
+            for tool_name in sorted(tools)
+        ]
+    )
+    prompt_template = PromptTemplate(
+        input_variables=["input"], template=PROMPT_TEMPLATE
+    )
+    return {"input": RunnablePassthrough()} | prompt_template | llm_with_tools
+
+
+class ChainCache:
+    """
+    Keeps the chains built for the `max_entries` most recently used
+    combinations of model, temperature and tools, so a request only has to
+    build its chain if none was built for the same combination.
+    """
+
+    def __init__(
+        self,
+        build: Callable[[str, float, FrozenSet[str]], Any] = build_tools_chain,
+        max_entries: int = 32,
+    ):
+        self.build = build
+        self.max_entries = max_entries
+        self._chains: "OrderedDict[ChainKey, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model: str, temperature: float, tools: Iterable[str]) -> Any:
+        key = (model, temperature, frozenset(tools))
+        chain = self._chains.get(key)
+        if chain is not None:
+            self.hits += 1
+            self._chains.move_to_end(key)
+            return chain
+
+        self.misses += 1
+        chain = self.build(*key)
+        self._chains[key] = chain
+        while len(self._chains) > self.max_entries:
+            self._chains.popitem(last=False)
+        return chain
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "chains": len(self._chains),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+async def run_tool_calls(
+    tool_calls: List[Dict[str, Any]],
+    call_tool: Callable[[str, Dict[str, Any]], Awaitable[Any]],
+) -> str:
+    """
+    Runs all the tool calls a model asked for at once, each a dict with a
+    `name` and `args`, and describes their results in order.
+    A failed call is described by its error, the others still count.
+    """
+    results = await asyncio.gather(
+        *(call_tool(tool_call["name"], tool_call["args"]) for tool_call in tool_calls),
+        return_exceptions=True,
+    )
+    lines = []
+    for tool_call, result in zip(tool_calls, results):
+        if isinstance(result, BaseException):
+            print(f"Tool {tool_call['name']} failed: {result}")
+            lines.append(f"Tool {tool_call['name']} failed: {result}")
+        else:
+            print(f"Tool result: {result}")
+            lines.append(f"Tool {tool_call['name']} returned: {result}")
+    return "\n".join(lines)
@@ -0,0 +1,62 @@
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent requests into one.
+
+    While a request for a key is in flight, further requests for the same key
+    don't start their own but wait for its result, or its error.
+    A request whose callers all gave up is cancelled, as long as one caller
+    still waits it runs on even if the one that started it left.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, _Flight] = {}
+        self.requests = 0
+        self.executions = 0
+
+    async def run(self, key: Hashable, request: Callable[[], Awaitable[Any]]) -> Any:
+        self.requests += 1
+        flight = self._inflight.get(key)
+        if flight is None:
+            self.executions += 1
+            flight = _Flight(asyncio.ensure_future(request()))
+            self._inflight[key] = flight
+            flight.task.add_done_callback(lambda _: self._landed(key, flight))
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        coalesced = self.requests - self.executions
+        return {
+            "requests": self.requests,
+            "executions": self.executions,
+            "coalesced": coalesced,
+            "coalescing_ratio": coalesced / self.requests if self.requests else 0.0,
+            "in_flight": len(self._inflight),
+        }
+
+    def _landed(self, key: Hashable, flight: _Flight):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+
+
+def request_key(*parts: Any) -> str:
+    """A key that's the same for equal requests, whatever the order of dict keys."""
+    return json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
@@ -1,30 +1,212 @@
+import asyncio
 import os
-import ollama
-from ollama import Client
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from ollama import AsyncClient
+
+from ..backends import InferenceBackend, load_backends
+from ..backends.ollama import OllamaBackend
+from .routing import Backend, BackendPool, response_field
 
 
 class Inference:
-    @staticmethod
-    def prompt(prompt, model, max_tokens=1000, temperature=1.0):
-        # Fetch the URL from environment variable, defaulting to localhost if not provided
-        ollama_host = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+    """
+    Runs prompts against one or more inference backends without blocking the
+    event loop.
+
+    The backends are read from the JSON file `INFERENCE_BACKENDS_FILE`, see
+    `create_backend`, which can mix Ollama, OpenAI compatible servers and
+    llama.cpp running in process.
+    Without it, every Ollama host in `OLLAMA_HOSTS`, a comma separated list of
+    hosts, or the single `OLLAMA_HOST` is a backend.
+    Every request is routed to the least loaded healthy backend that serves its
+    model, see `BackendPool`.
+
+    One long lived async client, and with it one pool of connections, is kept
+    per HTTP backend.
+    At most `max_parallel_per_model` requests for any single model are sent to
+    a backend at once, the others wait here.
+    By default this matches Ollama's own `OLLAMA_NUM_PARALLEL`, anything
+    beyond that would only queue up inside Ollama.
+    """
 
-        # Create a custom client with the specified host
-        client = Client(host=ollama_host)
+    def __init__(
+        self,
+        hosts: Optional[List[str]] = None,
+        backends: Optional[List[InferenceBackend]] = None,
+        max_parallel_per_model: Optional[int] = None,
+        max_connections: int = 100,
+        client_factory: Optional[Callable[[str], AsyncClient]] = None,
+        health_interval: Optional[float] = None,
+    ):
+        if backends is None and hosts is None:
+            backends = load_backends()
+        if backends is None and hosts is None:
+            # Fetch the URLs from environment variables, defaulting to localhost if not provided
+            hosts = os.getenv("OLLAMA_HOSTS", "").split(",")
+            hosts = [h.strip() for h in hosts if h.strip()] or [
+                os.getenv("OLLAMA_HOST", "http://localhost:11434")
+            ]
+        if max_parallel_per_model is None:
+            max_parallel_per_model = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
+        if max_parallel_per_model < 1:
+            raise ValueError("max_parallel_per_model must be at least 1")
+        if health_interval is None:
+            health_interval = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10"))
 
+        self.max_parallel_per_model = max_parallel_per_model
+        self.max_connections = max_connections
+        if backends is None:
+            backends = [
+                OllamaBackend(
+                    host,
+                    client=client_factory(host) if client_factory else None,
+                    max_connections=max_connections,
+                )
+                for host in hosts
+            ]
+        self.pool = BackendPool(backends, health_interval=health_interval)
+        self._model_slots: Dict[Tuple[str, str], asyncio.Semaphore] = {}
+
+    async def start(self):
+        await self.pool.start()
+
+    async def prompt(
+        self,
+        prompt,
+        model,
+        max_tokens=1000,
+        temperature=1.0,
+    ):
         # Set up options for the request
         options = {"temperature": temperature, "num_predict": max_tokens}
 
-        # Make the request using the client
-        response = client.chat(
-            model=model,
-            options=options,
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt,
-                },
-            ],
+        async def chat(backend: Backend):
+            async with self._slots_for(backend, model):
+                return await backend.client.chat(
+                    model,
+                    [
+                        {
+                            "role": "user",
+                            "content": prompt,
+                        },
+                    ],
+                    options,
+                )
+
+        return await self.pool.run(model, chat)
+
+    def batches(self, model: str) -> bool:
+        """Whether a healthy backend serving the model takes batched requests."""
+        return any(
+            b.healthy and b.serves(model) and b.client.supports_batching
+            for b in self.pool.backends
         )
 
-        return response
+    async def prompt_batch(
+        self, prompts: List[str], model, max_tokens=1000, temperature=1.0
+    ) -> List[Any]:
+        """Generates the completions of several prompts in one backend request."""
+        options = {"temperature": temperature, "num_predict": max_tokens}
+
+        async def chat_batch(backend: Backend):
+            # a batch is a single request to the backend
+            async with self._slots_for(backend, model):
+                return await backend.client.chat_batch(model, prompts, options)
+
+        return await self.pool.run(model, chat_batch, batching=True)
+
+    async def stream(
+        self, prompt, model, max_tokens=1000, temperature=1.0
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streams the completion as the backend generates it.
+
+        Yields `{"content": ..., "done": False}` for every chunk and finally
+        `{"content": "", "done": True, ...}` with the time to first token and
+        tokens per second of the generation.
+        """
+        options = {"temperature": temperature, "num_predict": max_tokens}
+
+        async def chat(backend: Backend):
+            async with self._slots_for(backend, model):
+                chunks = backend.client.stream(
+                    model,
+                    [
+                        {
+                            "role": "user",
+                            "content": prompt,
+                        },
+                    ],
+                    options,
+                )
+                async for chunk in chunks:
+                    yield chunk
+
+        started = time.monotonic()
+        first_token = None
+        chunk_count = 0
+        final = None
+        async for chunk in self.pool.stream(model, chat):
+            content = response_field(response_field(chunk, "message"), "content")
+            if content:
+                chunk_count += 1
+                if first_token is None:
+                    first_token = time.monotonic()
+                yield {"content": content, "done": False}
+            if response_field(chunk, "done"):
+                final = chunk
+
+        stats = generation_stats(started, first_token, chunk_count, final)
+        print(
+            f"Streamed {model}: {stats['eval_count']} tokens, "
+            f"time to first token {stats['time_to_first_token']:.2f}s, "
+            f"{stats['tokens_per_second']:.1f} tokens/s"
+        )
+        yield {"content": "", "done": True, **stats}
+
+    def capacity(self, model: str) -> int:
+        """How many requests for the model the healthy backends take at once."""
+        serving = [b for b in self.pool.backends if b.healthy and b.serves(model)]
+        return len(serving) * self.max_parallel_per_model
+
+    async def list_models(self):
+        return {"models": await self.pool.list_models()}
+
+    async def embeddings(self, model: str, input: List[str]) -> List[List[float]]:
+        async def embed(backend: Backend):
+            async with self._slots_for(backend, model):
+                return await backend.client.embeddings(model, input)
+
+        return await self.pool.run(model, embed)
+
+    async def close(self):
+        await self.pool.close()
+
+    def _slots_for(self, backend: Backend, model: str) -> asyncio.Semaphore:
+        key = (backend.host, model)
+        if key not in self._model_slots:
+            self._model_slots[key] = asyncio.Semaphore(self.max_parallel_per_model)
+        return self._model_slots[key]
+
+
+def generation_stats(
+    started: float, first_token: Optional[float], chunk_count: int, final: Any
+) -> Dict[str, Any]:
+    """
+    Time to first token and generation speed of a streamed completion.
+
+    Prefers the backend's own token count and timing from the final chunk, and
+    otherwise counts every streamed chunk as a token.
+    """
+    now = time.monotonic()
+    first_token = first_token or now
+    eval_count = response_field(final, "eval_count") or chunk_count
+    eval_duration = response_field(final, "eval_duration")
+    seconds = eval_duration / 1e9 if eval_duration else now - first_token
+    return {
+        "time_to_first_token": first_token - started,
+        "eval_count": eval_count,
+        "tokens_per_second": eval_count / seconds if seconds > 0 else 0.0,
+    }
@@ -0,0 +1,261 @@
+import asyncio
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set
+
+import httpx
+
+from ..backends import BackendError, InferenceBackend
+
+
+class NoBackendAvailable(Exception):
+    """No healthy backend serves the requested model."""
+
+
+class Backend:
+    """
+    One inference backend, e.g. an Ollama process, and what we know about it.
+
+    `models` are the models it serves and `loaded` the ones it currently has
+    in memory, both as of the last health check unless the backend is
+    configured to serve fixed models.
+    `tokens_per_second` is a moving average over its recent generations.
+    """
+
+    def __init__(self, client: InferenceBackend):
+        self.host = client.name
+        self.client = client
+        self.models: Optional[Set[str]] = None
+        if client.models is not None:
+            self.models = {_base_name(m) for m in client.models}
+        self.loaded: Set[str] = set()
+        self.inflight = 0
+        self.tokens_per_second: Optional[float] = None
+        self.failures = 0
+        self.ejected_until = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    def serves(self, model: str) -> bool:
+        # until the first health check we can't tell, so give it a try
+        return self.models is None or _base_name(model) in self.models
+
+    def load(self, default_rate: float = 1.0) -> float:
+        """
+        Expected wait for a new request, lower is better.
+        Backends without a measured rate are assumed to run at `default_rate`.
+        """
+        return (self.inflight + 1) / (self.tokens_per_second or default_rate)
+
+
+class BackendPool:
+    """
+    Routes requests to the least loaded of several inference backends.
+
+    A request goes to the healthy backend that serves its model, preferring
+    those that already have it loaded, with the lowest expected wait based on
+    its in-flight requests and recent tokens per second.
+    Backends that haven't generated anything yet are assumed to be as fast as
+    the others are on average.
+
+    Backends are checked actively every `health_interval` seconds, which also
+    discovers the models they serve and have loaded, and passively by every
+    request sent to them.
+    After `max_failures` consecutive failures a backend is ejected for
+    `ejection_seconds`, after which it gets another chance.
+    """
+
+    def __init__(
+        self,
+        backends: List[InferenceBackend],
+        health_interval: float = 10.0,
+        max_failures: int = 3,
+        ejection_seconds: float = 30.0,
+    ):
+        if not backends:
+            raise ValueError("At least one backend is required")
+
+        self.backends = [Backend(backend) for backend in backends]
+        self.health_interval = health_interval
+        self.max_failures = max_failures
+        self.ejection_seconds = ejection_seconds
+        self._health_checker: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self.check_health()
+        if self.health_interval > 0:
+            self._health_checker = asyncio.create_task(self._check_periodically())
+
+    async def close(self):
+        if self._health_checker is not None:
+            self._health_checker.cancel()
+            await asyncio.gather(self._health_checker, return_exceptions=True)
+            self._health_checker = None
+        for backend in self.backends:
+            await backend.client.close()
+
+    def pick(
+        self, model: str, exclude: Set[str] = frozenset(), batching: bool = False
+    ) -> Backend:
+        candidates = [
+            b
+            for b in self.backends
+            if b.healthy
+            and b.host not in exclude
+            and b.serves(model)
+            and (b.client.supports_batching or not batching)
+        ]
+        if not candidates:
+            raise NoBackendAvailable(f"No healthy backend serves model {model}")
+
+        name = _base_name(model)
+        rates = [b.tokens_per_second for b in self.backends if b.tokens_per_second]
+        default_rate = sum(rates) / len(rates) if rates else 1.0
+        return min(
+            candidates,
+            key=lambda b: (name not in b.loaded, b.load(default_rate), b.inflight),
+        )
+
+    async def run(
+        self,
+        model: str,
+        request: Callable[[Backend], Any],
+        batching: bool = False,
+    ) -> Any:
+        """
+        Runs `request` against the best backend for the model, with
+        `batching` the best one that takes batched requests.
+
+        If the backend can't be reached, the request is tried once more on
+        another one.
+        """
+        tried: Set[str] = set()
+        while True:
+            backend = self.pick(model, exclude=tried, batching=batching)
+            tried.add(backend.host)
+            backend.inflight += 1
+            try:
+                response = await request(backend)
+            # newer clients turn connection errors into ConnectionError
+            except (httpx.TransportError, ConnectionError, BackendError) as e:
+                if isinstance(e, BackendError) and 0 <= e.status_code < 500:
+                    # the request's fault, not the backend's
+                    raise
+                self._failed(backend, e)
+                if len(tried) > 1:
+                    raise
+                continue
+            finally:
+                backend.inflight -= 1
+
+            self._succeeded(backend, model, response)
+            return response
+
+    async def stream(
+        self, model: str, request: Callable[[Backend], AsyncIterator[Any]]
+    ) -> AsyncIterator[Any]:
+        """
+        Like `run`, but passes through the chunks streamed by `request`.
+
+        A request is only tried on another backend if its backend failed
+        before streaming anything.
+        """
+        tried: Set[str] = set()
+        while True:
+            backend = self.pick(model, exclude=tried)
+            tried.add(backend.host)
+            backend.inflight += 1
+            last_chunk = None
+            try:
+                async for chunk in request(backend):
+                    last_chunk = chunk
+                    yield chunk
+            except (httpx.TransportError, ConnectionError, BackendError) as e:
+                if isinstance(e, BackendError) and 0 <= e.status_code < 500:
+                    raise
+                self._failed(backend, e)
+                if last_chunk is not None or len(tried) > 1:
+                    raise
+                continue
+            finally:
+                backend.inflight -= 1
+
+            # the final chunk carries the generation's statistics
+            self._succeeded(backend, model, last_chunk)
+            return
+
+    async def check_health(self):
+        await asyncio.gather(*[self._check(b) for b in self.backends])
+
+    async def list_models(self) -> List[Any]:
+        """Every model served by any healthy backend, once."""
+        models: Dict[str, Any] = {}
+        for backend in self.backends:
+            if not backend.healthy:
+                continue
+            try:
+                listed = await backend.client.list_models()
+            except Exception as e:
+                self._failed(backend, e)
+                continue
+            for model in listed:
+                models.setdefault(_model_name(model), model)
+        return list(models.values())
+
+    async def _check_periodically(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self.check_health()
+
+    async def _check(self, backend: Backend):
+        try:
+            listed = await backend.client.list_models()
+            if backend.client.models is None:
+                backend.models = {_base_name(_model_name(m)) for m in listed}
+            running = await backend.client.loaded_models()
+            backend.loaded = {_base_name(_model_name(m)) for m in running}
+        except Exception as e:
+            self._failed(backend, e)
+            return
+
+        if not backend.healthy or backend.failures:
+            print(f"Backend {backend.host} is healthy again")
+        backend.failures = 0
+        backend.ejected_until = 0.0
+
+    def _failed(self, backend: Backend, error: Exception):
+        backend.failures += 1
+        print(f"Backend {backend.host} failed ({backend.failures}x): {error}")
+        if backend.failures >= self.max_failures:
+            backend.ejected_until = time.monotonic() + self.ejection_seconds
+            print(f"Ejecting backend {backend.host} for {self.ejection_seconds}s")
+
+    def _succeeded(self, backend: Backend, model: str, response: Any):
+        backend.failures = 0
+        backend.loaded.add(_base_name(model))
+
+        eval_count = response_field(response, "eval_count")
+        eval_duration = response_field(response, "eval_duration")
+        if eval_count and eval_duration:
+            rate = eval_count / (eval_duration / 1e9)
+            if backend.tokens_per_second is None:
+                backend.tokens_per_second = rate
+            else:
+                backend.tokens_per_second = 0.8 * backend.tokens_per_second + 0.2 * rate
+
+
+def response_field(obj: Any, name: str) -> Any:
+    """Reads a field of an Ollama response, which are dicts in older clients."""
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def _model_name(model: Any) -> str:
+    return response_field(model, "model") or response_field(model, "name") or ""
+
+
+def _base_name(model: str) -> str:
+    """Ollama treats `mistral` and `mistral:latest` as the same model."""
+    return model if ":" in model else f"{model}:latest"
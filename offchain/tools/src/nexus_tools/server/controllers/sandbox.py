@@ -0,0 +1,273 @@
+import asyncio
+import math
+import multiprocessing
+import resource
+import signal
+from dataclasses import dataclass
+from multiprocessing.connection import Connection
+from typing import Any, Callable, Dict, List, Optional, Set
+
+# imported once by the fork server, so every worker starts with the tools loaded,
+# under the same package path the server uses, e.g. `src.nexus_tools` in Docker
+PRELOAD = [__package__.rsplit(".", 1)[0] + ".tools.tools"]
+
+
+@dataclass
+class SandboxLimits:
+    """
+    Limits of a sandbox worker process.
+
+    A call may use `cpu_seconds` of CPU time and `memory_mb` of memory on top
+    of what the worker took up after importing the tools, beyond that the
+    call fails.
+    A worker is replaced by a fresh one after `max_executions` calls, or once
+    its resident memory exceeds `max_rss_mb`, so whatever a call leaves
+    behind doesn't pile up.
+    """
+
+    cpu_seconds: float = 30.0
+    memory_mb: int = 2048
+    max_executions: int = 100
+    max_rss_mb: int = 512
+
+
+class SandboxError(Exception):
+    """A call failed inside its sandbox, or took the worker down with it."""
+
+
+class _Worker:
+    """A process serving calls one at a time over a pipe."""
+
+    def __init__(self, context, target: Callable[..., Any], limits: SandboxLimits):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(
+            target=_serve, args=(child, target, limits), daemon=True
+        )
+        self.process.start()
+        child.close()
+        self.executions = 0
+        self.rss_mb = 0.0
+
+    async def call(self, tool_name: str, args: Dict[str, Any]) -> Any:
+        self.executions += 1
+        self.conn.send((tool_name, args))
+        await _readable(self.conn)
+        try:
+            ok, result, self.rss_mb = self.conn.recv()
+        except EOFError:
+            self.process.join(1)
+            raise SandboxError(_death(self.process.exitcode)) from None
+        if not ok:
+            raise result
+        return result
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.conn.close()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.kill()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(1)
+        self.conn.close()
+
+
+class SandboxPool:
+    """
+    Pre-forked worker processes that run untrusted tools, e.g. `python_repl`.
+
+    The workers are forked by a fork server that has already imported the
+    tools, so a call doesn't pay for starting an interpreter and importing
+    them, and whatever a call does can't stall or bloat the server.
+    Calls and results go over pipes.
+
+    A call that doesn't finish within its timeout is stopped by killing its
+    worker, see `SandboxLimits` for the other limits.
+    Every worker that's killed or recycled is replaced right away, in the
+    background so waiting for processes doesn't block the event loop.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        target: Callable[[str, Dict[str, Any]], Any],
+        limits: Optional[SandboxLimits] = None,
+        preload: Optional[List[str]] = None,
+    ):
+        if size < 1:
+            raise ValueError("size must be at least 1")
+
+        self.size = size
+        self.target = target
+        self.limits = limits or SandboxLimits()
+        # forking the server itself isn't safe, it runs threads
+        self._context = multiprocessing.get_context("forkserver")
+        self._context.set_forkserver_preload(PRELOAD if preload is None else preload)
+        self._idle: Optional[asyncio.Queue] = None
+        self._replacing: Set[asyncio.Task] = set()
+        self.executions = 0
+        self.recycled = 0
+        self.killed = 0
+
+    def start(self):
+        """Starts the workers in the background, must be called on the loop."""
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            for _ in range(self.size):
+                self._replace(None)
+
+    async def run(self, tool_name: str, args: Dict[str, Any], timeout: float) -> Any:
+        """Runs the call in a worker, raises `asyncio.TimeoutError` if it's too slow."""
+        self.start()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        # workers may still be starting
+        worker = await asyncio.wait_for(self._idle.get(), timeout)
+        broken = False
+        try:
+            self.executions += 1
+            return await asyncio.wait_for(
+                worker.call(tool_name, args), max(deadline - loop.time(), 0)
+            )
+        except (asyncio.TimeoutError, asyncio.CancelledError, SandboxError):
+            # the worker is stuck in or broken by the call
+            broken = True
+            self.killed += 1
+            raise
+        finally:
+            if broken:
+                self._replace(worker.kill)
+            elif (
+                worker.executions >= self.limits.max_executions
+                or worker.rss_mb > self.limits.max_rss_mb
+            ):
+                self.recycled += 1
+                self._replace(worker.stop)
+            else:
+                self._idle.put_nowait(worker)
+
+    def close(self):
+        if self._idle is None:
+            return
+        while not self._idle.empty():
+            self._idle.get_nowait().stop()
+        self._idle = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.size,
+            "executions": self.executions,
+            "recycled": self.recycled,
+            "killed": self.killed,
+        }
+
+    def _worker(self) -> _Worker:
+        return _Worker(self._context, self.target, self.limits)
+
+    def _replace(self, retire: Optional[Callable[[], None]]):
+        """
+        Retires a worker and starts its replacement in the background, both
+        wait on processes which mustn't block the loop.
+        """
+        idle = self._idle
+
+        async def replace():
+            if retire is not None:
+                await asyncio.to_thread(retire)
+            try:
+                worker = await asyncio.to_thread(self._worker)
+            except Exception as e:
+                print(f"Cannot start a sandbox worker: {e}")
+                raise
+            if self._idle is idle:
+                idle.put_nowait(worker)
+            else:
+                # the pool was closed in the meantime
+                await asyncio.to_thread(worker.stop)
+
+        task = asyncio.ensure_future(replace())
+        self._replacing.add(task)
+        task.add_done_callback(self._replacing.discard)
+
+
+def _serve(conn: Connection, target: Callable[..., Any], limits: SandboxLimits):
+    # the preloaded tools map a lot of address space they never touch, so
+    # limit the heap and other private memory on top of what's already used
+    _set_limit(resource.RLIMIT_DATA, _data_bytes() + limits.memory_mb * 1024 * 1024)
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+
+        # CPU time adds up over the worker's life, allow this call some more
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        used = usage.ru_utime + usage.ru_stime
+        _set_limit(resource.RLIMIT_CPU, math.ceil(used + limits.cpu_seconds))
+
+        tool_name, args = request
+        try:
+            response = (True, target(tool_name, args))
+        except Exception as e:
+            response = (False, e)
+        try:
+            conn.send(response + (_rss_mb(),))
+        except Exception as e:
+            # the result or the error can't be pickled
+            conn.send((False, SandboxError(f"{type(e).__name__}: {e}"), _rss_mb()))
+
+
+def _set_limit(limit: int, value: int):
+    _, hard = resource.getrlimit(limit)
+    if hard != resource.RLIM_INFINITY:
+        value = min(value, hard)
+    resource.setrlimit(limit, (value, hard))
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / (1024 * 1024)
+    except OSError:
+        # peak rather than current, but all there is outside Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _data_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[5])
+        return pages * resource.getpagesize()
+    except OSError:
+        return 0
+
+
+def _death(exitcode: Optional[int]) -> str:
+    if exitcode == -signal.SIGXCPU:
+        return "The call exceeded its CPU time limit"
+    if exitcode == -signal.SIGKILL:
+        return "The sandbox was killed, probably for using too much memory"
+    return f"The sandbox exited with code {exitcode}"
+
+
+async def _readable(conn: Connection):
+    loop = asyncio.get_running_loop()
+    ready = loop.create_future()
+
+    def on_readable():
+        if not ready.done():
+            ready.set_result(None)
+
+    loop.add_reader(conn.fileno(), on_readable)
+    try:
+        await ready
+    finally:
+        loop.remove_reader(conn.fileno())
@@ -0,0 +1,125 @@
+import asyncio
+from typing import Any, Dict, List, Tuple
+
+from .inference import Inference
+
+# (prompt, when it was queued, future for the response)
+_Request = Tuple[str, float, asyncio.Future]
+# requests are only batched with others of the same model and options
+_BatchKey = Tuple[str, int, float]
+
+
+class BatchScheduler:
+    """
+    Groups concurrent requests for the same model into batched backend
+    requests.
+
+    Only backends that generate several prompts in one request, see
+    `InferenceBackend.supports_batching`, benefit from this, so requests for
+    models no such backend serves go straight to `Inference.prompt` and are
+    routed one by one as usual.
+
+    Otherwise requests for a model with the same `max_tokens` and temperature
+    that arrive within `window` seconds of the first one are sent as a single
+    batched request, of at most `max_batch` prompts, and every caller gets
+    its own completion back.
+    A request that arrives while no other is waiting still waits for the
+    window, so keep it to a few milliseconds.
+    """
+
+    def __init__(
+        self, inference: Inference, window: float = 0.005, max_batch: int = 16
+    ):
+        if max_batch < 1:
+            raise ValueError("max_batch must be at least 1")
+
+        self.inference = inference
+        self.window = window
+        self.max_batch = max_batch
+        self._waiting: Dict[_BatchKey, List[_Request]] = {}
+        self._timers: Dict[_BatchKey, asyncio.TimerHandle] = {}
+
+        self.batches = 0
+        self.requests = 0
+        self.unbatched = 0
+        self.max_batch_size = 0
+        self.total_queue_delay = 0.0
+
+    async def prompt(self, prompt, model, max_tokens=1000, temperature=1.0):
+        if not self.inference.batches(model):
+            self.unbatched += 1
+            return await self.inference.prompt(prompt, model, max_tokens, temperature)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = (model, max_tokens, temperature)
+        waiting = self._waiting.setdefault(key, [])
+        waiting.append((prompt, loop.time(), future))
+
+        if len(waiting) >= self.max_batch:
+            self._dispatch(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self.window, self._dispatch, key)
+
+        return await future
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "unbatched": self.unbatched,
+            "avg_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "avg_queue_delay": (
+                self.total_queue_delay / self.requests if self.requests else 0.0
+            ),
+        }
+
+    def _dispatch(self, key: _BatchKey):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        waiting = self._waiting.pop(key, [])
+        # whoever gave up waiting doesn't need a completion anymore
+        batch = [r for r in waiting if not r[2].done()]
+        if not batch:
+            return
+
+        model, max_tokens, temperature = key
+        now = asyncio.get_running_loop().time()
+        delays = [now - queued_at for _, queued_at, _ in batch]
+        self.batches += 1
+        self.requests += len(batch)
+        self.max_batch_size = max(self.max_batch_size, len(batch))
+        self.total_queue_delay += sum(delays)
+        print(
+            f"Dispatching batch of {len(batch)} {model} request(s), "
+            f"queued for up to {max(delays) * 1000:.1f}ms"
+        )
+
+        task = asyncio.ensure_future(
+            self.inference.prompt_batch(
+                [prompt for prompt, _, _ in batch], model, max_tokens, temperature
+            )
+        )
+        futures = [future for _, _, future in batch]
+        task.add_done_callback(lambda t: _resolve(futures, t))
+        for future in futures:
+            future.add_done_callback(lambda _: _cancel_if_abandoned(futures, task))
+
+
+def _resolve(futures: List[asyncio.Future], task: asyncio.Task):
+    for i, future in enumerate(futures):
+        if future.done():
+            continue
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result()[i])
+
+
+def _cancel_if_abandoned(futures: List[asyncio.Future], task: asyncio.Task):
+    if not task.done() and all(f.cancelled() for f in futures):
+        task.cancel()
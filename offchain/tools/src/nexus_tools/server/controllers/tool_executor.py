@@ -0,0 +1,228 @@
+import asyncio
+import json
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from .sandbox import SandboxLimits, SandboxPool
+
+THREAD = "thread"
+PROCESS = "process"
+
+
+@dataclass
+class ToolLimits:
+    """
+    How a tool is executed.
+
+    `pool` is `thread` for I/O bound tools and `process` for CPU bound or
+    untrusted ones, which can then be killed when they time out.
+    At most `max_concurrency` calls of the tool run at once, and a call that
+    takes longer than `timeout` seconds, including waiting for its turn,
+    fails with `ToolTimeout`.
+    """
+
+    pool: str = THREAD
+    max_concurrency: int = 8
+    timeout: float = 60.0
+
+
+DEFAULT_LIMITS = {
+    "python_repl": ToolLimits(pool=PROCESS, max_concurrency=2, timeout=30.0),
+    "shell": ToolLimits(pool=PROCESS, max_concurrency=2, timeout=30.0),
+    "gemini": ToolLimits(timeout=120.0),
+    "gpt4_vision": ToolLimits(timeout=120.0),
+    "dalle3": ToolLimits(timeout=120.0),
+}
+
+
+class ToolTimeout(Exception):
+    """A tool call didn't finish in time."""
+
+    def __init__(self, tool_name: str, timeout: float, started: bool):
+        state = "ran" if started else "waited for its turn"
+        super().__init__(f"Tool {tool_name} {state} for longer than {timeout}s")
+        self.tool_name = tool_name
+        self.timeout = timeout
+        self.started = started
+
+    def detail(self) -> Dict[str, Any]:
+        return {
+            "error": "timeout",
+            "tool": self.tool_name,
+            "timeout": self.timeout,
+            "started": self.started,
+            "message": str(self),
+        }
+
+
+def run_tool(tool_name: str, args: Dict[str, Any]) -> Any:
+    """Runs a tool in a worker process, which imports the tools on first use."""
+    from ..tools.tools import TOOLS
+
+    return TOOLS[tool_name]._run(**args)
+
+
+class ToolExecutor:
+    """
+    Runs tools without blocking the event loop.
+
+    `tools` maps tool names to tools, e.g. the lazily loaded `TOOLS`.
+
+    Tools with a native async implementation, i.e. an `async_function`, run
+    on the loop itself, other I/O bound tools on a shared thread pool and CPU
+    bound or untrusted tools in worker processes, see `ToolLimits`.
+
+    Every process tool has its own pool of pre-forked sandbox workers, one
+    per allowed concurrent call, see `SandboxPool`, started by `start`.
+    A call that times out is stopped by killing its worker, which is then
+    replaced.
+    The sandboxes' limits are read from `SANDBOX_CPU_SECONDS`,
+    `SANDBOX_MEMORY_MB`, `SANDBOX_MAX_EXECUTIONS` and `SANDBOX_MAX_RSS_MB`.
+    Threads can't be killed, so a timed out thread tool keeps its slot until
+    it actually finishes.
+
+    `limits` override `DEFAULT_LIMITS` per tool, and by default are read from
+    `TOOL_LIMITS`, a JSON object like `{"search": {"timeout": 10}}`.
+    """
+
+    def __init__(
+        self,
+        tools: Dict[str, Any],
+        limits: Optional[Dict[str, ToolLimits]] = None,
+        default_limits: Optional[ToolLimits] = None,
+        thread_workers: Optional[int] = None,
+        process_target: Callable[[str, Dict[str, Any]], Any] = run_tool,
+        sandbox_limits: Optional[SandboxLimits] = None,
+    ):
+        if limits is None:
+            limits = {
+                name: ToolLimits(**config)
+                for name, config in json.loads(os.getenv("TOOL_LIMITS", "{}")).items()
+            }
+        if default_limits is None:
+            default_limits = ToolLimits(
+                timeout=float(os.getenv("TOOL_TIMEOUT_SECONDS", "60"))
+            )
+        if thread_workers is None:
+            thread_workers = int(os.getenv("TOOL_THREAD_WORKERS", "32"))
+        if sandbox_limits is None:
+            sandbox_limits = SandboxLimits(
+                cpu_seconds=float(os.getenv("SANDBOX_CPU_SECONDS", "30")),
+                memory_mb=int(os.getenv("SANDBOX_MEMORY_MB", "2048")),
+                max_executions=int(os.getenv("SANDBOX_MAX_EXECUTIONS", "100")),
+                max_rss_mb=int(os.getenv("SANDBOX_MAX_RSS_MB", "512")),
+            )
+
+        self.tools = tools
+        self.limits = {**DEFAULT_LIMITS, **limits}
+        self.default_limits = default_limits
+        self.process_target = process_target
+        self.sandbox_limits = sandbox_limits
+        self._threads = ThreadPoolExecutor(
+            max_workers=thread_workers, thread_name_prefix="tool"
+        )
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+        self._sandboxes: Dict[str, SandboxPool] = {}
+
+    def start(self):
+        """Forks the sandboxes of the process tools ahead of their first call."""
+        for tool_name, limits in self.limits.items():
+            if limits.pool == PROCESS and tool_name in self.tools:
+                self._sandbox_for(tool_name, limits).start()
+
+    def limits_for(self, tool_name: str) -> ToolLimits:
+        return self.limits.get(tool_name, self.default_limits)
+
+    async def run(self, tool_name: str, args: Dict[str, Any]) -> Any:
+        if tool_name not in self.tools:
+            raise KeyError(tool_name)
+        limits = self.limits_for(tool_name)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + limits.timeout
+
+        slots = self._slots_for(tool_name, limits)
+        try:
+            await asyncio.wait_for(slots.acquire(), limits.timeout)
+        except asyncio.TimeoutError:
+            raise ToolTimeout(tool_name, limits.timeout, started=False)
+
+        remaining = max(deadline - loop.time(), 0)
+        # the worker processes load the tools themselves
+        if limits.pool == PROCESS:
+            return await self._run_in_process(tool_name, args, limits, remaining)
+
+        try:
+            if not getattr(self.tools, "loaded", True):
+                # importing the tools takes a while, don't block the loop on it
+                await asyncio.to_thread(self.tools.load)
+            tool = self.tools[tool_name]
+        except BaseException:
+            self._slots[tool_name].release()
+            raise
+        if getattr(tool, "async_function", None) is not None:
+            return await self._run_async(tool, tool_name, args, limits, remaining)
+        return await self._run_in_thread(tool, tool_name, args, limits, remaining)
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: pool.stats() for name, pool in self._sandboxes.items()}
+
+    async def close(self):
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        for sandbox in self._sandboxes.values():
+            sandbox.close()
+
+    async def _run_async(self, tool, tool_name, args, limits, remaining):
+        try:
+            return await asyncio.wait_for(tool._arun(**args), remaining)
+        except asyncio.TimeoutError:
+            raise ToolTimeout(tool_name, limits.timeout, started=True)
+        finally:
+            self._slots[tool_name].release()
+
+    async def _run_in_thread(self, tool, tool_name, args, limits, remaining):
+        try:
+            future = self._threads.submit(tool._run, **args)
+        except BaseException:
+            # e.g. the pool was shut down, the thread never took the slot
+            self._slots[tool_name].release()
+            raise
+        # the slot is only free once the thread is
+        future.add_done_callback(
+            _call_soon(asyncio.get_running_loop(), self._slots[tool_name].release)
+        )
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), remaining)
+        except asyncio.TimeoutError:
+            print(f"Tool {tool_name} timed out, its thread keeps running")
+            raise ToolTimeout(tool_name, limits.timeout, started=True)
+
+    async def _run_in_process(self, tool_name, args, limits, remaining):
+        sandbox = self._sandbox_for(tool_name, limits)
+        try:
+            return await sandbox.run(tool_name, args, remaining)
+        except asyncio.TimeoutError:
+            print(f"Tool {tool_name} timed out, killed its worker process")
+            raise ToolTimeout(tool_name, limits.timeout, started=True)
+        finally:
+            self._slots[tool_name].release()
+
+    def _slots_for(self, tool_name: str, limits: ToolLimits) -> asyncio.Semaphore:
+        if tool_name not in self._slots:
+            self._slots[tool_name] = asyncio.Semaphore(limits.max_concurrency)
+        return self._slots[tool_name]
+
+    def _sandbox_for(self, tool_name: str, limits: ToolLimits) -> SandboxPool:
+        if tool_name not in self._sandboxes:
+            self._sandboxes[tool_name] = SandboxPool(
+                limits.max_concurrency, self.process_target, self.sandbox_limits
+            )
+        return self._sandboxes[tool_name]
+
+
+def _call_soon(
+    loop: asyncio.AbstractEventLoop, callback: Callable[[], Any]
+) -> Callable[[Future], None]:
+    """Calls back on the loop once a thread's future is done."""
+    return lambda _: loop.call_soon_threadsafe(callback)
@@ -4,8 +4,11 @@ from typing import Any, Iterator, List, Optional
 from langchain_core.callbacks import CallbackManagerForLLMRun
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.messages import BaseMessage, AIMessage
-from langchain_core.outputs import ChatResult, ChatGeneration
+from langchain_core.outputs import ChatResult, ChatGeneration, ChatGenerationChunk
 
+from langchain_community.chat_models.ollama import (
+    _chat_stream_response_to_chat_generation_chunk,
+)
 from langchain_community.llms.ollama import OllamaEndpointNotFoundError, _OllamaCommon
 
 
@@ -65,7 +68,27 @@ class TalusChatOllama(BaseChatModel, _OllamaCommon):
         stop: Optional[List[str]] = None,
         run_manager: Optional[CallbackManagerForLLMRun] = None,
         **kwargs: Any,
-    ) -> Iterator[ChatGeneration]:
-        raise NotImplementedError(
-            "Streaming is not supported for BlockchainChatOllama."
-        )
+    ) -> Iterator[ChatGenerationChunk]:
+        # Call the prompt contract to retrieve the prompt
+        prompt = self.prompt_contract.get_prompt()
+
+        payload = {
+            "model": self.model,
+            "messages": self._convert_messages_to_ollama_messages([prompt]),
+        }
+
+        # Pass the chunks on as Ollama generates them
+        generated_text = ""
+        for stream_resp in self._create_stream(
+            payload=payload, stop=stop, api_url=f"{self.base_url}/api/chat", **kwargs
+        ):
+            if not stream_resp:
+                continue
+            chunk = _chat_stream_response_to_chat_generation_chunk(stream_resp)
+            generated_text += chunk.text
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+        # Call the completion contract to store the whole completion
+        self.completion_contract.store_completion(generated_text)
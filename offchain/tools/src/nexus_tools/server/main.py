@@ -1,27 +1,31 @@
+import os
 import sys
 import logging
 from pathlib import Path
 import json
-from typing import Dict
+from typing import Any, Dict
 
 from .models.completion import Completion
 from .models.error import Error
 from .models.prompt import Prompt
+from .controllers.admission import AdmissionController, Overloaded
+from .controllers.chains import ChainCache, run_tool_calls
+from .controllers.coalescer import SingleFlight, request_key
+from .controllers.routing import NoBackendAvailable
+from .controllers.tool_executor import ToolExecutor, ToolTimeout
 from .controllers.inference import Inference
+from .controllers.scheduler import BatchScheduler
 from .models.model import ModelsResponse
-from .tools.tools import TOOLS, ToolCallBody
+from .tools.cache import tool_cache_from_env
+from .tools.clients import clients as tool_clients
+from .tools.registry import TOOLS
+from .tools.schema import SIDE_EFFECTING_TOOLS, ToolCallBody
 
-import ollama
 from datetime import datetime
 from fastapi import Body, FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 
-from langchain.prompts import PromptTemplate
-from langchain_experimental.llms.ollama_functions import OllamaFunctions
-from langchain.callbacks.manager import CallbackManager
-from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
-from langchain_core.runnables import RunnablePassthrough
-
 from dotenv import load_dotenv  # New user: add .env file with oai key
 
 load_dotenv()
@@ -43,6 +47,78 @@ app = FastAPI(
 
 inference = Inference()
 
+# Opt-in batching of concurrent /predict requests for models served by
+# backends that generate several prompts in one request
+predictor = inference
+if float(os.getenv("INFERENCE_BATCH_WINDOW_MS", "0")) > 0:
+    predictor = BatchScheduler(
+        inference,
+        window=float(os.getenv("INFERENCE_BATCH_WINDOW_MS")) / 1000,
+        max_batch=int(os.getenv("INFERENCE_MAX_BATCH", "16")),
+    )
+
+# Bounded per-model queues, excess requests are rejected with 429
+admission = AdmissionController(
+    inference.capacity,
+    max_queue_depth=int(os.getenv("INFERENCE_MAX_QUEUE_DEPTH", "64")),
+    max_queue_time=float(os.getenv("INFERENCE_MAX_QUEUE_SECONDS", "30")),
+    aging=float(os.getenv("INFERENCE_QUEUE_AGING", "100")),
+)
+
+
+def overloaded(e: Overloaded) -> HTTPException:
+    return HTTPException(
+        status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+# Runs tools on threads or worker processes, with per tool limits and timeouts
+tool_executor = ToolExecutor(TOOLS)
+
+# Identical concurrent requests share one upstream call
+predict_flights = SingleFlight("predict")
+tool_flights = SingleFlight("tool")
+
+# Results of the external knowledge tools, see TOOL_CACHE
+tool_cache = tool_cache_from_env()
+
+# The /prompt_tools chains built so far, by model, temperature and tools
+tool_chains = ChainCache(max_entries=int(os.getenv("PROMPT_TOOLS_CHAINS", "32")))
+
+
+async def call_tool(tool_name: str, args: Dict[str, Any]) -> Any:
+    """
+    Runs a tool through the cache and the executor, identical concurrent
+    calls of tools without side effects run once.
+    """
+
+    async def run_tool():
+        cached, result = await tool_cache.aget(tool_name, args)
+        if cached:
+            print(f"cached result for {tool_name}")
+            return result
+        result = await tool_executor.run(tool_name, args)
+        await tool_cache.aput(tool_name, args, result)
+        return result
+
+    if tool_name in SIDE_EFFECTING_TOOLS:
+        return await tool_executor.run(tool_name, args)
+    return await tool_flights.run(request_key(tool_name, args), run_tool)
+
+
+@app.on_event("startup")
+async def start_inference():
+    await inference.start()
+    tool_executor.start()
+
+
+@app.on_event("shutdown")
+async def close_inference_clients():
+    await inference.close()
+    await tool_executor.close()
+    tool_clients.close()
+    tool_cache.close()
+
 
 @app.post(
     "/predict",
@@ -55,10 +131,18 @@ inference = Inference()
             "model": Error,
             "description": "The request body contains invalid parameters.",
         },
+        429: {
+            "model": Error,
+            "description": "Too many requests are queued for the model, retry after `Retry-After` seconds.",
+        },
         500: {
             "model": Error,
             "description": "An unexpected error occurred while the server was processing the request.",
         },
+        503: {
+            "model": Error,
+            "description": "No inference backend is available for the model.",
+        },
     },
     tags=["default"],
     summary="Get a completion response from the AI model based on the provided prompt and parameters.",
@@ -73,15 +157,104 @@ async def predict(
     print("start... predict")
     print(f"prompt_data: {prompt_data}")
 
-    completion = inference.prompt(
+    async def generate():
+        async with admission.admit(prompt_data.model, prompt_data.max_tokens):
+            return await predictor.prompt(
+                prompt=prompt_data.prompt,
+                model=prompt_data.model,
+                max_tokens=prompt_data.max_tokens,
+                temperature=prompt_data.temperature,
+            )
+
+    key = request_key(
+        prompt_data.model,
+        prompt_data.prompt,
+        prompt_data.max_tokens,
+        prompt_data.temperature,
+    )
+    try:
+        completion = await predict_flights.run(key, generate)
+    except Overloaded as e:
+        raise overloaded(e)
+    except NoBackendAvailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    print(f"completion: {completion}")
+
+    return Completion(completion=json.dumps(completion), timestamp=datetime.now())
+
+
+@app.post(
+    "/predict/stream",
+    responses={
+        200: {
+            "content": {"application/x-ndjson": {}},
+            "description": "The completion, streamed as it is generated.",
+        },
+        400: {
+            "model": Error,
+            "description": "The request body contains invalid parameters.",
+        },
+        429: {
+            "model": Error,
+            "description": "Too many requests are queued for the model, retry after `Retry-After` seconds.",
+        },
+        503: {
+            "model": Error,
+            "description": "No inference backend is available for the model.",
+        },
+    },
+    tags=["default"],
+    summary="Stream a completion from the AI model as it is generated.",
+    response_model_by_alias=True,
+)
+async def predict_stream(
+    prompt_data: Prompt = Body(..., description="The input data for the AI model.")
+) -> StreamingResponse:
+    """
+    Like /predict, but streams the completion as newline delimited JSON.
+
+    Every line is `{"content": ..., "done": false}` with the next piece of the
+    completion, the last line is `{"content": "", "done": true, ...}` with the
+    time to first token and tokens per second of the generation.
+    If generation fails midway, the last line is `{"error": ..., "done": true}`.
+    Closing the connection stops the generation.
+    """
+    print(f"start... predict_stream, prompt_data: {prompt_data}")
+
+    try:
+        admitted_at = await admission.acquire(prompt_data.model, prompt_data.max_tokens)
+    except Overloaded as e:
+        raise overloaded(e)
+
+    chunks = inference.stream(
         prompt=prompt_data.prompt,
         model=prompt_data.model,
         max_tokens=prompt_data.max_tokens,
         temperature=prompt_data.temperature,
     )
-    print(f"completion: {completion}")
-
-    return Completion(completion=json.dumps(completion), timestamp=datetime.now())
+    try:
+        # fail with a proper status code if generation can't even start
+        first = await chunks.__anext__()
+    except NoBackendAvailable as e:
+        admission.release(prompt_data.model, admitted_at)
+        raise HTTPException(status_code=503, detail=str(e))
+    except BaseException:
+        admission.release(prompt_data.model, admitted_at)
+        raise
+
+    async def ndjson():
+        try:
+            yield json.dumps(first) + "\n"
+            async for chunk in chunks:
+                yield json.dumps(chunk) + "\n"
+        except Exception as e:
+            print(f"Error while streaming completion: {e}")
+            yield json.dumps({"error": str(e), "done": True}) + "\n"
+        finally:
+            await chunks.aclose()
+            admission.release(prompt_data.model, admitted_at)
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
 
 
 @app.post(
@@ -96,6 +269,10 @@ async def predict(
             "model": Error,
             "description": "An unexpected error occurred while processing the request.",
         },
+        504: {
+            "model": Error,
+            "description": "The tool didn't finish within its timeout.",
+        },
     },
     tags=["default"],
     summary="Use a specified tool to process the provided query.",
@@ -113,11 +290,16 @@ async def use_tool(tool_call_body: ToolCallBody) -> Dict[str, str]:
             status_code=400, detail=f"Unknown tool: {tool_call_body.tool_name}"
         )
 
+    tool_name = tool_call_body.tool_name
+    args = tool_call_body.args.dict()
+
     try:
-        tool = TOOLS[tool_call_body.tool_name]
-        result = tool._run(**tool_call_body.args.dict())
+        result = await call_tool(tool_name, args)
         print(f"tool result: {result}")
         return {"result": result}
+    except ToolTimeout as e:
+        print(f"Tool timed out: {e}")
+        raise HTTPException(status_code=504, detail=e.detail())
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except openai.OpenAIError as e:
@@ -150,74 +332,34 @@ def complete_json(incomplete_json):
 
 @app.post("/prompt_tools", response_model=Completion)
 async def prompt_tools(prompt_data: Prompt = Body(...)):
-    def wrap_clusterai_tool(tool):
-        def wrapped(**kwargs):
-            return tool._run(**kwargs)
-
-        return wrapped
-
-    wrapped_tools = {name: wrap_clusterai_tool(tool) for name, tool in TOOLS.items()}
-
     try:
         print(f"Received prompt: {prompt_data.prompt}")
         print(f"Selected tools: {prompt_data.tools}")
 
-        llm = OllamaFunctions(
-            model=prompt_data.model,
-            temperature=prompt_data.temperature,
-            callback_manager=CallbackManager([StreamingStdOutCallbackHandler()]),
-            format="json",
-        )
-        print("OllamaFunctions initialized")
-
-        selected_tools = []
-        for tool_name in prompt_data.tools:
-            if tool_name in TOOLS:
-                tool = TOOLS[tool_name]
-                selected_tools.append(
-                    {
-                        "name": tool.name,
-                        "description": tool.description,
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "query": {"type": "string"},
-                            },
-                            "required": ["query"],
-                        },
-                    }
-                )
-                print(f"Added tool: {tool.name}")
-            else:
+        tools = prompt_data.tools or []
+        for tool_name in tools:
+            if tool_name not in TOOLS:
                 raise ValueError(f"Unknown tool: {tool_name}")
 
-        llm_with_tools = llm.bind_tools(selected_tools)
-        print("Tools bound to LLM")
-
-        prompt_template = PromptTemplate(
-            input_variables=["input"],
-            template="Answer the following question, using the provided tools if necessary. Always use a tool before answering: {input}",
-        )
-        print("Prompt template created")
-
-        chain = {"input": RunnablePassthrough()} | prompt_template | llm_with_tools
-        print("RunnableSequence created")
+        chain = tool_chains.get(prompt_data.model, prompt_data.temperature, tools)
 
         print("Invoking the chain")
-        result = chain.invoke(prompt_data.prompt)
+        result = await chain.ainvoke(prompt_data.prompt)
         print(f"Chain result: {result}")
 
         # Process the result
-        if isinstance(result, str):
+        if getattr(result, "tool_calls", None):
+            final_result = await run_tool_calls(result.tool_calls, call_tool)
+        elif isinstance(result, str):
             try:
                 result_json = complete_json(result)
                 if "tool" in result_json:
                     tool_name = result_json["tool"]
                     tool_input = result_json["tool_input"]
                     print(f"Executing tool: {tool_name} with input: {tool_input}")
-                    tool_result = wrapped_tools[tool_name](**tool_input)
-                    print(f"Tool result: {tool_result}")
-                    final_result = f"Tool {tool_name} returned: {tool_result}"
+                    final_result = await run_tool_calls(
+                        [{"name": tool_name, "args": tool_input}], call_tool
+                    )
                 else:
                     final_result = json.dumps(result_json)
             except Exception as e:
@@ -240,19 +382,25 @@ async def prompt_tools(prompt_data: Prompt = Body(...)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-def execute_tool_call(tool_call):
-    tool_name = tool_call["name"]
-    args = tool_call["args"]
-
-    if tool_name not in TOOLS:
-        raise ValueError(f"Unknown tool: {tool_name}")
-
-    tool = TOOLS[tool_name]
-    return tool._run(**args)
+@app.get("/stats", tags=["default"], summary="Statistics of the request handling.")
+async def get_stats() -> Dict[str, Any]:
+    stats = {
+        "coalescing": {
+            "predict": predict_flights.stats(),
+            "tool": tool_flights.stats(),
+        },
+        "admission": admission.stats(),
+        "tool_cache": tool_cache.stats(),
+        "sandboxes": tool_executor.stats(),
+        "tool_chains": tool_chains.stats(),
+    }
+    if isinstance(predictor, BatchScheduler):
+        stats["batching"] = predictor.stats()
+    return stats
 
 
 @app.get("/models", response_model=ModelsResponse)
 async def get_models() -> ModelsResponse:
-    models_res = ollama.list()
+    models_res = await inference.list_models()
     print(models_res["models"])
     return ModelsResponse(models=models_res["models"])
@@ -13,10 +13,11 @@ class ModelDetail(BaseModel):
 
 class Model(BaseModel):
     name: str
-    modified_at: datetime
-    size: int
-    digest: str
-    details: ModelDetail
+    # only Ollama backends know these
+    modified_at: Optional[datetime] = None
+    size: Optional[int] = None
+    digest: Optional[str] = None
+    details: Optional[ModelDetail] = None
 
 
 class ModelsResponse(BaseModel):
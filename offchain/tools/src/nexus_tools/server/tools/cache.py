@@ -0,0 +1,260 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from .schema import SIDE_EFFECTING_TOOLS, TOOL_ARGS_MAPPING
+
+
+@dataclass
+class CachePolicy:
+    """
+    Results of a tool are kept for `ttl` seconds, at most `max_entries` of them.
+    Failures the tool reports as its result are kept for `error_ttl` seconds,
+    by default not at all.
+    """
+
+    ttl: float = 3600.0
+    max_entries: int = 1000
+    error_ttl: float = 0.0
+
+
+# external knowledge changes slowly, except for web search results
+DEFAULT_POLICIES = {
+    "search": CachePolicy(ttl=3600.0),
+    "tavily_search": CachePolicy(ttl=3600.0),
+    "wikipedia": CachePolicy(ttl=24 * 3600.0),
+    "arxiv": CachePolicy(ttl=24 * 3600.0),
+    "pubmed": CachePolicy(ttl=24 * 3600.0),
+}
+
+# Queries of these tools are compared ignoring case, arguments of other tools,
+# e.g. URLs or code, may be case sensitive.
+CASE_INSENSITIVE_TOOLS = {"search", "tavily_search", "wikipedia", "arxiv", "pubmed"}
+
+# How the tools report failures, or finding nothing, instead of raising
+ERROR_PREFIXES = (
+    "Error scraping website:",
+    "Arxiv exception:",
+    "PubMed exception:",
+    "No good DuckDuckGo Search Result was found",
+    "No good Wikipedia Search Result was found",
+    "No good Arxiv Result was found",
+    "No good PubMed Result was found",
+)
+
+
+class ToolCache:
+    """
+    Caches the results of tools that look up external knowledge.
+
+    Results are kept in an in-memory LRU of `memory_entries` results and, if
+    a `path` is given, in an SQLite file, so they survive restarts and are
+    shared by the server's processes.
+    Only tools with a `CachePolicy` are cached, never ones with side effects.
+
+    Arguments are normalized through the tool's argument model, and string
+    arguments are compared ignoring surrounding or repeated whitespace, and
+    for `CASE_INSENSITIVE_TOOLS` case, so trivially different queries share a
+    result.
+    Results that report a failure are only kept for the policy's `error_ttl`.
+
+    On the event loop use `aget` and `aput`, which do the file's I/O in a
+    worker thread.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        policies: Optional[Dict[str, CachePolicy]] = None,
+        memory_entries: int = 1024,
+    ):
+        if policies is None:
+            policies = DEFAULT_POLICIES
+        for tool_name in set(policies) & SIDE_EFFECTING_TOOLS:
+            raise ValueError(f"Tool {tool_name} has side effects and can't be cached")
+
+        self.policies = policies
+        self.memory_entries = memory_entries
+        # key -> (tool name, result, expires at)
+        self._memory: "OrderedDict[str, Tuple[str, Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            name: {"memory_hits": 0, "disk_hits": 0, "misses": 0} for name in policies
+        }
+
+        self._db = None
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, tool TEXT NOT NULL, result TEXT NOT NULL, "
+                "expires REAL NOT NULL, used REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS results_used ON results (tool, used)"
+            )
+            self._db.commit()
+
+    def caches(self, tool_name: str) -> bool:
+        return tool_name in self.policies
+
+    def get(self, tool_name: str, args: Dict[str, Any]) -> Tuple[bool, Any]:
+        """Returns whether the result is cached, and if so the result."""
+        if not self.caches(tool_name):
+            return False, None
+
+        key = cache_key(tool_name, args)
+        now = time.time()
+        stats = self._stats[tool_name]
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None and cached[2] > now:
+                self._memory.move_to_end(key)
+                stats["memory_hits"] += 1
+                return True, cached[1]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT result, expires FROM results WHERE key = ? AND expires > ?",
+                    (key, now),
+                ).fetchone()
+                if row is not None:
+                    result = json.loads(row[0])
+                    self._db.execute(
+                        "UPDATE results SET used = ? WHERE key = ?", (now, key)
+                    )
+                    self._db.commit()
+                    self._remember(key, tool_name, result, row[1])
+                    stats["disk_hits"] += 1
+                    return True, result
+
+            stats["misses"] += 1
+            return False, None
+
+    def put(self, tool_name: str, args: Dict[str, Any], result: Any):
+        if not self.caches(tool_name):
+            return
+
+        policy = self.policies[tool_name]
+        ttl = policy.error_ttl if is_error_result(tool_name, result) else policy.ttl
+        if ttl <= 0:
+            return
+        key = cache_key(tool_name, args)
+        now = time.time()
+        expires = now + ttl
+        with self._lock:
+            self._remember(key, tool_name, result, expires)
+            if self._db is None:
+                return
+
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, tool, result, expires, used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, tool_name, json.dumps(result), expires, now),
+            )
+            # expired results first, then the least recently used ones
+            self._db.execute(
+                "DELETE FROM results WHERE tool = ? AND expires <= ?", (tool_name, now)
+            )
+            self._db.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results "
+                "WHERE tool = ? ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (tool_name, policy.max_entries),
+            )
+            self._db.commit()
+
+    async def aget(self, tool_name: str, args: Dict[str, Any]) -> Tuple[bool, Any]:
+        if self._db is None or not self.caches(tool_name):
+            return self.get(tool_name, args)
+        return await asyncio.to_thread(self.get, tool_name, args)
+
+    async def aput(self, tool_name: str, args: Dict[str, Any], result: Any):
+        if self._db is None or not self.caches(tool_name):
+            return self.put(tool_name, args, result)
+        await asyncio.to_thread(self.put, tool_name, args, result)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {}
+        for tool_name, counts in self._stats.items():
+            hits = counts["memory_hits"] + counts["disk_hits"]
+            lookups = hits + counts["misses"]
+            stats[tool_name] = {
+                **counts,
+                "hit_ratio": hits / lookups if lookups else 0.0,
+            }
+        return stats
+
+    def close(self):
+        # a worker thread may still be using the connection
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _remember(self, key: str, tool_name: str, result: Any, expires: float):
+        self._memory[key] = (tool_name, result, expires)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+        # the per tool cap applies to memory too
+        entries = [k for k, v in self._memory.items() if v[0] == tool_name]
+        for k in entries[: max(len(entries) - self.policies[tool_name].max_entries, 0)]:
+            del self._memory[k]
+
+
+def cache_key(tool_name: str, args: Dict[str, Any]) -> str:
+    args_model = TOOL_ARGS_MAPPING.get(tool_name)
+    if args_model is not None:
+        args = args_model(**args).dict()
+    ignore_case = tool_name in CASE_INSENSITIVE_TOOLS
+    normalized = {name: _normalize(value, ignore_case) for name, value in args.items()}
+    content = json.dumps([tool_name, normalized], sort_keys=True, default=str)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def is_error_result(tool_name: str, result: Any) -> bool:
+    """Whether the tool returned a failure instead of raising it."""
+    if not isinstance(result, str):
+        return False
+    if result.startswith(ERROR_PREFIXES):
+        return True
+    if tool_name == "tavily_search":
+        # the results are a JSON list, a failure is the exception's repr
+        try:
+            return not isinstance(json.loads(result), list)
+        except ValueError:
+            return True
+    return False
+
+
+def _normalize(value: Any, ignore_case: bool) -> Any:
+    if isinstance(value, str):
+        value = " ".join(value.split())
+        return value.casefold() if ignore_case else value
+    return value
+
+
+def tool_cache_from_env() -> ToolCache:
+    """
+    The cache as configured by `TOOL_CACHE_FILE`, empty to only cache in
+    memory, and `TOOL_CACHE`, a JSON object overriding the policies, e.g.
+    `{"search": {"ttl": 600}, "wikipedia": null}` where null disables caching.
+    """
+    policies = dict(DEFAULT_POLICIES)
+    for tool_name, config in json.loads(os.getenv("TOOL_CACHE", "{}")).items():
+        if config is None:
+            policies.pop(tool_name, None)
+        else:
+            policies[tool_name] = CachePolicy(**config)
+    return ToolCache(os.getenv("TOOL_CACHE_FILE", "tool_cache.sqlite"), policies)
@@ -0,0 +1,84 @@
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class ClientRegistry:
+    """
+    Builds the clients tools talk to once per process and reuses them.
+
+    `get` creates a client on first use, tools then share it across calls and
+    threads, and with it any connections it keeps alive.
+    Clients registered with a `close` function are torn down by `close`, in
+    reverse order of creation.
+    """
+
+    def __init__(self, max_connections: int = 20):
+        self.max_connections = max_connections
+        self._clients: Dict[str, Any] = {}
+        self._closers: List[Tuple[str, Callable[[Any], Any]]] = []
+        self._lock = threading.RLock()
+
+    def get(
+        self,
+        name: str,
+        factory: Callable[[], Any],
+        close: Optional[Callable[[Any], Any]] = None,
+    ) -> Any:
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+
+        with self._lock:
+            # another thread may have built it while we waited
+            if name not in self._clients:
+                self._clients[name] = factory()
+                if close is not None:
+                    self._closers.append((name, close))
+            return self._clients[name]
+
+    def http(self) -> httpx.Client:
+        """A keep-alive HTTP client shared by the clients that accept one."""
+        return self.get(
+            "httpx",
+            lambda: httpx.Client(
+                timeout=httpx.Timeout(60.0, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            ),
+            close=lambda client: client.close(),
+        )
+
+    def session(self) -> requests.Session:
+        """A keep-alive `requests` session for tools built on `requests`."""
+
+        def create() -> requests.Session:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=self.max_connections,
+                pool_maxsize=self.max_connections,
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            return session
+
+        return self.get("requests", create, close=lambda session: session.close())
+
+    def close(self):
+        with self._lock:
+            closers, self._closers = self._closers, []
+            for name, close in reversed(closers):
+                try:
+                    close(self._clients[name])
+                except Exception as e:
+                    print(f"Error closing tool client {name}: {e}")
+            self._clients.clear()
+
+
+# the clients of this process
+clients = ClientRegistry()
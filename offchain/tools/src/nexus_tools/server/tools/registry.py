@@ -0,0 +1,48 @@
+import threading
+from typing import Any, Iterator, Mapping
+
+from .schema import TOOL_DESCRIPTIONS
+
+
+class LazyTools(Mapping):
+    """
+    The tools by name, whose implementations are only imported once a tool is
+    first used.
+
+    Listing and looking up tool names doesn't import anything, so code that
+    just needs to know which tools exist stays light.
+    """
+
+    def __init__(self):
+        self._tools = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._tools is not None
+
+    def load(self) -> Mapping[str, Any]:
+        if self._tools is None:
+            with self._lock:
+                if self._tools is None:
+                    from .tools import TOOLS
+
+                    self._tools = TOOLS
+        return self._tools
+
+    def __getitem__(self, name: str) -> Any:
+        if name not in TOOL_DESCRIPTIONS:
+            raise KeyError(name)
+        return self.load()[name]
+
+    def __contains__(self, name: object) -> bool:
+        return name in TOOL_DESCRIPTIONS
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(TOOL_DESCRIPTIONS)
+
+    def __len__(self) -> int:
+        return len(TOOL_DESCRIPTIONS)
+
+
+TOOLS = LazyTools()
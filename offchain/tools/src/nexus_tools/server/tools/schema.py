@@ -0,0 +1,156 @@
+"""
+The tools' names, descriptions and arguments, without their implementations.
+
+This is all the listener needs, so it doesn't import the implementations and
+their dependencies, see `registry` for the tools themselves.
+"""
+
+from typing import Union
+
+from pydantic import BaseModel, Field, model_validator
+
+
+class GeminiToolArgs(BaseModel):
+    prompt: str = Field(..., description="The prompt for the Gemini model")
+    model: str = Field(default="gemini-pro", description="The Gemini model to use")
+
+
+class SearchToolArgs(BaseModel):
+    query: str = Field(..., description="The search query to be used")
+    num_results: str = Field(..., description="Number of results to return")
+
+
+class WikipediaToolArgs(BaseModel):
+    query: str = Field(..., description="The Wikipedia query to be used")
+
+
+class ArxivToolArgs(BaseModel):
+    query: str = Field(..., description="The Arxiv query to be used")
+
+
+class PubmedToolArgs(BaseModel):
+    query: str = Field(..., description="The Pubmed query to be used")
+
+
+class SceneExplainToolArgs(BaseModel):
+    image_url: str = Field(..., description="The URL of the image to be explained")
+
+
+class ShellToolArgs(BaseModel):
+    command: str = Field(..., description="The shell command to be executed")
+
+
+class TavilySearchToolArgs(BaseModel):
+    query: str = Field(..., description="The Tavily search query to be used")
+
+
+class PythonREPLToolArgs(BaseModel):
+    code: str = Field(..., description="The Python code to be executed")
+
+
+class ReadFileToolArgs(BaseModel):
+    file_path: str = Field(..., description="The path of the file to be read")
+
+
+class ListDirectoryToolArgs(BaseModel):
+    directory_path: str = Field(
+        ..., description="The path of the directory to be listed"
+    )
+
+
+class GPT4VisionToolArgs(BaseModel):
+    image_url: str = Field(..., description="The URL of the image to analyze")
+    prompt: str = Field(..., description="The prompt for image analysis")
+
+
+class DALLE3ToolArgs(BaseModel):
+    prompt: str = Field(..., description="The prompt for image generation")
+
+
+class OpenAIEmbeddingsToolArgs(BaseModel):
+    text: str = Field(..., description="The text to create embeddings for")
+
+
+class BrowserToolArgs(BaseModel):
+    url: str = Field(..., description="The URL of the website to scrape and summarize")
+
+
+class InstagramSearchToolArgs(BaseModel):
+    query: str = Field(..., description="The Instagram-specific search query")
+
+
+ToolArgs = Union[
+    GeminiToolArgs,
+    SearchToolArgs,
+    WikipediaToolArgs,
+    ArxivToolArgs,
+    PubmedToolArgs,
+    SceneExplainToolArgs,
+    ShellToolArgs,
+    TavilySearchToolArgs,
+    PythonREPLToolArgs,
+    ReadFileToolArgs,
+    ListDirectoryToolArgs,
+    GPT4VisionToolArgs,
+    DALLE3ToolArgs,
+    OpenAIEmbeddingsToolArgs,
+    BrowserToolArgs,
+    InstagramSearchToolArgs,
+]
+
+
+class ToolCallBody(BaseModel):
+    tool_name: str = Field(..., description="Name of the tool to call")
+    args: ToolArgs
+
+    @model_validator(mode="before")
+    @classmethod
+    def args_of_tool(cls, values):
+        # several tools take the same arguments, validate them as the tool's own
+        args_model = TOOL_ARGS_MAPPING.get(values.get("tool_name"))
+        if args_model is not None and isinstance(values.get("args"), dict):
+            values = {**values, "args": args_model(**values["args"])}
+        return values
+
+
+TOOL_ARGS_MAPPING = {
+    "gemini": GeminiToolArgs,
+    "search": SearchToolArgs,
+    "wikipedia": WikipediaToolArgs,
+    "arxiv": ArxivToolArgs,
+    "pubmed": PubmedToolArgs,
+    "scene_explain": SceneExplainToolArgs,
+    "shell": ShellToolArgs,
+    "tavily_search": TavilySearchToolArgs,
+    "python_repl": PythonREPLToolArgs,
+    "read_file": ReadFileToolArgs,
+    "list_directory": ListDirectoryToolArgs,
+    "gpt4_vision": GPT4VisionToolArgs,
+    "dalle3": DALLE3ToolArgs,
+    "openai_embeddings": OpenAIEmbeddingsToolArgs,
+    "browser": BrowserToolArgs,
+    "instagram_search": InstagramSearchToolArgs,
+}
+
+TOOL_DESCRIPTIONS = {
+    "gemini": "Useful for generating text using Google's Gemini AI model.",
+    "search": "Useful for searching the web for current information.",
+    "wikipedia": "Useful for querying Wikipedia for general knowledge.",
+    "arxiv": "Useful for searching academic papers on arXiv.",
+    "pubmed": "Useful for searching medical and life sciences literature.",
+    "scene_explain": "Useful for explaining the contents of an image.",
+    "shell": "Useful for running shell commands.",
+    "tavily_search": "Useful for performing searches using Tavily.",
+    "python_repl": "Useful for executing Python code.",
+    "read_file": "Useful for reading the contents of a file.",
+    "list_directory": "Useful for listing the contents of a directory.",
+    "gpt4_vision": "Useful for analyzing images using GPT-4 Vision.",
+    "dalle3": "Useful for generating images based on text prompts.",
+    "openai_embeddings": "Useful for creating text embeddings using OpenAI's API.",
+    "browser": "Useful for browsing websites and summarizing their content.",
+    "instagram_search": "Useful for searching Instagram for images and videos.",
+}
+
+# tools whose calls change something or whose results differ on every call,
+# so two calls are never interchangeable
+SIDE_EFFECTING_TOOLS = {"shell", "python_repl", "dalle3"}
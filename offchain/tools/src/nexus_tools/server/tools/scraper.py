@@ -0,0 +1,269 @@
+import codecs
+import json
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from .clients import clients
+
+# content that's never part of a page's main text
+_SKIPPED_TAGS = {
+    "script",
+    "style",
+    "noscript",
+    "template",
+    "svg",
+    "canvas",
+    "iframe",
+    "head",
+    "nav",
+    "header",
+    "footer",
+    "aside",
+    "form",
+    "button",
+    "select",
+}
+_BLOCK_TAGS = {
+    "p",
+    "div",
+    "section",
+    "article",
+    "main",
+    "br",
+    "li",
+    "tr",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+    "pre",
+    "blockquote",
+}
+
+
+class TextExtractor(HTMLParser):
+    """
+    Extracts the readable text of an HTML page as it's fed, one paragraph
+    per block element, leaving out scripts, navigation and the like.
+
+    Once `max_chars` characters are collected `done` is set, so the caller
+    can stop feeding it.
+    """
+
+    def __init__(self, max_chars: int):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.done = False
+        self._skipping = 0
+        self._paragraphs: List[str] = []
+        self._current: List[str] = []
+        self._length = 0
+        # whether the last data ended inside a word
+        self._in_word = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIPPED_TAGS:
+            self._skipping += 1
+        elif tag in _BLOCK_TAGS:
+            self._end_paragraph()
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in _BLOCK_TAGS:
+            self._end_paragraph()
+
+    def handle_endtag(self, tag):
+        if tag in _SKIPPED_TAGS and self._skipping:
+            self._skipping -= 1
+        elif tag in _BLOCK_TAGS:
+            self._end_paragraph()
+
+    def handle_data(self, data):
+        if self._skipping or self.done:
+            return
+        words = data.split()
+        # a word can be fed in pieces, e.g. when it spans two chunks
+        if words and self._current and self._in_word and not data[0].isspace():
+            self._current[-1] += words[0]
+            self._length += len(words.pop(0))
+        self._in_word = bool(data) and not data[-1].isspace()
+        if self._length >= self.max_chars:
+            self.done = True
+            return
+        for word in words:
+            # the length of the text so far, separators included
+            if self._current:
+                self._length += 1
+            elif self._paragraphs:
+                self._length += 2
+            self._current.append(word)
+            self._length += len(word)
+            if self._length >= self.max_chars:
+                self.done = True
+                return
+
+    def text(self) -> str:
+        self._end_paragraph()
+        return "\n\n".join(self._paragraphs)
+
+    def _end_paragraph(self):
+        if self._current:
+            self._paragraphs.append(" ".join(self._current))
+            self._current = []
+
+
+def scrape(
+    url: str,
+    max_chars: int,
+    max_bytes: int,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Fetches the page and extracts its text, meant to run in a worker process.
+
+    The page is streamed and parsed as it arrives, the download stops as
+    soon as there's enough text or after `max_bytes`.
+    Given the validators of a cached copy, a page that hasn't changed isn't
+    downloaded again and `{"not_modified": True}` is returned.
+    """
+    browserless_api_key = os.getenv("BROWSERLESS_API_KEY")
+    try:
+        if browserless_api_key:
+            # rendered by a headless browser, for pages that need JavaScript
+            response = clients.session().post(
+                f"https://chrome.browserless.io/content?token={browserless_api_key}",
+                headers={"content-type": "application/json"},
+                data=json.dumps({"url": url}),
+                stream=True,
+                timeout=(10, 60),
+            )
+        else:
+            headers = {}
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+            response = clients.session().get(
+                url, headers=headers, stream=True, timeout=(10, 30)
+            )
+
+        with response:
+            if response.status_code == 304:
+                return {"not_modified": True}
+            response.raise_for_status()
+
+            content_type = response.headers.get("Content-Type", "text/html")
+            if "html" not in content_type and not content_type.startswith("text/"):
+                return {"error": f"Unsupported content type {content_type}"}
+
+            # without an explicit charset requests assumes Latin-1, most pages are UTF-8
+            encoding = response.encoding if "charset" in content_type else "utf-8"
+            decoder = codecs.getincrementaldecoder(encoding or "utf-8")("replace")
+            extractor = TextExtractor(max_chars)
+            received = 0
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                received += len(chunk)
+                extractor.feed(decoder.decode(chunk))
+                if extractor.done or received >= max_bytes:
+                    break
+            # a multibyte character cut off at the end is still pending
+            extractor.feed(decoder.decode(b"", final=True))
+            extractor.close()
+
+            return {
+                "text": extractor.text(),
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+    except requests.RequestException as e:
+        return {"error": str(e)}
+
+
+class Scraper:
+    """
+    Extracts the text of web pages in a pool of worker processes, see `scrape`.
+
+    The text of up to `cache_entries` pages is cached along with their ETag
+    or Last-Modified, and revalidated on every request.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 2 * 1024 * 1024,
+        workers: int = 2,
+        cache_entries: int = 256,
+    ):
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.cache_entries = cache_entries
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def text(self, url: str, max_chars: int) -> Dict[str, Any]:
+        """Returns `{"text": ...}`, or `{"error": ...}` if the page can't be had."""
+        with self._lock:
+            cached = self._cache.get(url)
+        if cached is not None and len(cached["text"]) < max_chars and cached["cut"]:
+            # the cached text is too short for this request
+            cached = None
+
+        result = (
+            self._worker_pool()
+            .submit(
+                scrape,
+                url,
+                max_chars,
+                self.max_bytes,
+                cached and cached["etag"],
+                cached and cached["last_modified"],
+            )
+            .result()
+        )
+        if result.get("not_modified"):
+            return {"text": cached["text"]}
+        if "error" in result:
+            return result
+
+        if result["etag"] or result["last_modified"]:
+            with self._lock:
+                self._cache[url] = {**result, "cut": len(result["text"]) >= max_chars}
+                self._cache.move_to_end(url)
+                while len(self._cache) > self.cache_entries:
+                    self._cache.popitem(last=False)
+        return {"text": result["text"]}
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _worker_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawned, forking the multi threaded server isn't safe
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._pool
+
+
+def scraper() -> Scraper:
+    return clients.get(
+        "scraper",
+        lambda: Scraper(
+            max_bytes=int(os.getenv("SCRAPER_MAX_BYTES", str(2 * 1024 * 1024))),
+            workers=int(os.getenv("SCRAPER_WORKERS", "2")),
+        ),
+        close=lambda scraper: scraper.close(),
+    )
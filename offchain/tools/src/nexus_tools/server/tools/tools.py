@@ -3,12 +3,10 @@ import json
 from pathlib import Path
 import requests
 import os
-from pydantic import BaseModel, Field
 
 root_path = Path(__file__).resolve().parent.parent
 sys.path.append(str(root_path))
-from pydantic import BaseModel, Field
-from typing import Any, Union, Callable
+from typing import Any, Awaitable, Callable, Optional
 
 from langchain_community.tools import DuckDuckGoSearchRun, WikipediaQueryRun
 from langchain_community.utilities import WikipediaAPIWrapper
@@ -27,10 +25,14 @@ from langchain_community.tools import (
 import google.generativeai as genai
 from crewai_tools import BaseTool
 from openai import OpenAI
-from unstructured.partition.html import partition_html
 
 from dotenv import load_dotenv
 
+from .clients import clients
+
+# the schema used to live here, keep importing it from here working
+from .schema import TOOL_ARGS_MAPPING, TOOL_DESCRIPTIONS, ToolArgs, ToolCallBody
+
 load_dotenv()
 import os
 
@@ -39,99 +41,51 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 SCENEX_API_KEY = os.getenv("SCENEX_API_KEY")
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-genai.configure(api_key=GOOGLE_API_KEY)
-
-
-class GeminiToolArgs(BaseModel):
-    prompt: str = Field(..., description="The prompt for the Gemini model")
-    model: str = Field(default="gemini-pro", description="The Gemini model to use")
-
-
-class SearchToolArgs(BaseModel):
-    query: str = Field(..., description="The search query to be used")
-    num_results: str = Field(..., description="Number of results to return")
-
-
-class WikipediaToolArgs(BaseModel):
-    query: str = Field(..., description="The Wikipedia query to be used")
-
-
-class ArxivToolArgs(BaseModel):
-    query: str = Field(..., description="The Arxiv query to be used")
-
-
-class PubmedToolArgs(BaseModel):
-    query: str = Field(..., description="The Pubmed query to be used")
-
-
-class SceneExplainToolArgs(BaseModel):
-    image_url: str = Field(..., description="The URL of the image to be explained")
-
-
-class ShellToolArgs(BaseModel):
-    command: str = Field(..., description="The shell command to be executed")
-
-
-class TavilySearchToolArgs(BaseModel):
-    query: str = Field(..., description="The Tavily search query to be used")
-
 
-class PythonREPLToolArgs(BaseModel):
-    code: str = Field(..., description="The Python code to be executed")
 
-
-class ReadFileToolArgs(BaseModel):
-    file_path: str = Field(..., description="The path of the file to be read")
-
-
-class ListDirectoryToolArgs(BaseModel):
-    directory_path: str = Field(
-        ..., description="The path of the directory to be listed"
+def openai_client() -> OpenAI:
+    return clients.get(
+        "openai",
+        lambda: OpenAI(api_key=OPENAI_API_KEY, http_client=clients.http()),
     )
 
 
-class GPT4VisionToolArgs(BaseModel):
-    image_url: str = Field(..., description="The URL of the image to analyze")
-    prompt: str = Field(..., description="The prompt for image analysis")
-
-
-class DALLE3ToolArgs(BaseModel):
-    prompt: str = Field(..., description="The prompt for image generation")
+def duckduckgo() -> DuckDuckGoSearchRun:
+    return clients.get("duckduckgo", DuckDuckGoSearchRun)
 
 
-class OpenAIEmbeddingsToolArgs(BaseModel):
-    text: str = Field(..., description="The text to create embeddings for")
+def configured_genai():
+    """genai is configured on first use rather than on import."""
 
+    def configure():
+        genai.configure(api_key=GOOGLE_API_KEY)
+        return genai
 
-ToolArgs = Union[
-    SearchToolArgs,
-    WikipediaToolArgs,
-    ArxivToolArgs,
-    PubmedToolArgs,
-    SceneExplainToolArgs,
-    ShellToolArgs,
-    TavilySearchToolArgs,
-    PythonREPLToolArgs,
-    ReadFileToolArgs,
-    ListDirectoryToolArgs,
-    GPT4VisionToolArgs,
-    DALLE3ToolArgs,
-    OpenAIEmbeddingsToolArgs,
-]
+    return clients.get("genai", configure)
 
 
-class ToolCallBody(BaseModel):
-    tool_name: str = Field(..., description="Name of the tool to call")
-    args: ToolArgs
+def gemini(model: str) -> genai.GenerativeModel:
+    return clients.get(
+        f"gemini:{model}", lambda: configured_genai().GenerativeModel(model)
+    )
 
 
 def create_clusterai_tool(
-    tool_name: str, tool_description: str, my_lambda_function: Callable[..., Any]
+    tool_name: str,
+    tool_description: str,
+    my_lambda_function: Callable[..., Any],
+    my_async_function: Optional[Callable[..., Awaitable[Any]]] = None,
 ) -> BaseTool:
+    """
+    `my_async_function` is an optional native async implementation, which the
+    server prefers over running `my_lambda_function` on a thread.
+    """
+
     class CustomTool(BaseTool):
         name: str = tool_name
         description: str = tool_description
         function: Callable[..., Any] = my_lambda_function
+        async_function: Optional[Callable[..., Awaitable[Any]]] = my_async_function
 
         def __init__(self):
             super().__init__()
@@ -139,137 +93,123 @@ def create_clusterai_tool(
         def _run(self, **kwargs: Any) -> Any:
             return self.function(**kwargs)
 
+        async def _arun(self, **kwargs: Any) -> Any:
+            if self.async_function is None:
+                return self.function(**kwargs)
+            return await self.async_function(**kwargs)
+
     return CustomTool()
 
 
 class BrowserTools:
+    # the summary is the start of the page's text
+    SUMMARY_CHARS = 1000
+
     @staticmethod
     def scrape_and_summarize_website(url: str) -> str:
-        browserless_api_key = os.getenv("BROWSERLESS_API_KEY")
-        if not browserless_api_key:
-            return "Error: BROWSERLESS_API_KEY is not set in the environment variables."
-
-        browserless_url = (
-            f"https://chrome.browserless.io/content?token={browserless_api_key}"
+        from .scraper import scraper
+
+        # agents tend to pass the URL wrapped in whitespace, or labelled
+        url = url.strip()
+        if url[:4].lower() == "url:":
+            url = url[4:].strip()
+        result = scraper().text(url, BrowserTools.SUMMARY_CHARS + 1)
+        if "error" in result:
+            return f"Error scraping website: {result['error']}"
+
+        content = result["text"]
+        summary = (
+            content[: BrowserTools.SUMMARY_CHARS] + "..."
+            if len(content) > BrowserTools.SUMMARY_CHARS
+            else content
         )
-        payload = json.dumps({"url": url})
-        headers = {"cache-control": "no-cache", "content-type": "application/json"}
-
-        try:
-            response = requests.post(browserless_url, headers=headers, data=payload)
-            response.raise_for_status()
-            elements = partition_html(text=response.text)
-            content = "\n\n".join([str(el) for el in elements])
-
-            # Simple summarization (you may want to implement a more sophisticated summarization method)
-            summary = content[:1000] + "..." if len(content) > 1000 else content
-            return f"Summary of {url}:\n\n{summary}"
-        except requests.RequestException as e:
-            return f"Error scraping website: {str(e)}"
+        return f"Summary of {url}:\n\n{summary}"
 
 
 class InstagramSearchTools:
     @staticmethod
     def search_instagram(query: str) -> str:
         instagram_query = f"site:instagram.com {query}"
-        search_tool = DuckDuckGoSearchRun()
-        results = search_tool.run(instagram_query)
+        results = duckduckgo().run(instagram_query)
         return f"Instagram search results for '{query}':\n\n{results}"
 
 
-class BrowserToolArgs(BaseModel):
-    url: str = Field(..., description="The URL of the website to scrape and summarize")
-
-
-class InstagramSearchToolArgs(BaseModel):
-    query: str = Field(..., description="The Instagram-specific search query")
-
-
-TOOL_ARGS_MAPPING = {
-    "gemini": GeminiToolArgs,
-    "search": SearchToolArgs,
-    "wikipedia": WikipediaToolArgs,
-    "arxiv": ArxivToolArgs,
-    "pubmed": PubmedToolArgs,
-    "scene_explain": SceneExplainToolArgs,
-    "shell": ShellToolArgs,
-    "tavily_search": TavilySearchToolArgs,
-    "python_repl": PythonREPLToolArgs,
-    "read_file": ReadFileToolArgs,
-    "list_directory": ListDirectoryToolArgs,
-    "gpt4_vision": GPT4VisionToolArgs,
-    "dalle3": DALLE3ToolArgs,
-    "openai_embeddings": OpenAIEmbeddingsToolArgs,
-    "browser": BrowserToolArgs,
-    "instagram_search": InstagramSearchToolArgs,
-}
-
 TOOLS = {
     "gemini": create_clusterai_tool(
         "gemini",
-        "Useful for generating text using Google's Gemini AI model.",
-        lambda prompt, model="gemini-pro": genai.GenerativeModel(model)
-        .generate_content(prompt)
-        .text,
+        TOOL_DESCRIPTIONS["gemini"],
+        lambda prompt, model="gemini-pro": gemini(model).generate_content(prompt).text,
     ),
     "search": create_clusterai_tool(
         "search",
-        "Useful for searching the web for current information.",
-        lambda query, num_results: DuckDuckGoSearchRun().run(
+        TOOL_DESCRIPTIONS["search"],
+        lambda query, num_results: duckduckgo().run(
             f"{query} num_results={num_results}"
         ),
     ),
     "wikipedia": create_clusterai_tool(
         "wikipedia",
-        "Useful for querying Wikipedia for general knowledge.",
-        lambda query: WikipediaQueryRun(api_wrapper=WikipediaAPIWrapper()).run(query),
+        TOOL_DESCRIPTIONS["wikipedia"],
+        lambda query: clients.get(
+            "wikipedia",
+            lambda: WikipediaQueryRun(api_wrapper=WikipediaAPIWrapper()),
+        ).run(query),
     ),
     "arxiv": create_clusterai_tool(
         "arxiv",
-        "Useful for searching academic papers on arXiv.",
-        lambda query: ArxivQueryRun().run(query),
+        TOOL_DESCRIPTIONS["arxiv"],
+        lambda query: clients.get("arxiv", ArxivQueryRun).run(query),
     ),
     "pubmed": create_clusterai_tool(
         "pubmed",
-        "Useful for searching medical and life sciences literature.",
-        lambda query: PubmedQueryRun().run(query),
+        TOOL_DESCRIPTIONS["pubmed"],
+        lambda query: clients.get("pubmed", PubmedQueryRun).run(query),
     ),
     "scene_explain": create_clusterai_tool(
         "scene_explain",
-        "Useful for explaining the contents of an image.",
-        lambda image_url: SceneXplainTool(api_key=SCENEX_API_KEY).run(image_url),
+        TOOL_DESCRIPTIONS["scene_explain"],
+        lambda image_url: clients.get(
+            "scene_explain", lambda: SceneXplainTool(api_key=SCENEX_API_KEY)
+        ).run(image_url),
     ),
     "shell": create_clusterai_tool(
         "shell",
-        "Useful for running shell commands.",
-        lambda command: ShellTool().run(command),
+        TOOL_DESCRIPTIONS["shell"],
+        lambda command: clients.get("shell", ShellTool).run(command),
     ),
     "tavily_search": create_clusterai_tool(
         "tavily_search",
-        "Useful for performing searches using Tavily.",
+        TOOL_DESCRIPTIONS["tavily_search"],
         lambda query: json.dumps(
-            TavilySearchResults(api_key=TAVILY_API_KEY).run(query)
+            clients.get(
+                "tavily_search", lambda: TavilySearchResults(api_key=TAVILY_API_KEY)
+            ).run(query)
         ),
     ),
     "python_repl": create_clusterai_tool(
         "python_repl",
-        "Useful for executing Python code.",
+        TOOL_DESCRIPTIONS["python_repl"],
+        # a new REPL every time, a shared one would leak globals between calls
         lambda code: PythonREPL().run(code),
     ),
     "read_file": create_clusterai_tool(
         "read_file",
-        "Useful for reading the contents of a file.",
-        lambda file_path: LangchainReadFileTool().run(file_path),
+        TOOL_DESCRIPTIONS["read_file"],
+        lambda file_path: clients.get("read_file", LangchainReadFileTool).run(
+            file_path
+        ),
     ),
     "list_directory": create_clusterai_tool(
         "list_directory",
-        "Useful for listing the contents of a directory.",
-        lambda directory_path: LangchainListDirectoryTool().run(directory_path),
+        TOOL_DESCRIPTIONS["list_directory"],
+        lambda directory_path: clients.get(
+            "list_directory", LangchainListDirectoryTool
+        ).run(directory_path),
     ),
     "gpt4_vision": create_clusterai_tool(
         "gpt4_vision",
-        "Useful for analyzing images using GPT-4 Vision.",
-        lambda image_url, prompt: OpenAI(api_key=OPENAI_API_KEY)
+        TOOL_DESCRIPTIONS["gpt4_vision"],
+        lambda image_url, prompt: openai_client()
         .chat.completions.create(
             model="gpt-4o",
             messages=[
@@ -288,8 +228,8 @@ TOOLS = {
     ),
     "dalle3": create_clusterai_tool(
         "dalle3",
-        "Useful for generating images based on text prompts.",
-        lambda prompt: OpenAI(api_key=OPENAI_API_KEY)
+        TOOL_DESCRIPTIONS["dalle3"],
+        lambda prompt: openai_client()
         .images.generate(
             model="dall-e-3",
             prompt=prompt,
@@ -302,9 +242,9 @@ TOOLS = {
     ),
     "openai_embeddings": create_clusterai_tool(
         "openai_embeddings",
-        "Useful for creating text embeddings using OpenAI's API.",
+        TOOL_DESCRIPTIONS["openai_embeddings"],
         lambda text: json.dumps(
-            OpenAI(api_key=OPENAI_API_KEY)
+            openai_client()
             .embeddings.create(model="text-embedding-ada-002", input=text)
             .data[0]
             .embedding
@@ -312,12 +252,12 @@ TOOLS = {
     ),
     "browser": create_clusterai_tool(
         "browser",
-        "Useful for browsing websites and summarizing their content.",
-        lambda url: BrowserTool().run(url),
+        TOOL_DESCRIPTIONS["browser"],
+        BrowserTools.scrape_and_summarize_website,
     ),
     "instagram_search": create_clusterai_tool(
         "instagram_search",
-        "Useful for searching Instagram for images and videos.",
+        TOOL_DESCRIPTIONS["instagram_search"],
         lambda query: InstagramSearchTools.search_instagram(query),
     ),
 }
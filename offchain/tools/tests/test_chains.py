@@ -0,0 +1,77 @@
+"""
+tests for the /prompt_tools chains
+To run, execute "PYTHONPATH=src pytest tests/test_chains.py" from `tools` directory
+"""
+
+import asyncio
+
+from nexus_tools.server.controllers.chains import ChainCache, run_tool_calls
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_builds_a_chain_once_per_model_temperature_and_tools():
+    built = []
+    cache = ChainCache(build=lambda *key: built.append(key) or object())
+
+    first = cache.get("llama3.2:1b", 0.5, ["search", "wikipedia"])
+    # the order of the tools doesn't matter
+    second = cache.get("llama3.2:1b", 0.5, ["wikipedia", "search"])
+    other = cache.get("llama3.2:1b", 0.7, ["search", "wikipedia"])
+
+    assert first is second
+    assert other is not first
+    assert built == [
+        ("llama3.2:1b", 0.5, frozenset({"search", "wikipedia"})),
+        ("llama3.2:1b", 0.7, frozenset({"search", "wikipedia"})),
+    ]
+    assert cache.stats()["hits"] == 1
+
+
+def test_evicts_the_least_recently_used_chain():
+    built = []
+    cache = ChainCache(build=lambda *key: built.append(key) or object(), max_entries=2)
+
+    cache.get("a", 0.0, [])
+    cache.get("b", 0.0, [])
+    cache.get("a", 0.0, [])
+    cache.get("c", 0.0, [])
+    cache.get("a", 0.0, [])
+    cache.get("b", 0.0, [])
+
+    assert [key[0] for key in built] == ["a", "b", "c", "b"]
+    assert cache.stats()["chains"] == 2
+
+
+def test_runs_tool_calls_concurrently():
+    running = []
+    most_running = []
+
+    async def call_tool(tool_name, args):
+        running.append(tool_name)
+        most_running.append(len(running))
+        await asyncio.sleep(0.05)
+        running.remove(tool_name)
+        if tool_name == "broken":
+            raise RuntimeError("no luck")
+        return args["query"].upper()
+
+    result = run(
+        run_tool_calls(
+            [
+                {"name": "search", "args": {"query": "sui"}},
+                {"name": "broken", "args": {"query": "move"}},
+                {"name": "wikipedia", "args": {"query": "talus"}},
+            ],
+            call_tool,
+        )
+    )
+
+    assert max(most_running) == 3
+    assert result == (
+        "Tool search returned: SUI\n"
+        "Tool broken failed: no luck\n"
+        "Tool wikipedia returned: TALUS"
+    )
@@ -0,0 +1,76 @@
+"""
+tests for coalescing identical concurrent requests
+To run, execute "PYTHONPATH=src pytest tests/test_coalescer.py" from `tools` directory
+"""
+
+import asyncio
+
+import pytest
+
+from nexus_tools.server.controllers.coalescer import SingleFlight, request_key
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_identical_concurrent_requests_share_one_call():
+    calls = []
+
+    async def request(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    async def scenario():
+        flights = SingleFlight("test")
+        keys = [request_key("mistral", {"a": 1, "b": 2})] * 3 + [
+            request_key("mistral", {"b": 2, "a": 1}),
+            request_key("llama3", {"a": 1, "b": 2}),
+        ]
+        results = await asyncio.gather(
+            *[flights.run(key, lambda: request(21)) for key in keys]
+        )
+        # once landed, a request runs anew
+        await flights.run(keys[0], lambda: request(1))
+        return flights.stats(), results
+
+    stats, results = run(scenario())
+    assert results == [42] * 5
+    assert calls == [21, 21, 1]
+    assert stats["requests"] == 6
+    assert stats["coalesced"] == 3
+    assert stats["coalescing_ratio"] == pytest.approx(0.5)
+    assert stats["in_flight"] == 0
+
+
+def test_errors_reach_every_caller_and_abandoned_requests_are_cancelled():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream failed")
+
+    async def scenario():
+        flights = SingleFlight("test")
+        results = await asyncio.gather(
+            flights.run("key", fail), flights.run("key", fail), return_exceptions=True
+        )
+
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def slow():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        caller = asyncio.create_task(flights.run("slow", slow))
+        await started.wait()
+        caller.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        return results
+
+    results = run(scenario())
+    assert all(isinstance(r, ValueError) for r in results)
@@ -0,0 +1,81 @@
+"""
+benchmarks guarding the startup time and memory of the tool server and the listener
+To run, execute "PYTHONPATH=src pytest tests/test_import_time.py" from `tools` directory
+
+Every import runs in a fresh interpreter, the budgets are generous so only
+regressions like eagerly importing the tool implementations trip them.
+"""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+OFFCHAIN = Path(__file__).resolve().parents[2]
+PYTHONPATH = os.pathsep.join(
+    [str(OFFCHAIN / "tools" / "src"), str(OFFCHAIN / "events" / "src")]
+)
+
+# only the tool implementations need these
+HEAVY_MODULES = [
+    "langchain",
+    "langchain_community",
+    "langchain_experimental",
+    "google.generativeai",
+    "crewai_tools",
+    "unstructured",
+]
+
+LISTENER_BUDGET = {"seconds": 3.0, "rss_mb": 150}
+SERVER_BUDGET = {"seconds": 5.0, "rss_mb": 250}
+
+MEASURE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import {module}
+print(json.dumps({{
+    "seconds": time.perf_counter() - started,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure_import(module):
+    result = subprocess.run(
+        [sys.executable, "-c", MEASURE.format(module=module, heavy=HEAVY_MODULES)],
+        env={**os.environ, "PYTHONPATH": PYTHONPATH},
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    if "ModuleNotFoundError" in result.stderr:
+        pytest.skip(
+            f"{module} can't be imported here: {result.stderr.splitlines()[-1]}"
+        )
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def test_tool_registry_does_not_import_implementations():
+    stats = measure_import("nexus_tools.server.tools.registry")
+    assert stats["heavy"] == []
+
+
+def test_listener_startup():
+    stats = measure_import("nexus_events.sui_event")
+    print(f"listener import: {stats}")
+    assert stats["heavy"] == []
+    assert stats["seconds"] < LISTENER_BUDGET["seconds"]
+    assert stats["rss_mb"] < LISTENER_BUDGET["rss_mb"]
+
+
+def test_server_startup():
+    stats = measure_import("nexus_tools.server.main")
+    print(f"server import: {stats}")
+    assert stats["heavy"] == []
+    assert stats["seconds"] < SERVER_BUDGET["seconds"]
+    assert stats["rss_mb"] < SERVER_BUDGET["rss_mb"]
@@ -0,0 +1,555 @@
+"""
+tests for routing /predict requests across several inference backends
+To run, execute "PYTHONPATH=src pytest tests/test_inference_router.py" from `tools` directory
+
+The backends are fake Ollama and OpenAI compatible stand-ins served through
+httpx's mock transport.
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+from ollama import AsyncClient
+
+from nexus_tools.server.backends.ollama import OllamaBackend
+from nexus_tools.server.backends.openai_compatible import OpenAICompatibleBackend
+from nexus_tools.server.controllers.admission import AdmissionController, Overloaded
+from nexus_tools.server.controllers.routing import NoBackendAvailable
+from nexus_tools.server.controllers.inference import Inference
+from nexus_tools.server.controllers.scheduler import BatchScheduler
+
+
+class FakeOllama:
+    def __init__(self, models, loaded=(), delay=0.0, tokens_per_second=10.0):
+        self.models = list(models)
+        self.loaded = list(loaded)
+        self.delay = delay
+        self.tokens_per_second = tokens_per_second
+        self.down = False
+        self.chats = 0
+        self.inflight = 0
+        self.peak_inflight = 0
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        if self.down:
+            raise httpx.ConnectError("backend is down", request=request)
+
+        if request.url.path == "/api/tags":
+            return httpx.Response(200, json={"models": _models(self.models)})
+        if request.url.path == "/api/ps":
+            return httpx.Response(200, json={"models": _models(self.loaded)})
+        if request.url.path == "/api/chat":
+            body = json.loads(request.content)
+            self.chats += 1
+            self.inflight += 1
+            self.peak_inflight = max(self.peak_inflight, self.inflight)
+            try:
+                await asyncio.sleep(self.delay)
+            finally:
+                self.inflight -= 1
+            if body.get("stream"):
+                return httpx.Response(200, content=self.stream(body["model"]))
+            return httpx.Response(
+                200,
+                json={
+                    "model": body["model"],
+                    "created_at": "2024-01-01T00:00:00Z",
+                    "message": {"role": "assistant", "content": "hello"},
+                    "done": True,
+                    "eval_count": 100,
+                    "eval_duration": int(100 / self.tokens_per_second * 1e9),
+                },
+            )
+        return httpx.Response(404, json={"error": "not found"})
+
+    def stream(self, model):
+        lines = [
+            {
+                "model": model,
+                "created_at": "2024-01-01T00:00:00Z",
+                "message": {"role": "assistant", "content": word},
+                "done": False,
+            }
+            for word in ["hel", "lo ", "there"]
+        ]
+        lines.append(
+            {
+                "model": model,
+                "created_at": "2024-01-01T00:00:00Z",
+                "message": {"role": "assistant", "content": ""},
+                "done": True,
+                "eval_count": 3,
+                "eval_duration": int(3 / self.tokens_per_second * 1e9),
+            }
+        )
+        return "".join(json.dumps(line) + "\n" for line in lines).encode()
+
+
+class FakeOpenAI:
+    def __init__(self, models):
+        self.models = list(models)
+        self.chats = 0
+        self.batches = []
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/v1/models":
+            return httpx.Response(
+                200, json={"data": [{"id": name} for name in self.models]}
+            )
+        if request.url.path == "/v1/chat/completions":
+            body = json.loads(request.content)
+            self.chats += 1
+            if body.get("stream"):
+                return httpx.Response(200, content=self.stream())
+            return httpx.Response(
+                200,
+                json={
+                    "choices": [
+                        {
+                            "message": {"role": "assistant", "content": "hello"},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {"prompt_tokens": 1, "completion_tokens": 1},
+                },
+            )
+        if request.url.path == "/v1/completions":
+            body = json.loads(request.content)
+            self.batches.append(body["prompt"])
+            return httpx.Response(
+                200,
+                json={
+                    "choices": [
+                        {"index": i, "text": f"re: {prompt}", "finish_reason": "stop"}
+                        for i, prompt in reversed(list(enumerate(body["prompt"])))
+                    ]
+                },
+            )
+        return httpx.Response(404, json={"error": "not found"})
+
+    def stream(self):
+        events = [
+            {"choices": [{"delta": {"content": word}, "finish_reason": None}]}
+            for word in ["hel", "lo ", "there"]
+        ]
+        events.append({"choices": [{"delta": {}, "finish_reason": "stop"}]})
+        lines = [f"data: {json.dumps(event)}\n\n" for event in events]
+        return ("".join(lines) + "data: [DONE]\n\n").encode()
+
+
+def _models(names):
+    return [{"name": name, "model": name} for name in names]
+
+
+def inference_for(backends, **kwargs):
+    def client_factory(host):
+        return AsyncClient(
+            host=host, transport=httpx.MockTransport(backends[host].handle)
+        )
+
+    return Inference(
+        hosts=list(backends),
+        client_factory=client_factory,
+        health_interval=0,
+        **kwargs,
+    )
+
+
+def openai_backend(server, url="http://openai", models=None, batch=False):
+    return OpenAICompatibleBackend(
+        url,
+        models=models,
+        batch=batch,
+        client=httpx.AsyncClient(
+            base_url=url, transport=httpx.MockTransport(server.handle)
+        ),
+    )
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_routes_to_backend_serving_the_model():
+    backends = {
+        "http://a": FakeOllama(["llama3:latest"]),
+        "http://b": FakeOllama(["mistral:latest"]),
+    }
+
+    async def scenario():
+        inference = inference_for(backends)
+        await inference.start()
+        await inference.prompt("hi", "mistral")
+        await inference.close()
+
+    run(scenario())
+    assert backends["http://a"].chats == 0
+    assert backends["http://b"].chats == 1
+
+
+def test_prefers_backend_with_model_loaded():
+    backends = {
+        "http://a": FakeOllama(["mistral:latest"]),
+        "http://b": FakeOllama(["mistral:latest"], loaded=["mistral:latest"]),
+    }
+
+    async def scenario():
+        inference = inference_for(backends)
+        await inference.start()
+        await inference.prompt("hi", "mistral:latest")
+        await inference.close()
+
+    run(scenario())
+    assert backends["http://b"].chats == 1
+
+
+def test_spreads_concurrent_requests_by_load():
+    backends = {
+        "http://a": FakeOllama(["mistral:latest"], delay=0.05),
+        "http://b": FakeOllama(["mistral:latest"], delay=0.05),
+    }
+
+    async def scenario():
+        inference = inference_for(backends)
+        await inference.start()
+        await asyncio.gather(*[inference.prompt("hi", "mistral") for _ in range(8)])
+        await inference.close()
+
+    run(scenario())
+    assert backends["http://a"].chats == 4
+    assert backends["http://b"].chats == 4
+
+
+def test_doesnt_pile_requests_onto_the_only_measured_backend():
+    backends = {
+        "http://a": FakeOllama(["mistral:latest"], loaded=["mistral:latest"]),
+        "http://b": FakeOllama(
+            ["mistral:latest"], loaded=["mistral:latest"], delay=0.05
+        ),
+    }
+
+    async def scenario():
+        inference = inference_for(backends)
+        await inference.start()
+        # only a has generated anything, at 10 tokens per second
+        await inference.prompt("hi", "mistral")
+        backends["http://a"].delay = 0.05
+        await asyncio.gather(*[inference.prompt("hi", "mistral") for _ in range(40)])
+        await inference.close()
+
+    run(scenario())
+    assert backends["http://a"].chats == 21
+    assert backends["http://b"].chats == 20
+
+
+def test_limits_parallel_requests_per_model():
+    backends = {"http://a": FakeOllama(["mistral:latest"], delay=0.02)}
+
+    async def scenario():
+        inference = inference_for(backends, max_parallel_per_model=2)
+        await inference.start()
+        await asyncio.gather(*[inference.prompt("hi", "mistral") for _ in range(6)])
+        await inference.close()
+
+    run(scenario())
+    assert backends["http://a"].chats == 6
+    assert backends["http://a"].peak_inflight == 2
+
+
+def test_fails_over_and_ejects_unreachable_backend():
+    backends = {
+        "http://a": FakeOllama(["mistral:latest"], loaded=["mistral:latest"]),
+        "http://b": FakeOllama(["mistral:latest"]),
+    }
+
+    async def scenario():
+        inference = inference_for(backends)
+        inference.pool.max_failures = 1
+        await inference.start()
+        backends["http://a"].down = True
+        for _ in range(4):
+            await inference.prompt("hi", "mistral")
+        ejected = not inference.pool.backends[0].healthy
+        await inference.close()
+        return ejected
+
+    assert run(scenario())
+    assert backends["http://b"].chats == 4
+
+
+def test_health_check_ejects_and_recovers_backend():
+    backends = {"http://a": FakeOllama(["mistral:latest"])}
+
+    async def scenario():
+        inference = inference_for(backends)
+        inference.pool.max_failures = 1
+        inference.pool.ejection_seconds = 0.05
+        await inference.start()
+
+        backends["http://a"].down = True
+        await inference.pool.check_health()
+        with pytest.raises(NoBackendAvailable):
+            await inference.prompt("hi", "mistral")
+
+        backends["http://a"].down = False
+        await asyncio.sleep(0.06)
+        await inference.pool.check_health()
+        await inference.prompt("hi", "mistral")
+        await inference.close()
+
+    run(scenario())
+    assert backends["http://a"].chats == 1
+
+
+def test_lists_models_of_all_backends_once():
+    backends = {
+        "http://a": FakeOllama(["llama3:latest", "mistral:latest"]),
+        "http://b": FakeOllama(["mistral:latest", "phi3:latest"]),
+    }
+
+    async def scenario():
+        inference = inference_for(backends)
+        await inference.start()
+        listed = await inference.list_models()
+        await inference.close()
+        return listed
+
+    listed = run(scenario())
+    names = sorted(
+        m["name"] if isinstance(m, dict) else m.model for m in listed["models"]
+    )
+    assert names == ["llama3:latest", "mistral:latest", "phi3:latest"]
+
+
+def test_streams_completion_with_stats():
+    backends = {"http://a": FakeOllama(["mistral:latest"], tokens_per_second=30.0)}
+
+    async def scenario():
+        inference = inference_for(backends)
+        await inference.start()
+        chunks = [c async for c in inference.stream("hi", "mistral")]
+        await inference.close()
+        return chunks
+
+    chunks = run(scenario())
+    assert "".join(c["content"] for c in chunks) == "hello there"
+    assert [c["done"] for c in chunks] == [False, False, False, True]
+    assert chunks[-1]["eval_count"] == 3
+    assert chunks[-1]["tokens_per_second"] == pytest.approx(30.0)
+    assert chunks[-1]["time_to_first_token"] >= 0
+
+
+def test_batches_concurrent_requests_into_one_upstream_call():
+    vllm = FakeOpenAI(["mistral"])
+
+    async def scenario():
+        inference = Inference(
+            backends=[openai_backend(vllm, batch=True)], health_interval=0
+        )
+        await inference.start()
+        scheduler = BatchScheduler(inference, window=0.05, max_batch=4)
+        responses = await asyncio.gather(
+            *[scheduler.prompt(f"hi {i}", "mistral") for i in range(6)]
+        )
+        await inference.close()
+        return scheduler.stats(), responses
+
+    stats, responses = run(scenario())
+    # one request to the backend per batch
+    assert vllm.batches == [["hi 0", "hi 1", "hi 2", "hi 3"], ["hi 4", "hi 5"]]
+    assert vllm.chats == 0
+    assert [r["message"]["content"] for r in responses] == [
+        f"re: hi {i}" for i in range(6)
+    ]
+    assert stats["batches"] == 2
+    assert stats["max_batch_size"] == 4
+
+
+def test_doesnt_hold_back_requests_backends_cant_batch():
+    backends = {
+        "http://a": FakeOllama(["mistral:latest"], delay=0.2),
+        "http://b": FakeOllama(["mistral:latest"], delay=0.2),
+    }
+
+    async def scenario():
+        inference = inference_for(backends, max_parallel_per_model=4)
+        await inference.start()
+        scheduler = BatchScheduler(inference, window=0.05)
+        responses = await asyncio.gather(
+            *[scheduler.prompt("hi", "mistral") for _ in range(6)]
+        )
+        await inference.close()
+        return scheduler.stats(), responses
+
+    stats, responses = run(scenario())
+    assert len(responses) == 6
+    assert stats["batches"] == 0
+    assert stats["unbatched"] == 6
+    # routed one by one to the least loaded backend
+    assert sorted(b.chats for b in backends.values()) == [3, 3]
+
+
+def test_batches_only_models_of_backends_that_can_batch():
+    ollama = FakeOllama(["llama3:latest"])
+    vllm = FakeOpenAI(["mistral"])
+
+    async def scenario():
+        inference = Inference(
+            backends=[
+                OllamaBackend(
+                    "http://ollama",
+                    client=AsyncClient(
+                        host="http://ollama",
+                        transport=httpx.MockTransport(ollama.handle),
+                    ),
+                ),
+                openai_backend(vllm, models={"mistral"}, batch=True),
+            ],
+            health_interval=0,
+        )
+        await inference.start()
+        scheduler = BatchScheduler(inference, window=1.0, max_batch=2)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        batched = asyncio.gather(
+            *[scheduler.prompt(f"hi {i}", "mistral") for i in range(3)]
+        )
+        unbatched = await asyncio.gather(
+            *[scheduler.prompt("hi", "llama3") for _ in range(3)]
+        )
+        # not held back by the window of the batched model
+        unbatched_after = loop.time() - started
+        await batched
+        await inference.close()
+        return scheduler.stats(), unbatched, unbatched_after
+
+    stats, unbatched, unbatched_after = run(scenario())
+    assert len(unbatched) == 3
+    assert unbatched_after < 0.5
+    assert ollama.chats == 3
+    # the full batch went right away, the rest after the window
+    assert vllm.batches == [["hi 0", "hi 1"], ["hi 2"]]
+    assert stats["unbatched"] == 3
+    assert stats["batches"] == 2
+
+
+def test_chooses_backend_per_model_name():
+    ollama = FakeOllama(["llama3:latest", "mistral:latest"])
+    vllm = FakeOpenAI(["mistral"])
+
+    async def scenario():
+        inference = Inference(
+            backends=[
+                OllamaBackend(
+                    "http://ollama",
+                    client=AsyncClient(
+                        host="http://ollama",
+                        transport=httpx.MockTransport(ollama.handle),
+                    ),
+                ),
+                openai_backend(vllm, models={"mistral"}),
+            ],
+            health_interval=0,
+        )
+        await inference.start()
+        # the Ollama backend is slower, so mistral prefers the other one
+        inference.pool.backends[0].tokens_per_second = 1.0
+        inference.pool.backends[1].tokens_per_second = 100.0
+        mistral = await inference.prompt("hi", "mistral")
+        llama = await inference.prompt("hi", "llama3")
+        await inference.close()
+        return mistral, llama
+
+    mistral, llama = run(scenario())
+    assert mistral["message"]["content"] == "hello"
+    assert mistral["eval_count"] == 1
+    assert llama["message"]["content"] == "hello"
+    assert vllm.chats == 1
+    assert ollama.chats == 1
+
+
+def test_streams_from_openai_compatible_backend():
+    server = FakeOpenAI(["mistral"])
+
+    async def scenario():
+        inference = Inference(backends=[openai_backend(server)], health_interval=0)
+        await inference.start()
+        chunks = [c async for c in inference.stream("hi", "mistral")]
+        listed = await inference.list_models()
+        await inference.close()
+        return chunks, listed
+
+    chunks, listed = run(scenario())
+    assert "".join(c["content"] for c in chunks) == "hello there"
+    assert chunks[-1]["done"]
+    assert chunks[-1]["eval_count"] == 3
+    assert [m["name"] for m in listed["models"]] == ["mistral"]
+
+
+def test_admits_shortest_jobs_first_and_sheds_excess():
+    admitted = []
+
+    async def request(admission, max_tokens):
+        async with admission.admit("mistral", max_tokens):
+            admitted.append(max_tokens)
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        admission = AdmissionController(
+            lambda model: 1, max_queue_depth=3, max_queue_time=1.0, aging=0.0
+        )
+        tasks = [
+            asyncio.create_task(request(admission, max_tokens))
+            for max_tokens in [100, 3000, 2000, 10, 500]
+        ]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        return admission.stats()["mistral"], results
+
+    stats, results = run(scenario())
+    # the first is admitted right away, three queue up and the last is shed
+    assert isinstance(results[-1], Overloaded)
+    assert results[-1].retry_after >= 1
+    assert admitted == [100, 10, 2000, 3000]
+    assert stats["rejected"] == 1
+    assert stats["active"] == 0
+
+
+def test_sheds_requests_queued_too_long():
+    async def scenario():
+        admission = AdmissionController(lambda model: 1, max_queue_time=0.05)
+        async with admission.admit("mistral", 100):
+            with pytest.raises(Overloaded):
+                await admission.acquire("mistral", 100)
+        # the slot was released, so the next request gets in right away
+        async with admission.admit("mistral", 100):
+            pass
+        return admission.stats()["mistral"]
+
+    stats = run(scenario())
+    assert stats["timed_out"] == 1
+    assert stats["queued"] == 0
+
+
+def test_predict_answers_503_without_a_backend(monkeypatch):
+    # the server imports the tool implementations and their dependencies
+    for module in ["openai", "langchain_community", "crewai_tools"]:
+        pytest.importorskip(module)
+    from fastapi.testclient import TestClient
+
+    import nexus_tools.server.main as main
+
+    class NoBackends:
+        async def prompt(self, prompt, model, max_tokens, temperature):
+            raise NoBackendAvailable(f"No backend serves {model}")
+
+    monkeypatch.setattr(main, "predictor", NoBackends())
+
+    response = TestClient(main.app).post(
+        "/predict",
+        json={"prompt": "hi", "model": "mistral", "max_tokens": 10, "temperature": 0},
+    )
+
+    assert response.status_code == 503
+    assert response.json()["detail"] == "No backend serves mistral"
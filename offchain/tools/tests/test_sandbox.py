@@ -0,0 +1,131 @@
+"""
+tests for the pre-forked sandbox workers running untrusted tools
+To run, execute "PYTHONPATH=src pytest tests/test_sandbox.py" from `tools` directory
+"""
+
+import asyncio
+import os
+
+import pytest
+
+from nexus_tools.server.controllers.sandbox import (
+    SandboxError,
+    SandboxLimits,
+    SandboxPool,
+)
+
+
+def target(tool_name, args):
+    """Stands in for the real tools in the sandboxes."""
+    if tool_name == "spin":
+        while True:
+            pass
+    if tool_name == "allocate":
+        return len(bytearray(args["mb"] * 1024 * 1024))
+    if tool_name == "fail":
+        raise ValueError("bad code")
+    return os.getpid()
+
+
+def pool_with(limits, size=1):
+    return SandboxPool(size, target, limits, preload=[])
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_recycles_workers_after_max_executions():
+    async def scenario():
+        pool = pool_with(SandboxLimits(max_executions=2))
+        pids = [await pool.run("pid", {}, timeout=10) for _ in range(4)]
+        stats = pool.stats()
+        pool.close()
+        return pids, stats
+
+    pids, stats = run(scenario())
+    assert pids[0] == pids[1] != pids[2] == pids[3]
+    assert stats["recycled"] == 2
+
+
+def test_reports_errors_and_enforces_limits():
+    async def scenario():
+        pool = pool_with(SandboxLimits(cpu_seconds=1, memory_mb=512))
+        with pytest.raises(ValueError, match="bad code"):
+            await pool.run("fail", {}, timeout=10)
+        with pytest.raises(MemoryError):
+            await pool.run("allocate", {"mb": 1024}, timeout=10)
+        with pytest.raises(SandboxError, match="CPU time"):
+            await pool.run("spin", {}, timeout=10)
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.run("spin", {}, timeout=0.2)
+        # the workers that died were replaced
+        pid = await pool.run("pid", {}, timeout=10)
+        stats = pool.stats()
+        pool.close()
+        return pid, stats
+
+    pid, stats = run(scenario())
+    assert pid != os.getpid()
+    assert stats["killed"] == 2
+
+
+def test_replacing_workers_doesnt_block_the_loop():
+    async def scenario():
+        pool = pool_with(SandboxLimits())
+        await pool.run("pid", {}, timeout=10)
+
+        gaps = []
+
+        async def tick():
+            loop = asyncio.get_running_loop()
+            last = loop.time()
+            while True:
+                await asyncio.sleep(0.01)
+                gaps.append(loop.time() - last)
+                last = loop.time()
+
+        ticker = asyncio.create_task(tick())
+        for _ in range(3):
+            with pytest.raises(asyncio.TimeoutError):
+                await pool.run("spin", {}, timeout=0.1)
+        pid = await pool.run("pid", {}, timeout=10)
+        ticker.cancel()
+        pool.close()
+        return pid, max(gaps)
+
+    pid, longest_gap = run(scenario())
+    assert pid != os.getpid()
+    assert longest_gap < 0.2
+
+
+def test_memory_limit_is_on_top_of_the_preloaded_modules():
+    async def scenario():
+        pool = SandboxPool(
+            1, target, SandboxLimits(memory_mb=256), preload=["asyncio", "sqlite3"]
+        )
+        allocated = await pool.run("allocate", {"mb": 128}, timeout=10)
+        with pytest.raises(MemoryError):
+            await pool.run("allocate", {"mb": 512}, timeout=10)
+        pool.close()
+        return allocated
+
+    assert run(scenario()) == 128 * 1024 * 1024
+
+
+def test_runs_real_tools_with_the_real_preload():
+    # the tools' own dependencies
+    for module in ["langchain_community", "langchain_experimental", "crewai_tools"]:
+        pytest.importorskip(module)
+    from nexus_tools.server.controllers.sandbox import PRELOAD
+    from nexus_tools.server.controllers.tool_executor import run_tool
+
+    assert PRELOAD == ["nexus_tools.server.tools.tools"]
+
+    async def scenario():
+        pool = SandboxPool(1, run_tool)
+        output = await pool.run("python_repl", {"code": "print(6 * 7)"}, timeout=60)
+        pool.close()
+        return output
+
+    assert run(scenario()).strip() == "42"
@@ -0,0 +1,191 @@
+"""
+tests for the browser tool's scraper
+To run, execute "PYTHONPATH=src pytest tests/test_scraper.py" from `tools` directory
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from nexus_tools.server.tools.scraper import Scraper, TextExtractor, scrape
+
+PAGE = b"""<html><head><title>Title</title><style>p { color: red }</style></head>
+<body><nav><a href="/">Home</a></nav>
+<article><h1>Heading</h1><p>First &amp; foremost   paragraph.</p>
+<script>var ignored = 1;</script><p>Second<br>line</p></article>
+<footer>Copyright</footer></body></html>"""
+
+
+class Handler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        Handler.requests.append(self.path)
+        if self.path == "/large":
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.end_headers()
+            try:
+                self.wfile.write(b"<html><body>")
+                for _ in range(1000):
+                    self.wfile.write(b"<p>" + b"word " * 200 + b"</p>")
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            return
+        if self.path == "/truncated":
+            body = "<p>Café".encode()[:-1]
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if self.path == "/image":
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", "4")
+            self.end_headers()
+            self.wfile.write(b"\x89PNG")
+            return
+
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(PAGE)))
+        self.send_header("ETag", '"v1"')
+        self.end_headers()
+        self.wfile.write(PAGE)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.delenv("BROWSERLESS_API_KEY", raising=False)
+    Handler.requests = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_extracts_the_main_text():
+    extractor = TextExtractor(max_chars=1000)
+    extractor.feed(PAGE.decode())
+    extractor.close()
+
+    assert (
+        extractor.text() == "Heading\n\nFirst & foremost paragraph.\n\nSecond\n\nline"
+    )
+
+
+def test_joins_words_fed_in_pieces():
+    extractor = TextExtractor(max_chars=1000)
+    for piece in ["<p>Fore", "most para", "graph</p><p>", "Next"]:
+        extractor.feed(piece)
+    extractor.close()
+
+    assert extractor.text() == "Foremost paragraph\n\nNext"
+
+
+def test_stops_at_the_character_budget():
+    extractor = TextExtractor(max_chars=20)
+    extractor.feed(PAGE.decode())
+
+    assert extractor.done
+    assert extractor.text() == "Heading\n\nFirst & foremost"
+
+
+def test_stops_downloading_once_the_text_is_there(server):
+    result = scrape(f"{server}/large", max_chars=100, max_bytes=10 * 1024 * 1024)
+
+    assert not result.get("error")
+    assert 100 <= len(result["text"]) < 200
+
+
+def test_caps_the_download(server):
+    result = scrape(f"{server}/large", max_chars=10**9, max_bytes=64 * 1024)
+
+    # a single chunk at most
+    assert len(result["text"]) <= 64 * 1024
+
+
+def test_keeps_a_character_cut_off_at_the_end(server):
+    result = scrape(f"{server}/truncated", max_chars=100, max_bytes=1024)
+
+    assert result["text"] == "Caf\ufffd"
+
+
+def test_rejects_other_content(server):
+    assert "error" in scrape(f"{server}/image", max_chars=100, max_bytes=1024)
+
+
+def test_revalidates_cached_pages(server):
+    scraper = Scraper(workers=1)
+    try:
+        first = scraper.text(f"{server}/page", 1000)
+        second = scraper.text(f"{server}/page", 1000)
+    finally:
+        scraper.close()
+
+    assert first == second
+    assert first["text"].startswith("Heading")
+    # both were requested, the second only revalidated
+    assert Handler.requests == ["/page", "/page"]
+    assert scraper._cache[f"{server}/page"]["etag"] == '"v1"'
+
+
+def test_reports_unreachable_pages():
+    scraper = Scraper(workers=1)
+    try:
+        result = scraper.text("http://127.0.0.1:1/", 1000)
+    finally:
+        scraper.close()
+
+    assert "error" in result
+
+
+def test_browser_calls_validate_as_browser_args():
+    from nexus_tools.server.tools.schema import BrowserToolArgs, ToolCallBody
+
+    body = ToolCallBody(tool_name="browser", args={"url": "https://talus.network"})
+
+    assert isinstance(body.args, BrowserToolArgs)
+
+
+def test_browser_tool_use(monkeypatch):
+    # the server imports the tool implementations and their dependencies
+    for module in ["openai", "langchain_community", "crewai_tools"]:
+        pytest.importorskip(module)
+    from fastapi.testclient import TestClient
+
+    import nexus_tools.server.tools.scraper as scraper_module
+    from nexus_tools.server.main import app
+
+    scraped = []
+
+    class FakeScraper:
+        def text(self, url, max_chars):
+            scraped.append(url)
+            return {"text": "Talus builds agents onchain."}
+
+    monkeypatch.setattr(scraper_module, "scraper", lambda: FakeScraper())
+
+    response = TestClient(app).post(
+        "/tool/use",
+        json={
+            "tool_name": "browser",
+            "args": {"url": "\n url: https://talus.network\n"},
+        },
+    )
+
+    assert response.status_code == 200
+    assert "Talus builds agents onchain." in response.json()["result"]
+    assert scraped == ["https://talus.network"]
@@ -0,0 +1,127 @@
+"""
+tests for caching the results of external knowledge tools
+To run, execute "PYTHONPATH=src pytest tests/test_tool_cache.py" from `tools` directory
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from nexus_tools.server.tools.cache import CachePolicy, ToolCache
+
+
+def test_normalizes_queries_and_survives_restarts(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    cache = ToolCache(path)
+    cache.put("wikipedia", {"query": "Alan  Turing "}, "a mathematician")
+
+    assert cache.get("wikipedia", {"query": "alan turing"}) == (
+        True,
+        "a mathematician",
+    )
+    assert cache.get("arxiv", {"query": "alan turing"}) == (False, None)
+    cache.close()
+
+    # a new process only has the file
+    cache = ToolCache(path)
+    assert cache.get("wikipedia", {"query": "ALAN TURING"}) == (
+        True,
+        "a mathematician",
+    )
+    stats = cache.stats()
+    assert stats["wikipedia"]["disk_hits"] == 1
+    assert stats["arxiv"]["misses"] == 0
+    cache.close()
+
+
+def test_expires_and_caps_results(tmp_path):
+    cache = ToolCache(
+        tmp_path / "cache.sqlite",
+        policies={
+            "search": CachePolicy(ttl=-1),
+            "arxiv": CachePolicy(max_entries=2),
+        },
+    )
+    cache.put("search", {"query": "news", "num_results": "3"}, "old news")
+    assert cache.get("search", {"query": "news", "num_results": "3"})[0] is False
+
+    for query in ["a", "b", "c"]:
+        cache.put("arxiv", {"query": query}, query)
+    assert cache.get("arxiv", {"query": "a"})[0] is False
+    assert cache.get("arxiv", {"query": "c"}) == (True, "c")
+    cache.close()
+
+
+def test_only_ignores_case_of_search_queries():
+    cache = ToolCache(
+        policies={"wikipedia": CachePolicy(), "browser": CachePolicy()},
+    )
+    cache.put("wikipedia", {"query": "Alan Turing"}, "a mathematician")
+    cache.put("browser", {"url": "https://example.com/Page"}, "upper")
+
+    assert cache.get("wikipedia", {"query": "alan turing"})[0] is True
+    assert cache.get("browser", {"url": "https://example.com/page"})[0] is False
+    assert cache.get("browser", {"url": " https://example.com/Page"}) == (
+        True,
+        "upper",
+    )
+
+
+def test_doesnt_cache_failures_for_long(tmp_path):
+    cache = ToolCache(
+        tmp_path / "cache.sqlite",
+        policies={
+            "arxiv": CachePolicy(),
+            "tavily_search": CachePolicy(),
+            "pubmed": CachePolicy(error_ttl=60),
+        },
+    )
+    cache.put("arxiv", {"query": "a"}, "Arxiv exception: timed out")
+    cache.put("tavily_search", {"query": "a"}, "\"HTTPError('429')\"")
+    cache.put("tavily_search", {"query": "b"}, '[{"url": "https://example.com"}]')
+    cache.put("pubmed", {"query": "a"}, "PubMed exception: timed out")
+
+    assert cache.get("arxiv", {"query": "a"})[0] is False
+    assert cache.get("tavily_search", {"query": "a"})[0] is False
+    assert cache.get("tavily_search", {"query": "b"})[0] is True
+    # kept briefly, so a failing service isn't asked again right away
+    assert cache.get("pubmed", {"query": "a"}) == (True, "PubMed exception: timed out")
+    cache.close()
+
+
+def test_refuses_side_effecting_tools():
+    with pytest.raises(ValueError):
+        ToolCache(policies={"shell": CachePolicy()})
+    assert not ToolCache().caches("python_repl")
+
+
+def test_async_access_doesnt_block_the_loop(tmp_path):
+    cache = ToolCache(tmp_path / "cache.sqlite")
+
+    async def scenario():
+        await cache.aput("wikipedia", {"query": "sui"}, "a blockchain")
+        # another thread is busy with the file
+        cache._lock.acquire()
+        threading.Timer(0.3, cache._lock.release).start()
+
+        gaps = []
+
+        async def tick():
+            last = time.monotonic()
+            while True:
+                await asyncio.sleep(0.01)
+                now = time.monotonic()
+                gaps.append(now - last)
+                last = now
+
+        ticker = asyncio.ensure_future(tick())
+        result = await cache.aget("wikipedia", {"query": "sui"})
+        ticker.cancel()
+        return result, gaps
+
+    result, gaps = asyncio.run(scenario())
+    assert result == (True, "a blockchain")
+    assert max(gaps) < 0.2
+    cache.close()
@@ -0,0 +1,46 @@
+"""
+tests for the clients shared by the tools
+To run, execute "PYTHONPATH=src pytest tests/test_tool_clients.py" from `tools` directory
+"""
+
+import threading
+import time
+
+from nexus_tools.server.tools.clients import ClientRegistry
+
+
+def test_builds_each_client_once_across_threads():
+    registry = ClientRegistry()
+    built = []
+
+    def factory():
+        time.sleep(0.01)
+        built.append(object())
+        return built[-1]
+
+    got = []
+    threads = [
+        threading.Thread(target=lambda: got.append(registry.get("search", factory)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(built) == 1
+    assert all(client is built[0] for client in got)
+
+
+def test_closes_clients_in_reverse_order():
+    registry = ClientRegistry()
+    closed = []
+    registry.get("first", lambda: "first", close=closed.append)
+    registry.get("second", lambda: "second", close=closed.append)
+    session = registry.session()
+    assert registry.session() is session
+
+    registry.close()
+    assert closed == ["second", "first"]
+    # clients are built anew after a teardown
+    assert registry.get("first", lambda: "again") == "again"
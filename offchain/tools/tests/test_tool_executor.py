@@ -0,0 +1,124 @@
+"""
+tests for running tools off the event loop with per tool limits and timeouts
+To run, execute "PYTHONPATH=src pytest tests/test_tool_executor.py" from `tools` directory
+"""
+
+import asyncio
+import os
+import time
+
+import pytest
+
+from nexus_tools.server.controllers.tool_executor import (
+    PROCESS,
+    ToolExecutor,
+    ToolLimits,
+    ToolTimeout,
+)
+
+
+class SlowTool:
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.calls = 0
+
+    def _run(self, **kwargs):
+        self.calls += 1
+        time.sleep(self.seconds)
+        return f"slept {self.seconds}s"
+
+
+def run_in_process(tool_name, args):
+    """Stands in for the real tools in the worker processes."""
+    time.sleep(args["seconds"])
+    return os.getpid()
+
+
+def executor_for(tools, limits):
+    return ToolExecutor(
+        tools, limits=limits, default_limits=ToolLimits(), process_target=run_in_process
+    )
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_thread_tool_does_not_block_the_loop():
+    tools = {"search": SlowTool(0.2)}
+
+    async def scenario():
+        executor = executor_for(tools, {"search": ToolLimits(max_concurrency=4)})
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        results = await asyncio.gather(*[executor.run("search", {}) for _ in range(4)])
+        ticker.cancel()
+        await executor.close()
+        return ticks, results
+
+    ticks, results = run(scenario())
+    assert results == ["slept 0.2s"] * 4
+    # the four calls ran in parallel, and the loop kept ticking meanwhile
+    assert 10 <= ticks < 35
+
+
+def test_limits_concurrency_and_times_out_waiting_calls():
+    tools = {"search": SlowTool(0.2)}
+
+    async def scenario():
+        executor = executor_for(
+            tools, {"search": ToolLimits(max_concurrency=1, timeout=0.3)}
+        )
+        results = await asyncio.gather(
+            *[executor.run("search", {}) for _ in range(2)], return_exceptions=True
+        )
+        await executor.close()
+        return results
+
+    results = run(scenario())
+    assert results[0] == "slept 0.2s"
+    assert isinstance(results[1], ToolTimeout)
+    assert results[1].detail()["error"] == "timeout"
+
+
+def test_releases_the_slot_if_the_thread_cant_be_started():
+    tools = {"search": SlowTool(0)}
+
+    async def scenario():
+        executor = executor_for(
+            tools, {"search": ToolLimits(max_concurrency=1, timeout=0.3)}
+        )
+        await executor.close()
+        for _ in range(2):
+            # would time out waiting for the slot the first call leaked
+            with pytest.raises(RuntimeError):
+                await executor.run("search", {})
+
+    run(scenario())
+    assert tools["search"].calls == 0
+
+
+def test_kills_process_tool_on_timeout():
+    async def scenario():
+        executor = executor_for(
+            {"python_repl": SlowTool(0)},
+            {"python_repl": ToolLimits(pool=PROCESS, max_concurrency=1, timeout=1.0)},
+        )
+        first = await executor.run("python_repl", {"seconds": 0})
+        with pytest.raises(ToolTimeout) as timeout:
+            await executor.run("python_repl", {"seconds": 30})
+        # the worker was replaced, so the tool is usable again right away
+        second = await executor.run("python_repl", {"seconds": 0})
+        await executor.close()
+        return first, timeout.value, second
+
+    first, timeout, second = run(scenario())
+    assert timeout.started
+    assert first != second